@@ -10,13 +10,20 @@ import logging
 import os
 import select
 import signal
+import socket
 import sys
 import time
 import traceback
 
+from gunicorn.autoscale import Autoscaler
 from gunicorn.errors import ConfigError, HaltServer
+from gunicorn.monitor import ListenMonitor
 from gunicorn.pidfile import Pidfile
-from gunicorn.sock import create_socket
+from gunicorn.workers.heartbeat import HeartbeatTable
+from gunicorn.workers.scoreboard import IDLE, NullScore, \
+Scoreboard, scoreboard_path
+from gunicorn.sock import can_reuse_port, create_socket, \
+create_worker_socket, switch_reuse_port
 from gunicorn import util
 
 from gunicorn import __version__, SERVER_SOFTWARE
@@ -36,6 +43,9 @@ class Arbiter(object):
     START_CTX = {}
     
     LISTENER = None
+    ACCEPT_LOCK = None
+    HEARTBEATS = None
+    SCOREBOARD = None
     WORKERS = {}    
     PIPE = []
 
@@ -60,6 +70,7 @@ class Arbiter(object):
         
         self.pidfile = None
         self.worker_age = 0
+        self.reload_age = 0
         self.reexec_pid = 0
         self.master_name = "Master"
         
@@ -93,6 +104,23 @@ class Arbiter(object):
         self.timeout = self.cfg.timeout
         self.proc_name = self.cfg.proc_name
         self.worker_class = self.cfg.worker_class
+
+        self.monitor = ListenMonitor(self.cfg.listen_queue_warning)
+        self.autoscaler = None
+        if self.cfg.max_workers and \
+                not getattr(self.worker_class, "reports_load", False):
+            self.log.warning("Autoscaling is disabled, %s workers don't "
+                "report whether they are busy." % self.worker_class.__name__)
+        elif self.cfg.max_workers:
+            self.autoscaler = Autoscaler(self.cfg.min_workers,
+                self.cfg.max_workers)
+
+        if self.cfg.accept_mutex == "lock" and util.can_share_semaphore() \
+                and not can_reuse_port(self.cfg):
+            if self.ACCEPT_LOCK is None:
+                self.ACCEPT_LOCK = util.SharedSemaphore()
+        else:
+            self.ACCEPT_LOCK = None
         
         if self.cfg.debug:
             self.log.debug("Current configuration:")
@@ -113,6 +141,17 @@ class Arbiter(object):
         self.init_signals()
         if not self.LISTENER:
             self.LISTENER = create_socket(self.cfg)
+
+        # Room for the workers of a reload, started before the old ones
+        # are stopped, and some more.
+        size = max(max(self.num_workers, self.cfg.max_workers) * 4, 64)
+        path = scoreboard_path(self.pid, self.cfg.scoreboard_dir)
+        try:
+            self.SCOREBOARD = Scoreboard(size, path)
+        except (OSError, IOError), e:
+            self.log.warning("Can't create the scoreboard at %s: %s" % (
+                path, e))
+            self.SCOREBOARD = Scoreboard(size)
         
         if self.cfg.pidfile is not None:
             self.pidfile = Pidfile(self.cfg.pidfile)
@@ -154,6 +193,7 @@ class Arbiter(object):
                 sig = self.SIG_QUEUE.pop(0) if len(self.SIG_QUEUE) else None
                 if sig is None:
                     self.sleep()
+                    self.monitor_listener()
                     self.manage_workers()
                     continue
                 
@@ -183,6 +223,7 @@ class Arbiter(object):
                 self.stop(False)
                 if self.pidfile is not None:
                     self.pidfile.unlink()
+                self.SCOREBOARD.close()
                 sys.exit(-1)
 
     def handle_chld(self, sig, frame):
@@ -275,6 +316,7 @@ class Arbiter(object):
             self.log.info("Reason: %s" % reason)
         if self.pidfile is not None:
             self.pidfile.unlink()
+        self.SCOREBOARD.close()
         sys.exit(exit_status)
         
     def sleep(self):
@@ -335,6 +377,7 @@ class Arbiter(object):
         
     def reload(self):
         old_address = self.cfg.address
+        old_reuse_port = can_reuse_port(self.cfg)
 
         # reload conf
         self.app.reload()
@@ -345,8 +388,13 @@ class Arbiter(object):
             self.LISTENER.close()
             self.LISTENER = create_socket(self.cfg)
             self.log.info("Listening at: %s" % self.LISTENER)    
+        elif old_reuse_port != can_reuse_port(self.cfg):
+            self.LISTENER = switch_reuse_port(self.LISTENER, self.cfg)
+            self.log.info("Listening at: %s" % self.LISTENER)
 
-        # spawn new workers with new app & conf
+        # spawn new workers with new app & conf, the older ones are
+        # killed first
+        self.reload_age = self.worker_age
         for i in range(self.app.cfg.workers):
             self.spawn_worker()
         
@@ -386,7 +434,10 @@ class Arbiter(object):
                     worker = self.WORKERS.pop(wpid, None)
                     if not worker:
                         continue
+                    if worker.accept_lock is not None:
+                        worker.accept_lock.recover(wpid)
                     worker.tmp.close()
+                    worker.score.close()
         except OSError, e:
             if e.errno == errno.ECHILD:
                 pass
@@ -397,40 +448,110 @@ class Arbiter(object):
         as required.
         """
         active_workers = []
+        now = time.time()
         for (pid, worker) in list(self.WORKERS.items()):
-            try:
-                stat = os.fstat(worker.tmp.fileno())
-                diff = time.time() - stat.st_ctime
-                if diff <= self.timeout:
-                    # A fully booted worker will have called notify()
-                    if stat.st_mtime < stat.st_ctime:
-                        active_workers.append(pid)
-                    continue
-            except ValueError:
+            if now - worker.tmp.last_update <= self.timeout:
+                # A fully booted worker will have called notify(),
+                # those told to quit aren't counted anymore.
+                if worker.tmp.booted and worker.alive:
+                    active_workers.append(pid)
                 continue
 
             self.log.critical("WORKER TIMEOUT (pid:%s)" % pid)
             self.kill_worker(pid, signal.SIGKILL)
 
+        if self.cfg.max_restarting:
+            self.retire_workers(active_workers)
+
+        if self.autoscaler is not None:
+            self.autoscale(active_workers)
+
         if len(self.WORKERS.keys()) < self.num_workers:
             self.spawn_workers()
 
+        # Kill the workers of an older configuration first, then the
+        # idle ones, oldest first.
         num_to_kill = len(active_workers) - self.num_workers
-        for i in range(num_to_kill, 0, -1):
-            pid, age = 0, sys.maxint
-            for (wpid, worker) in self.WORKERS.iteritems():
-                if worker.age < age:
-                    pid, age = wpid, worker.age
+        if num_to_kill <= 0:
+            return
+        def retire_order(pid):
+            worker = self.WORKERS[pid]
+            return (worker.age > self.reload_age, worker.score.state != IDLE,
+                worker.age)
+        active_workers.sort(key=retire_order)
+        for pid in active_workers[:num_to_kill]:
+            self.WORKERS[pid].alive = False
             self.kill_worker(pid, signal.SIGQUIT)
-            
+
+    def retire_workers(self, pids):
+        """\
+        Let the workers due to restart go, oldest first, while fewer
+        than ``max_restarting`` workers are exiting or booting. Those
+        let go are removed from ``pids``.
+        """
+        # Workers exiting, booting and yet to be spawned
+        restarting = max(self.num_workers, len(self.WORKERS)) - len(pids)
+        due = [pid for pid in pids if self.WORKERS[pid].tmp.retiring]
+        due.sort(key=lambda pid: self.WORKERS[pid].age)
+        for pid in due[:max(self.cfg.max_restarting - restarting, 0)]:
+            pids.remove(pid)
+            self.WORKERS[pid].alive = False
+            self.kill_worker(pid, signal.SIGQUIT)
+
+    def monitor_listener(self):
+        "Sample the listening socket and pass the numbers to the hook."
+        stats = self.monitor.sample(self.LISTENER)
+        if stats is not None:
+            self.cfg.listen_stats(self, stats)
+
+    def autoscale(self, pids):
+        """\
+        Let the autoscaler change the number of workers from how many
+        of the workers ``pids`` are busy and the length of the listen
+        queue.
+        """
+        if not self.num_workers:
+            # Workers were stopped with WINCH.
+            return
+        busy, total = 0.0, 0
+        for pid in pids:
+            load = self.WORKERS[pid].score.load()
+            if load is not None:
+                total += 1
+                busy += load
+        queued = self.monitor.stats.get("queued")
+        num_workers = self.autoscaler.update(self.num_workers, busy, total,
+            queued)
+        if num_workers != self.num_workers:
+            self.log.info("Autoscaling from %s to %s workers (busy: %.1f/%s, "
+                "queued: %s)" % (self.num_workers, num_workers, busy, total,
+                queued))
+            self.num_workers = num_workers
+
     def spawn_worker(self):
+        # Sockets of the workers are created here rather than in the
+        # workers so that they are bound with the same user as the
+        # arbiter's, which SO_REUSEPORT requires.
+        listener = self.LISTENER
+        if can_reuse_port(self.cfg):
+            try:
+                listener = create_worker_socket(self.cfg)
+            except socket.error, e:
+                self.log.error("Can't create a worker socket: %s" % e)
+                return
+
         self.worker_age += 1
-        worker = self.worker_class(self.worker_age, self.pid, self.LISTENER,
+        worker = self.worker_class(self.worker_age, self.pid, listener,
                                     self.app, self.timeout/2.0, self.cfg)
+        worker.tmp = self.heartbeat()
+        worker.score = self.SCOREBOARD.acquire() or NullScore()
+        worker.accept_lock = self.ACCEPT_LOCK
         self.cfg.pre_fork(self, worker)
         pid = os.fork()
         if pid != 0:
             self.WORKERS[pid] = worker
+            if listener is not self.LISTENER:
+                util.close(listener.sock)
             return
 
         # Process Child
@@ -456,6 +577,21 @@ class Arbiter(object):
             except:
                 pass
 
+    def heartbeat(self):
+        """\
+        Return the heartbeat of a new worker, mapping a larger table
+        when the current one is full.
+        """
+        if self.HEARTBEATS is not None:
+            heartbeat = self.HEARTBEATS.acquire()
+            if heartbeat is not None:
+                return heartbeat
+            size = self.HEARTBEATS.size * 2
+        else:
+            size = max(self.num_workers * 2, 16)
+        self.HEARTBEATS = HeartbeatTable(size)
+        return self.HEARTBEATS.acquire()
+
     def spawn_workers(self):
         """\
         Spawn new workers as needed.
@@ -489,6 +625,7 @@ class Arbiter(object):
                 try:
                     worker = self.WORKERS.pop(pid)
                     worker.tmp.close()
+                    worker.score.close()
                     self.cfg.worker_exit(self, worker)
                     return
                 except (KeyError, OSError):
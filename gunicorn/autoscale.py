@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+#
+# How many workers the arbiter should run between min_workers and
+# max_workers, from the share of workers busy with a request and the
+# connections waiting in the listen queue.
+
+import time
+
+class Autoscaler(object):
+    """\
+    Decides the number of workers each time the arbiter manages them.
+
+    Workers are added once they have all been busy, or connections have
+    been waiting, for ``UP_DELAY`` seconds and removed one at a time
+    once no more than ``LOW`` of them have been busy for ``DOWN_DELAY``
+    seconds. The gap between the thresholds and the cooldowns after
+    each change keep the number from flapping.
+    """
+
+    HIGH = 0.9
+    LOW = 0.5
+    UP_DELAY = 1.0
+    DOWN_DELAY = 30.0
+    UP_COOLDOWN = 5.0
+    DOWN_COOLDOWN = 10.0
+
+    def __init__(self, min_workers, max_workers):
+        self.min_workers = max(min_workers, 1)
+        self.max_workers = max(max_workers, self.min_workers)
+        self.high_since = None
+        self.low_since = None
+        self.changed = 0
+
+    def clamp(self, num_workers):
+        return min(max(num_workers, self.min_workers), self.max_workers)
+
+    def update(self, num_workers, busy, total, queued, now=None):
+        """\
+        Return the number of workers to run.
+
+        :attr busy: float, workers busy with a request, a worker serving
+            several at a time counts for the share of them in use
+        :attr total: int, workers whose state is known
+        :attr queued: int, connections waiting to be accepted, None if
+            unknown
+        """
+        if now is None:
+            now = time.time()
+        target = self.clamp(num_workers)
+        if target != num_workers:
+            self.changed = now
+            return target
+
+        load = 0.0
+        if total:
+            load = float(busy) / total
+        if queued or load >= self.HIGH:
+            self.low_since = None
+            if self.high_since is None:
+                self.high_since = now
+            if now - self.high_since < self.UP_DELAY or \
+                    now - self.changed < self.UP_COOLDOWN:
+                return num_workers
+            step = 1
+            if queued:
+                step = max(num_workers // 4, 1)
+            target = self.clamp(num_workers + step)
+        elif load <= self.LOW and busy < self.HIGH * (num_workers - 1):
+            # Removing a worker mustn't leave the others overloaded.
+            self.high_since = None
+            if self.low_since is None:
+                self.low_since = now
+            if now - self.low_since < self.DOWN_DELAY or \
+                    now - self.changed < self.DOWN_COOLDOWN:
+                return num_workers
+            target = self.clamp(num_workers - 1)
+        else:
+            self.high_since = self.low_since = None
+            return num_workers
+
+        if target != num_workers:
+            self.changed = now
+            self.high_since = self.low_since = None
+        return target
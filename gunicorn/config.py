@@ -197,6 +197,31 @@ def validate_string(val):
         raise TypeError("Not a string: %s" % val)
     return val.strip()
 
+def validate_list_string(val):
+    if not val:
+        return []
+    if isinstance(val, basestring):
+        val = val.split(",")
+    return [validate_string(v) for v in val if v.strip()]
+
+def validate_int_range(low, high):
+    def _validate_int_range(val):
+        val = validate_pos_int(val)
+        if val < low or val > high:
+            raise ValueError("Value must be between %s and %s: %s" % (
+                low, high, val))
+        return val
+    return _validate_int_range
+
+def validate_choice(*choices):
+    def _validate_choice(val):
+        val = validate_string(val)
+        if val not in choices:
+            raise ValueError("Value must be one of %s: %s" % (
+                ", ".join(choices), val))
+        return val
+    return _validate_choice
+
 def validate_callable(arity):
     def _validate_callable(val):
         if not callable(val):
@@ -276,6 +301,40 @@ class Backlog(Setting):
         Must be a positive integer. Generally set in the 64-2048 range.    
         """
 
+class ListenQueueWarning(Setting):
+    name = "listen_queue_warning"
+    section = "Server Socket"
+    cli = ["--listen-queue-warning"]
+    meta = "INT"
+    validator = validate_int_range(0, 100)
+    type = "int"
+    default = 50
+    desc = """\
+        Warn when the connections waiting to be accepted fill this percentage
+        of the backlog, zero to disable the warning.
+        
+        Connections wait there while all the workers are busy. The arbiter
+        also warns when the kernel drops connections because listen queues
+        are full. The numbers are passed to the ``listen_stats`` hook.
+        """
+
+class ReusePort(Setting):
+    name = "reuse_port"
+    section = "Server Socket"
+    cli = ["--reuse-port"]
+    validator = validate_bool
+    action = "store_true"
+    default = False
+    desc = """\
+        Give each worker a listening socket of its own.
+        
+        The sockets are bound to the same address with SO_REUSEPORT and the
+        kernel spreads new connections over them, instead of waking up every
+        idle worker waiting on a shared socket. A worker serves what is
+        queued on its socket before exiting. Requires a TCP address and
+        Linux 3.9 or later.
+        """
+
 class Workers(Setting):
     name = "workers"
     section = "Worker Processes"
@@ -292,6 +351,37 @@ class Workers(Setting):
         application's work load.
         """
 
+class MinWorkers(Setting):
+    name = "min_workers"
+    section = "Worker Processes"
+    cli = ["--min-workers"]
+    meta = "INT"
+    validator = validate_pos_int
+    type = "int"
+    default = 1
+    desc = """\
+        The fewest worker processes to run when autoscaling.
+        """
+
+class MaxWorkers(Setting):
+    name = "max_workers"
+    section = "Worker Processes"
+    cli = ["--max-workers"]
+    meta = "INT"
+    validator = validate_pos_int
+    type = "int"
+    default = 0
+    desc = """\
+        The most worker processes to run when autoscaling, zero to disable
+        it.
+        
+        The arbiter starts ``workers`` processes, then adds some while all
+        of them are busy with a request or connections wait in the listen
+        queue, and retires idle ones, oldest first, once the load has been
+        low for a while. TTIN and TTOU still change the number within these
+        bounds. The listen queue is only known on Linux.
+        """
+
 class WorkerClass(Setting):
     name = "worker_class"
     section = "Worker Processes"
@@ -309,6 +399,8 @@ class WorkerClass(Setting):
         A string referring to one of the following bundled classes:
         
         * ``sync``
+        * ``gthread``  - Serves requests from ``threads`` threads
+        * ``epoll``    - Multiplexes connections with epoll, Linux only
         * ``eventlet`` - Requires eventlet >= 0.9.7
         * ``gevent``   - Requires gevent >= 0.12.2 (?)
         * ``tornado``  - Requires tornado >= 0.2
@@ -319,6 +411,37 @@ class WorkerClass(Setting):
         gevent class: ``egg:gunicorn#gevent``
         """
 
+class Threads(Setting):
+    name = "threads"
+    section = "Worker Processes"
+    cli = ["--threads"]
+    meta = "INT"
+    validator = validate_pos_int
+    type = "int"
+    default = 1
+    desc = """\
+        The number of threads serving requests in each worker process.
+        
+        This setting only affects the gthread and epoll worker types. The
+        application has to be thread safe when it is greater than 1.
+        """
+
+class MaxBufferedBody(Setting):
+    name = "max_buffered_body"
+    section = "Worker Processes"
+    cli = ["--max-buffered-body"]
+    meta = "INT"
+    validator = validate_pos_int
+    type = "int"
+    default = 64 * 1024 * 1024
+    desc = """\
+        The largest request body the epoll worker receives, in bytes.
+        
+        The epoll worker holds a request body in memory until all of it
+        arrived. Requests with a larger body are answered with a 413 and
+        the connection is closed. Set to zero for no limit.
+        """
+
 class WorkerConnections(Setting):
     name = "worker_connections"
     section = "Worker Processes"
@@ -330,7 +453,27 @@ class WorkerConnections(Setting):
     desc = """\
         The maximum number of simultaneous clients.
         
-        This setting only affects the Eventlet and Gevent worker types.
+        This setting only affects the Eventlet, Gevent and gthread worker
+        types. The gthread worker counts the connections waiting for a
+        request against it.
+        """
+
+class PipelineDepth(Setting):
+    name = "pipeline_depth"
+    section = "Worker Processes"
+    cli = ["--pipeline-depth"]
+    meta = "INT"
+    validator = validate_pos_int
+    type = "int"
+    default = 16
+    desc = """\
+        The maximum number of pipelined requests whose responses are sent
+        together.
+        
+        When a client pipelines requests, the responses to those already
+        received in full are gathered and sent with a single write. This
+        setting only affects the Eventlet and Gevent worker types. Set to 0
+        or 1 to send every response on its own.
         """
 
 class MaxRequests(Setting):
@@ -352,6 +495,68 @@ class MaxRequests(Setting):
         restarts are disabled.
         """
 
+class MaxRequestsJitter(Setting):
+    name = "max_requests_jitter"
+    section = "Worker Processes"
+    cli = ["--max-requests-jitter"]
+    meta = "INT"
+    validator = validate_pos_int
+    type = "int"
+    default = 0
+    desc = """\
+        The maximum number of requests added at random to ``max_requests``
+        for each worker.
+        
+        Workers booted together then don't all reach their limit at the same
+        moment.
+        """
+
+class MaxRss(Setting):
+    name = "max_rss"
+    section = "Worker Processes"
+    cli = ["--max-rss"]
+    meta = "INT"
+    validator = validate_pos_int
+    type = "int"
+    default = 0
+    desc = """\
+        The resident memory, in megabytes, past which a worker is restarted.
+        
+        Workers check their memory between requests, on Linux only. Set to
+        zero (the default) to disable the check.
+        """
+
+class MaxLifetime(Setting):
+    name = "max_lifetime"
+    section = "Worker Processes"
+    cli = ["--max-lifetime"]
+    meta = "INT"
+    validator = validate_pos_int
+    type = "int"
+    default = 0
+    desc = """\
+        The number of seconds after which a worker is restarted.
+        
+        Set to zero (the default) to let workers run forever.
+        """
+
+class MaxRestarting(Setting):
+    name = "max_restarting"
+    section = "Worker Processes"
+    cli = ["--max-restarting"]
+    meta = "INT"
+    validator = validate_pos_int
+    type = "int"
+    default = 1
+    desc = """\
+        The maximum number of workers restarting at once because of
+        ``max_requests``, ``max_rss`` or ``max_lifetime``.
+        
+        A worker due to restart keeps serving requests until the arbiter
+        lets it go, once fewer workers than this are exiting or booting. Set
+        to zero to let workers restart as soon as they are due.
+        """
+
 class Timeout(Setting):
     name = "timeout"
     section = "Worker Processes"
@@ -383,6 +588,55 @@ class Keepalive(Setting):
         Generally set in the 1-5 seconds range.    
         """
 
+class SyncKeepalive(Setting):
+    name = "sync_keepalive"
+    section = "Worker Processes"
+    cli = ["--sync-keep-alive"]
+    validator = validate_bool
+    action = "store_true"
+    default = False
+    desc = """\
+        Serve several requests per connection with the sync worker.
+        
+        Only turn this on behind a proxy that buffers requests and responses
+        and reuses its connections to the backend. A connection is closed
+        once it has been idle for ``keepalive`` seconds, or as soon as it
+        is idle while other clients are waiting to be accepted.
+        """
+
+class AcceptMutex(Setting):
+    name = "accept_mutex"
+    section = "Worker Processes"
+    cli = ["--accept-mutex"]
+    meta = "STRING"
+    validator = validate_choice("off", "epoll", "lock")
+    default = "off"
+    desc = """\
+        How idle sync workers take turns waiting for new connections.
+        
+        With ``off`` every idle worker waits on the listening socket and all
+        of them wake up for each connection. With ``epoll`` the socket is
+        registered with EPOLLEXCLUSIVE and the kernel only wakes up one
+        worker, this requires Linux 4.5 or later. With ``lock`` the workers
+        wait in turn on a semaphore shared by them, which works with Unix
+        sockets and older kernels. Unneeded with ``reuse_port``.
+        """
+
+class KeepaliveRequests(Setting):
+    name = "keepalive_requests"
+    section = "Worker Processes"
+    cli = ["--keep-alive-requests"]
+    meta = "INT"
+    validator = validate_pos_int
+    type = "int"
+    default = 100
+    desc = """\
+        The maximum number of requests served over one Keep-Alive connection
+        by the sync worker.
+        
+        Set to zero to serve any number of requests per connection.
+        """
+
 class Debug(Setting):
     name = "debug"
     section = "Debugging"
@@ -510,13 +764,117 @@ class TmpUploadDir(Setting):
     desc = """\
         Directory to store temporary request data as they are read.
         
-        This may disappear in the near future.
+        Request bodies larger than ``upload_spool_size`` are written here.
+        A tmpfs mount is a good choice.
         
         This path should be writable by the process permissions set for Gunicorn
         workers. If not specified, Gunicorn will choose a system generated
         temporary directory.
         """
 
+class ScoreboardDir(Setting):
+    name = "scoreboard_dir"
+    section = "Server Mechanics"
+    cli = ["--scoreboard-dir"]
+    meta = "DIR"
+    validator = validate_string
+    default = None
+    desc = """\
+        Directory of the scoreboard file read by gunicorn-status.
+        
+        The file is named after the pid of the master and only its owner
+        can read it. Pass the same directory to gunicorn-status with
+        ``--dir``. If not specified, the system temporary directory is used,
+        a directory only writable by the user running Gunicorn is a better
+        choice.
+        """
+
+class UploadSpoolSize(Setting):
+    name = "upload_spool_size"
+    section = "Server Mechanics"
+    cli = ["--upload-spool-size"]
+    meta = "INT"
+    validator = validate_pos_int
+    type = "int"
+    default = 0
+    desc = """\
+        Read request bodies in full before calling the application.
+        
+        Bodies up to this many bytes are kept in memory, larger ones are
+        written to a temporary file in ``tmp_upload_dir``. Either way
+        ``wsgi.input`` is seekable and ``CONTENT_LENGTH`` is set, chunked
+        requests included.
+        
+        If this is set to zero (the default) the body is read from the client
+        socket as the application consumes it.
+        """
+
+class ResponseBuffer(Setting):
+    name = "response_buffer"
+    section = "Server Mechanics"
+    cli = ["--response-buffer"]
+    meta = "INT"
+    validator = validate_pos_int
+    type = "int"
+    default = 0
+    desc = """\
+        Gather the items of a response body until this many bytes are
+        buffered before sending them.
+        
+        Values between 16384 and 65536 suit applications yielding many small
+        strings, such as template engines. Applications can push what is
+        buffered out early by yielding an empty string or by calling
+        ``environ["gunicorn.flush"]()``.
+        
+        If this is set to zero (the default) every item is sent as soon as
+        it is produced.
+        """
+
+class CompressLevel(Setting):
+    name = "compress_level"
+    section = "Server Mechanics"
+    cli = ["--compress-level"]
+    meta = "INT"
+    validator = validate_int_range(0, 9)
+    type = "int"
+    default = 0
+    desc = """\
+        Compress response bodies for clients accepting gzip or deflate, at
+        this zlib level (1-9).
+        
+        Only responses whose type is listed in ``compress_types`` and that
+        are at least ``compress_min_size`` bytes long, when their length is
+        known, are compressed. Files sent through ``wsgi.file_wrapper`` are
+        replaced by an existing ``.gz`` file next to them when there is one.
+        
+        If this is set to zero (the default) responses are never compressed.
+        """
+
+class CompressMinSize(Setting):
+    name = "compress_min_size"
+    section = "Server Mechanics"
+    cli = ["--compress-min-size"]
+    meta = "INT"
+    validator = validate_pos_int
+    type = "int"
+    default = 512
+    desc = """\
+        Responses known to be shorter than this many bytes aren't compressed.
+        """
+
+class CompressTypes(Setting):
+    name = "compress_types"
+    section = "Server Mechanics"
+    cli = ["--compress-types"]
+    meta = "STRING"
+    validator = validate_list_string
+    default = ["text/html", "text/plain", "text/css", "text/xml",
+        "text/javascript", "application/javascript", "application/json",
+        "application/xml"]
+    desc = """\
+        A comma separated list of the content types to compress.
+        """
+
 class Logfile(Setting):
     name = "logfile"
     section = "Logging"
@@ -684,6 +1042,25 @@ class PostRequest(Setting):
         the Request.
         """
 
+class ListenStats(Setting):
+    name = "listen_stats"
+    section = "Server Hooks"
+    validator = validate_callable(2)
+    type = "callable"
+    def def_listen_stats(server, stats):
+        pass
+    def_listen_stats = staticmethod(def_listen_stats)
+    default = def_listen_stats
+    desc = """\
+        Called each second with the state of the listening socket.
+        
+        The callable needs to accept two instance variables for the Arbiter and
+        a dict. Its ``queued`` and ``backlog`` keys are the connections waiting
+        to be accepted and the room for them, ``overflows`` and ``drops`` the
+        connections the kernel dropped on all listening sockets since the
+        previous call. Values the platform doesn't provide are None.
+        """
+
 class WorkerExit(Setting):
     name = "worker_exit"
     section = "Server Hooks"
@@ -4,20 +4,26 @@
 # See the NOTICE for more information.
 
 import sys
-
-try:
-    from cStringIO import StringIO
-except ImportError:
-    from StringIO import StringIO
+import tempfile
 
 from gunicorn.http.errors import NoMoreData, ChunkMissingTerminator, \
 InvalidChunkSize
+from gunicorn.http.unreader import ByteBuffer
+
+SPOOL_BLOCK_SIZE = 64 * 1024
 
 class ChunkedReader(object):
+    """\
+    Decode a chunked body straight out of the unreader's buffer. Only
+    the number of bytes left in the current chunk is kept here, chunk
+    data is never copied into a buffer of our own.
+    """
     def __init__(self, req, unreader):
         self.req = req
-        self.parser = self.parse_chunked(unreader)
-        self.buf = StringIO()
+        self.unreader = unreader
+        self.left = 0
+        self.started = False
+        self.done = False
     
     def read(self, size):
         if not isinstance(size, (int, long)):
@@ -27,86 +33,140 @@ class ChunkedReader(object):
         if size == 0:
             return ""
 
-        if self.parser:
-            while self.buf.tell() < size:
-                try:
-                    self.buf.write(self.parser.next())
-                except StopIteration:
-                    self.parser = None
-                    break
+        if self.left >= size:
+            # Inside a chunk the size is known, so all of what is
+            # wanted is read with a single call to the unreader.
+            data = self.unreader.read(size)
+            if len(data) < size:
+                raise NoMoreData()
+            self.left -= size
+            return data
 
-        data = self.buf.getvalue()
-        ret, rest = data[:size], data[size:]
-        self.buf.truncate(0)
-        self.buf.write(rest)
-        return ret
-    
-    def parse_trailers(self, unreader, data):
-        buf = StringIO()
-        buf.write(data)
-        
-        idx = buf.getvalue().find("\r\n\r\n")
-        done = buf.getvalue()[:2] == "\r\n"
-        while idx < 0 and not done:
-            self.get_data(unreader, buf)
-            idx = buf.getvalue().find("\r\n\r\n")
-            done = buf.getvalue()[:2] == "\r\n"
-        if done:
-            unreader.unread(buf.getvalue()[2:])
-            return ""
-        self.req.trailers = self.req.parse_headers(buf.getvalue()[:idx])
-        unreader.unread(buf.getvalue()[idx+4:])
-
-    def parse_chunked(self, unreader):
-        (size, rest) = self.parse_chunk_size(unreader)
+        ret = []
         while size > 0:
-            while size > len(rest):
-                size -= len(rest)
-                yield rest
-                rest = unreader.read()
-                if not rest:
+            if self.started:
+                data = self.unreader.buf.data
+                for start, length in self.take_buffered(size):
+                    ret.append(str(buffer(data, start, length)))
+                    size -= length
+                if not size:
+                    break
+            if not self.left:
+                if self.done:
+                    break
+                self.parse_chunk_size()
+                continue
+            if self.left < self.unreader.mxchunk:
+                # Small reads go through the buffer, the chunk size
+                # lines that follow being read along.
+                if not self.unreader.fill():
+                    raise NoMoreData()
+                continue
+            data = self.unreader.read(min(size, self.left))
+            if not data:
+                raise NoMoreData()
+            self.left -= len(data)
+            size -= len(data)
+            ret.append(data)
+        return "".join(ret)
+
+    def readinto(self, b):
+        view = memoryview(b)
+        total, size = 0, len(view)
+        while total < size:
+            if self.started:
+                data = self.unreader.buf.data
+                for start, length in self.take_buffered(size - total):
+                    view[total:total+length] = buffer(data, start, length)
+                    total += length
+                if total == size:
+                    break
+            if not self.left:
+                if self.done:
+                    break
+                self.parse_chunk_size()
+                continue
+            if self.left < self.unreader.mxchunk:
+                if not self.unreader.fill():
                     raise NoMoreData()
-            yield rest[:size]
-            # Remove \r\n after chunk
-            rest = rest[size:]
-            while len(rest) < 2:
-                rest += unreader.read()
-            if rest[:2] != '\r\n':
-                raise ChunkMissingTerminator(rest[:2])
-            (size, rest) = self.parse_chunk_size(unreader, data=rest[2:])          
+                continue
+            end = total + min(size - total, self.left)
+            read = self.unreader.readinto(view[total:end])
+            if not read:
+                raise NoMoreData()
+            self.left -= read
+            total += read
+        return total
 
-    def parse_chunk_size(self, unreader, data=None):
-        buf = StringIO()
-        if data is not None:
-            buf.write(data)
+    def take_buffered(self, size):
+        """\
+        Decode up to ``size`` bytes of what the unreader has buffered,
+        consuming it. Return the (start, length) spans of chunk data in
+        the buffer's bytearray. Chunk size lines are parsed in place,
+        stopping where one is cut by the end of the buffer or isn't a
+        plain size, which parse_chunk_size() then takes care of.
+        """
+        buf = self.unreader.buf
+        data, pos, end = buf.data, buf.start, buf.end
+        spans = []
+        while size > 0:
+            if self.left:
+                length = min(size, self.left, end - pos)
+                if not length:
+                    break
+                spans.append((pos, length))
+                pos += length
+                size -= length
+                self.left -= length
+                continue
+            if self.done or not data.startswith("\r\n", pos, end):
+                break
+            idx = data.find("\r\n", pos + 2, end)
+            if idx < 0:
+                break
+            try:
+                chunk_size = int(str(buffer(data, pos + 2, idx - pos - 2)), 16)
+            except ValueError:
+                break
+            if chunk_size <= 0:
+                # The last chunk, and its trailers, or an invalid size
+                break
+            self.left = chunk_size
+            pos = idx + 2
+        buf.skip(pos - buf.start)
+        return spans
 
-        idx = buf.getvalue().find("\r\n")
-        while idx < 0:
-            self.get_data(unreader, buf)
-            idx = buf.getvalue().find("\r\n")
+    def parse_chunk_size(self):
+        if not self.started:
+            line = self.req.read_line(self.unreader)
+            self.started = True
+        else:
+            # The \r\n ending the previous chunk is read along with
+            # the next chunk size line.
+            line = self.req.read_line(self.unreader, 2)
+            if line[:2] != "\r\n":
+                raise ChunkMissingTerminator(line[:2])
+            line = line[2:]
 
-        data = buf.getvalue()
-        line, rest_chunk = data[:idx], data[idx+2:]
-    
         chunk_size = line.split(";", 1)[0].strip()
         try:
             chunk_size = int(chunk_size, 16)
         except ValueError:
             raise InvalidChunkSize(chunk_size)
+        if chunk_size < 0:
+            raise InvalidChunkSize(chunk_size)
 
         if chunk_size == 0:
+            self.done = True
             try:
-                self.parse_trailers(unreader, rest_chunk)
+                self.parse_trailers()
             except NoMoreData:
                 pass
-            return (0, None)
-        return (chunk_size, rest_chunk)
+        self.left = chunk_size
 
-    def get_data(self, unreader, buf):
-        data = unreader.read()
-        if not data:
-            raise NoMoreData()
-        buf.write(data)
+    def parse_trailers(self):
+        lines = self.req.read_lines(self.unreader)
+        self.req.trailers = list(self.req.fold_headers(lines))
 
 class LengthReader(object):
     def __init__(self, unreader, length):
@@ -122,26 +182,14 @@ class LengthReader(object):
             raise ValueError("Size must be positive.")
         if size == 0:
             return ""
-        
-        
-        buf = StringIO()
-        data = self.unreader.read()
-        while data:
-            buf.write(data)
-            if buf.tell() >= size:
-                break
-            data = self.unreader.read()
-        
-        buf = buf.getvalue()
-        ret, rest = buf[:size], buf[size:]
-        self.unreader.unread(rest)
-        self.length -= size
-        return ret
+
+        data = self.unreader.read(size)
+        self.length -= len(data)
+        return data
 
 class EOFReader(object):
     def __init__(self, unreader):
         self.unreader = unreader
-        self.buf = StringIO()
         self.finished = False
     
     def read(self, size):
@@ -151,34 +199,22 @@ class EOFReader(object):
             raise ValueError("Size must be positive.")
         if size == 0:
             return ""
-       
         if self.finished:
-            data = self.buf.getvalue()
-            ret, rest = data[:size], data[size:]
-            self.buf.truncate(0)
-            self.buf.write(rest)
-            return ret
-
-        data = self.unreader.read()
-        while data:
-            self.buf.write(data)
-            if self.buf.tell() > size:
-                break
-            data = self.unreader.read()
+            return ""
 
-        if not data:
+        data = self.unreader.read(size)
+        if len(data) < size:
             self.finished = True
-
-        data = self.buf.getvalue()
-        ret, rest = data[:size], data[size:]
-        self.buf.truncate(0)
-        self.buf.write(rest)
-        return ret
+        return data
 
 class Body(object):
+
+    # Size of the blocks pulled from the reader by readline()
+    BLOCK_SIZE = 8192
+
     def __init__(self, reader):
         self.reader = reader
-        self.buf = StringIO()
+        self.buf = ByteBuffer()
     
     def __iter__(self):
         return self
@@ -203,60 +239,79 @@ class Body(object):
         if size == 0:
             return ""
 
-        if size < self.buf.tell():
-            data = self.buf.getvalue()
-            ret, rest = data[:size], data[size:]
-            self.buf.truncate(0)
-            self.buf.write(rest)
-            return ret
+        # Readers only return less than asked for at the end of the
+        # body so there is no need to buffer what they return.
+        buffered = len(self.buf)
+        if not buffered:
+            return self.reader.read(size)
+        elif size <= buffered:
+            return self.buf.read(size)
+        data = self.buf.read()
+        return data + self.reader.read(size - len(data))
 
-        while size > self.buf.tell():
-            data = self.reader.read(1024)
-            if not len(data):
-                break
-            self.buf.write(data)
-
-        data = self.buf.getvalue()
-        ret, rest = data[:size], data[size:]
-        self.buf.truncate(0)
-        self.buf.write(rest)
-        return ret
+    def readinto(self, b):
+        view = memoryview(b)
+        size = self.buf.readinto(view)
+        if size == len(view):
+            return size
+        if hasattr(self.reader, "readinto"):
+            return size + self.reader.readinto(view[size:])
+        data = self.reader.read(len(view) - size)
+        view[size:size+len(data)] = data
+        return size + len(data)
     
     def readline(self, size=None):
         size = self.getsize(size)
         if size == 0:
             return ""
-       
-        line = self.buf.getvalue()
-        idx = line.find("\n")
-        if idx >= 0:
-            ret = line[:idx+1]
-            self.buf.truncate(0)
-            self.buf.write(line[idx+1:])
-            return ret
-            
-        self.buf.truncate(0)
-        ch = ""
-        buf = [line]
-        lsize = len(line)
-        while lsize < size and ch != "\n":
-            ch = self.reader.read(1)
-            if not len(ch):
-                break
-            lsize += 1
-            buf.append(ch)
-        return "".join(buf)
+
+        # Pull whole blocks from the reader and only search the
+        # part of the buffer that wasn't searched yet.
+        scanned = 0
+        while True:
+            idx = self.buf.find("\n", scanned, size)
+            if idx >= 0:
+                return self.buf.read(idx + 1)
+            if len(self.buf) >= size:
+                return self.buf.read(size)
+            scanned = len(self.buf)
+            data = self.reader.read(self.BLOCK_SIZE)
+            if not len(data):
+                return self.buf.read()
+            self.buf.write(data)
             
     def readlines(self, size=None):
         ret = []
-        data = self.read()
-        while len(data):
-            pos = data.find("\n")
-            if pos < 0:
-                ret.append(data)
-                data = ""
-            else:
-                line, data = data[:pos+1], data[pos+1:]
-                ret.append(line)
+        total = 0
+        size = self.getsize(size)
+        line = self.readline()
+        while line:
+            ret.append(line)
+            total += len(line)
+            if total >= size:
+                break
+            line = self.readline()
         return ret
 
+def spool(body, max_size, tmpdir=None):
+    """\
+    Read ``body`` to its end into a rewound, seekable file object and
+    return it along with the size of the body. Bodies larger than
+    ``max_size`` bytes are written to a temporary file in ``tmpdir``,
+    smaller ones are kept in memory.
+    """
+    tmp = tempfile.SpooledTemporaryFile(max_size=max_size,
+            prefix="wgunicorn-body-", dir=tmpdir)
+    reader = body.reader
+    if isinstance(reader, LengthReader) and reader.length > max_size:
+        # No need to go through memory first.
+        tmp.rollover()
+
+    size = 0
+    data = body.read(SPOOL_BLOCK_SIZE)
+    while data:
+        tmp.write(data)
+        size += len(data)
+        data = body.read(SPOOL_BLOCK_SIZE)
+    tmp.seek(0)
+    return tmp, size
@@ -6,25 +6,45 @@
 import re
 import urlparse
 
-try:
-    from cStringIO import StringIO
-except ImportError:
-    from StringIO import StringIO
-
 from gunicorn.http.body import ChunkedReader, LengthReader, EOFReader, Body
 from gunicorn.http.errors import InvalidHeader, InvalidHeaderName, NoMoreData, \
 InvalidRequestLine, InvalidRequestMethod, InvalidHTTPVersion
+from gunicorn.util import LRUCache
+
+HEADER_RE = re.compile("[\x00-\x1F\x7F()<>@,;:\[\]={} \t\\\\\"]")
+METHOD_RE = re.compile("[A-Z0-9$-_.]{3,20}")
+VERSION_RE = re.compile("HTTP/(\d+).(\d+)")
+
+# Number of origin-form request targets whose split is remembered.
+TARGET_CACHE_SIZE = 1024
+_targets = LRUCache(TARGET_CACHE_SIZE)
+
+def split_target(target):
+    """\
+    Split an origin-form request target (``/path?query#fragment``)
+    into its path, query and fragment. Results are cached as the same
+    targets tend to be requested over and over.
+    """
+    parts = _targets.get(target)
+    if parts is None:
+        path, query, fragment = target, "", ""
+        if "#" in path:
+            path, fragment = path.split("#", 1)
+        if "?" in path:
+            path, query = path.split("?", 1)
+        parts = (path, query, fragment)
+        _targets.set(target, parts)
+    return parts
 
 class Message(object):
     def __init__(self, unreader):
         self.unreader = unreader
         self.version = None
         self.headers = []
+        self.headers_index = {}
         self.trailers = []
         self.body = None
 
-        self.hdrre = re.compile("[\x00-\x1F\x7F()<>@,;:\[\]={} \t\\\\\"]")
-
         unused = self.parse(self.unreader)
         self.unreader.unread(unused)
         self.set_body_reader()
@@ -32,50 +52,101 @@ class Message(object):
     def parse(self):
         raise NotImplementedError()
 
+    def get_data(self, unreader, stop=False):
+        if not unreader.fill():
+            if stop:
+                raise StopIteration()
+            raise NoMoreData(unreader.buf.getvalue())
+
+    def read_line(self, unreader, start=0):
+        """\
+        Return the next line from the unreader's buffer without its
+        \r\n terminator, searching from ``start`` bytes in. Bytes that
+        were already searched are not searched again when more data
+        has to be read.
+        """
+        buf = unreader.buf
+        line = buf.readline(start)
+        while line is None:
+            # Keep a trailing \r as it may start the terminator.
+            start = max(len(buf) - 1, start)
+            self.get_data(unreader)
+            line = buf.readline(start)
+        return line
+
+    def read_lines(self, unreader):
+        "Yield lines from the unreader up to the first empty one."
+        line = self.read_line(unreader)
+        while line:
+            yield line
+            line = self.read_line(unreader)
+
+    def split_header(self, line):
+        if line.find(":") < 0:
+            raise InvalidHeader(line.strip())
+        name, value = line.split(":", 1)
+        name = name.rstrip(" \t").upper()
+        if HEADER_RE.search(name):
+            raise InvalidHeaderName(name)
+        return name.strip(), value
+
+    def fold_headers(self, lines):
+        """\
+        Turn header lines into (name, value) pairs in a single pass,
+        joining continuation lines to the value they extend. A pair
+        is yielded as soon as the following line shows it is complete.
+        """
+        name, value = None, None
+        for line in lines:
+            if name is not None:
+                if line.startswith((" ", "\t")):
+                    value.append(line + "\r\n")
+                    continue
+                yield name, ''.join(value).rstrip()
+            name, value = self.split_header(line)
+            value = [(value + "\r\n").lstrip()]
+        if name is not None:
+            yield name, ''.join(value).rstrip()
+
+    def read_headers(self, unreader):
+        """\
+        Read the header block from the unreader, filling both the
+        ordered ``headers`` list and ``headers_index`` which maps each
+        header name to its values in order of appearance.
+        """
+        for name, value in self.fold_headers(self.read_lines(unreader)):
+            self.headers.append((name, value))
+            if name in self.headers_index:
+                self.headers_index[name].append(value)
+            else:
+                self.headers_index[name] = [value]
+
     def parse_headers(self, data):
-        headers = []
-
-        # Split lines on \r\n keeping the \r\n on each line
-        lines = [line + "\r\n" for line in data.split("\r\n")]
-
-        # Parse headers into key/value pairs paying attention
-        # to continuation lines.
-        while len(lines):
-            # Parse initial header name : value pair.
-            curr = lines.pop(0)
-            if curr.find(":") < 0:
-                raise InvalidHeader(curr.strip())
-            name, value = curr.split(":", 1)
-            name = name.rstrip(" \t").upper()
-            if self.hdrre.search(name):
-                raise InvalidHeaderName(name)
-            name, value = name.strip(), [value.lstrip()]
-            
-            # Consume value continuation lines
-            while len(lines) and lines[0].startswith((" ", "\t")):
-                value.append(lines.pop(0))
-            value = ''.join(value).rstrip()
-            
-            headers.append((name, value))
-        return headers
+        return list(self.fold_headers(data.split("\r\n")))
+
+    def get_header(self, name, default=None):
+        "Return the first value of the header ``name`` (in upper case)."
+        values = self.headers_index.get(name)
+        if values is None:
+            return default
+        return values[0]
 
     def set_body_reader(self):
         chunked = False
         clength = None
-        for (name, value) in self.headers:
-            if name == "CONTENT-LENGTH":
+
+        te = self.get_header("TRANSFER-ENCODING")
+        if te is not None:
+            chunked = te.lower() == "chunked"
+        if not chunked:
+            if "CONTENT-LENGTH" in self.headers_index:
                 try:
-                    clength = int(value)
+                    clength = int(self.get_header("CONTENT-LENGTH"))
                 except ValueError:
                     clength = None
-            elif name == "TRANSFER-ENCODING":
-                chunked = value.lower() == "chunked"
-            elif name == "SEC-WEBSOCKET-KEY1":
+            elif "SEC-WEBSOCKET-KEY1" in self.headers_index:
                 clength = 8
 
-            if clength is not None or chunked:
-                break
-
         if chunked:
             self.body = Body(ChunkedReader(self, self.unreader))
         elif clength is not None:
@@ -84,22 +155,18 @@ class Message(object):
             self.body = Body(EOFReader(self.unreader))
 
     def should_close(self):
-        for (h, v) in self.headers:
-            if h == "CONNECTION":
-                v = v.lower().strip()
-                if v == "close":
-                    return True
-                elif v == "keep-alive":
-                    return False
-                break
+        conn = self.get_header("CONNECTION")
+        if conn is not None:
+            conn = conn.lower().strip()
+            if conn == "close":
+                return True
+            elif conn == "keep-alive":
+                return False
         return self.version <= (1, 0)
 
 
 class Request(Message):
     def __init__(self, unreader):
-        self.methre = re.compile("[A-Z0-9$-_.]{3,20}")
-        self.versre = re.compile("HTTP/(\d+).(\d+)")
-    
         self.method = None
         self.uri = None
         self.scheme = None
@@ -112,48 +179,14 @@ class Request(Message):
         super(Request, self).__init__(unreader)
 
 
-    def get_data(self, unreader, buf, stop=False):
-        data = unreader.read()
-        if not data:
-            if stop:
-                raise StopIteration()
-            raise NoMoreData(buf.getvalue())
-        buf.write(data)
-    
     def parse(self, unreader):
-        buf = StringIO()
-
-        self.get_data(unreader, buf, stop=True)
-        
-        # Request line
-        idx = buf.getvalue().find("\r\n")
-        while idx < 0:
-            self.get_data(unreader, buf)
-            idx = buf.getvalue().find("\r\n")
-        self.parse_request_line(buf.getvalue()[:idx])
-        rest = buf.getvalue()[idx+2:] # Skip \r\n
-        buf.truncate(0)
-        buf.write(rest)
-       
-        
-        # Headers
-        idx = buf.getvalue().find("\r\n\r\n")
-
-        done = buf.getvalue()[:2] == "\r\n"
-        while idx < 0 and not done:
-            self.get_data(unreader, buf)
-            idx = buf.getvalue().find("\r\n\r\n")
-            done = buf.getvalue()[:2] == "\r\n"
-             
-        if done:
-            self.unreader.unread(buf.getvalue()[2:])
-            return ""
-
-        self.headers = self.parse_headers(buf.getvalue()[:idx])
-
-        ret = buf.getvalue()[idx+4:]
-        buf.truncate(0)
-        return ret
+        # The head is parsed line by line in place in the unreader's
+        # buffer so that whatever follows it stays there for the body.
+        if not len(unreader.buf):
+            self.get_data(unreader, stop=True)
+        self.parse_request_line(self.read_line(unreader))
+        self.read_headers(unreader)
+        return ""
     
     def parse_request_line(self, line):
         bits = line.split(None, 2)
@@ -161,13 +194,26 @@ class Request(Message):
             raise InvalidRequestLine(line)
 
         # Method
-        if not self.methre.match(bits[0]):
+        if not METHOD_RE.match(bits[0]):
             raise InvalidRequestMethod(bits[0])
         self.method = bits[0].upper()
 
         # URI
         self.uri = bits[1]
-        parts = urlparse.urlparse(bits[1])
+        if self.uri[:1] == "/" and self.uri[:2] != "//":
+            self.scheme = ''
+            self.path, self.query, self.fragment = split_target(self.uri)
+        else:
+            self.parse_absolute_uri(self.uri)
+
+        # Version
+        match = VERSION_RE.match(bits[2])
+        if match is None:
+            raise InvalidHTTPVersion(bits[2])
+        self.version = (int(match.group(1)), int(match.group(2)))
+
+    def parse_absolute_uri(self, uri):
+        parts = urlparse.urlsplit(uri)
         self.scheme = parts.scheme or ''
         self.host = parts.netloc or None
         if parts.port is None:
@@ -179,12 +225,6 @@ class Request(Message):
         self.query = parts.query or ""
         self.fragment = parts.fragment or ""
 
-        # Version
-        match = self.versre.match(bits[2])
-        if match is None:
-            raise InvalidHTTPVersion(bits[2])
-        self.version = (int(match.group(1)), int(match.group(2)))
-
     def set_body_reader(self):
         super(Request, self).set_body_reader()
         if isinstance(self.body.reader, EOFReader):
@@ -3,6 +3,7 @@
 # This file is part of gunicorn released under the MIT license. 
 # See the NOTICE for more information.
 
+from gunicorn.http.body import LengthReader
 from gunicorn.http.message import Request
 from gunicorn.http.unreader import SocketUnreader, IterUnreader
 
@@ -35,6 +36,24 @@ class Parser(object):
             raise StopIteration()
         return self.mesg
 
+    def has_buffered_message(self):
+        """\
+        Return True when the unread part of the current message's body
+        and the whole head of the next message are already buffered, so
+        that the next message can be parsed without reading from the
+        source.
+        """
+        buf = self.unreader.buf
+        start = 0
+        if self.mesg is not None:
+            reader = self.mesg.body.reader
+            if not isinstance(reader, LengthReader):
+                return False
+            start = reader.length
+            if start > len(buf):
+                return False
+        return buf.find("\r\n\r\n", start) >= 0
+
 class RequestParser(Parser):
     def __init__(self, *args, **kwargs):
         super(RequestParser, self).__init__(Request, *args, **kwargs)
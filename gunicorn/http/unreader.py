@@ -3,23 +3,181 @@
 # This file is part of gunicorn released under the MIT license. 
 # See the NOTICE for more information.
 
-import os
-
 try:
-    from cStringIO import StringIO
-except ImportError:
-    from StringIO import StringIO
+    memoryview
+except NameError:
+    # python < 2.7
+    memoryview = None
+
+# A growable byte buffer with a read cursor. Data is appended
+# at the end and consumed from the front without copying what
+# remains. Space in front of the cursor is reclaimed lazily when
+# the buffer needs to grow.
+
+class ByteBuffer(object):
+    def __init__(self, size=8192):
+        self.data = bytearray(size)
+        self.start = 0
+        self.end = 0
+
+    def __len__(self):
+        return self.end - self.start
+
+    def reserve(self, size):
+        """\
+        Make sure at least ``size`` bytes can be written after the
+        end of the buffered data.
+        """
+        if len(self.data) - self.end >= size:
+            return
+        pending = self.end - self.start
+        if len(self.data) - pending >= size and self.start:
+            # Compact in place
+            self.data[:pending] = self.data[self.start:self.end]
+        else:
+            data = bytearray(max(len(self.data) * 2, pending + size))
+            data[:pending] = self.data[self.start:self.end]
+            self.data = data
+        self.start, self.end = 0, pending
+
+    def write(self, data):
+        size = len(data)
+        if not size:
+            return
+        self.reserve(size)
+        self.data[self.end:self.end+size] = data
+        self.end += size
+
+    def recv_from(self, sock, size):
+        """\
+        Receive up to ``size`` bytes from ``sock`` straight into the
+        buffer. Returns the number of bytes received.
+        """
+        self.reserve(size)
+        view = memoryview(self.data)[self.end:self.end+size]
+        received = sock.recv_into(view, size)
+        self.end += received
+        return received
+
+    def find(self, sub, start=0, end=None):
+        if end is None:
+            end = self.end
+        else:
+            end = min(self.start + end, self.end)
+        idx = self.data.find(sub, self.start + start, end)
+        if idx < 0:
+            return idx
+        return idx - self.start
+
+    def readline(self, start=0):
+        """\
+        Consume and return the next \r\n terminated line without its
+        terminator, or return None if no complete line is buffered.
+        The search begins ``start`` bytes into the buffer.
+        """
+        idx = self.data.find("\r\n", self.start + start, self.end)
+        if idx < 0:
+            return None
+        line = str(buffer(self.data, self.start, idx - self.start))
+        if idx + 2 == self.end:
+            self.start = self.end = 0
+        else:
+            self.start = idx + 2
+        return line
+
+    def startswith(self, prefix, start=0):
+        if len(self) - start < len(prefix):
+            return False
+        return self.find(prefix, start, start + len(prefix)) == start
+
+    def peek(self, size=None, start=0):
+        """\
+        Return ``size`` bytes from ``start`` bytes into the buffer, all
+        of them by default, without consuming them.
+        """
+        start = min(start, len(self))
+        if size is None or size > len(self) - start:
+            size = len(self) - start
+        return str(buffer(self.data, self.start + start, size))
+
+    def read(self, size=None):
+        start, end = self.start, self.end
+        if size is None or size > end - start:
+            size = end - start
+        ret = str(buffer(self.data, start, size))
+        if start + size == end:
+            self.start = self.end = 0
+        else:
+            self.start = start + size
+        return ret
+
+    def readinto(self, b):
+        """\
+        Copy buffered data into the writable buffer ``b`` and consume
+        it. Returns the number of bytes copied.
+        """
+        size = min(len(b), len(self))
+        b[:size] = buffer(self.data, self.start, size)
+        self.skip(size)
+        return size
+
+    def skip(self, size):
+        self.start += min(size, len(self))
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def unread(self, data):
+        size = len(data)
+        if not size:
+            return
+        if self.start == self.end:
+            self.clear()
+            self.write(data)
+            return
+        if self.start < size:
+            # Make room in front of the cursor.
+            pending = self.end - self.start
+            buf = bytearray(max(len(self.data), size + pending))
+            buf[size:size+pending] = self.data[self.start:self.end]
+            self.data = buf
+            self.start, self.end = size, size + pending
+        self.start -= size
+        self.data[self.start:self.start+size] = data
+
+    def getvalue(self):
+        return self.peek()
+
+    def clear(self):
+        self.start = self.end = 0
 
 # Classes that can undo reading data from
 # a given type of data source.
 
 class Unreader(object):
+
+    # Size of the chunks read from the source
+    mxchunk = 8192
+
     def __init__(self):
-        self.buf = StringIO()
-    
-    def chunk(self):
+        self.buf = ByteBuffer()
+
+    def chunk(self, size=None):
+        """\
+        Return the next chunk of data from the source. ``size`` hints
+        at how much is wanted, a source may return more or less.
+        """
         raise NotImplementedError()
-    
+
+    def fill(self):
+        """\
+        Append the next chunk of data from the source to the buffer.
+        Returns the number of bytes added, 0 meaning the source is
+        exhausted.
+        """
+        data = self.chunk()
+        self.buf.write(data)
+        return len(data)
+
     def read(self, size=None):
         if size is not None and not isinstance(size, (int, long)):
             raise TypeError("size parameter must be an int or long.")
@@ -28,46 +186,106 @@ class Unreader(object):
         if size < 0:
             size = None
 
-        self.buf.seek(0, os.SEEK_END)
-
-        if size is None and self.buf.tell():
-            ret = self.buf.getvalue()
-            self.buf.truncate(0)
-            return ret
+        if size is None and len(self.buf):
+            return self.buf.read()
         if size is None:
             return self.chunk()
 
-        while self.buf.tell() < size:
-            chunk = self.chunk()
-            if not len(chunk):
-                ret = self.buf.getvalue()
-                self.buf.truncate(0)
-                return ret
-            self.buf.write(chunk)
-        data = self.buf.getvalue()
-        self.buf.truncate(0)
-        self.buf.write(data[size:])
-        return data[:size]
-    
-    def unread(self, data):
-        self.buf.seek(0, os.SEEK_END)
+        buffered = len(self.buf)
+        if buffered >= size:
+            return self.buf.read(size)
+        # Top up with a chunk from the source that is handed out
+        # without being copied through the buffer. Reads of at least
+        # a whole chunk ask for exactly what they are short of so
+        # nothing is left over, smaller ones take a whole chunk.
+        if size >= self.mxchunk:
+            data = self.chunk(size - buffered)
+        else:
+            data = self.chunk()
+        if buffered:
+            data = self.buf.read() + data
+        if len(data) > size:
+            self.buf.write(buffer(data, size))
+            return data[:size]
+        if len(data) == size or not data:
+            return data
         self.buf.write(data)
+        while len(self.buf) < size:
+            if not self.fill():
+                break
+        return self.buf.read(size)
+
+    def readsome(self, size):
+        """\
+        Return at most ``size`` bytes. Buffered data is returned first,
+        otherwise a single chunk is read from the source and whatever
+        goes beyond ``size`` is kept in the buffer. Returns an empty
+        string once the source is exhausted.
+        """
+        data = self.buf.read(size)
+        if data:
+            return data
+        data = self.chunk()
+        if len(data) > size:
+            self.buf.write(buffer(data, size))
+            data = data[:size]
+        return data
+
+    def readinto(self, b):
+        """\
+        Copy data into the writable buffer ``b``. Buffered data is
+        used first, otherwise a single chunk is read from the source
+        and whatever doesn't fit is kept in the buffer. Returns the
+        number of bytes copied, 0 meaning the source is exhausted.
+        """
+        if len(self.buf):
+            return self.buf.readinto(b)
+        data = self.chunk()
+        size = min(len(b), len(data))
+        b[:size] = buffer(data, 0, size)
+        self.buf.write(buffer(data, size))
+        return size
+
+    def unread(self, data):
+        self.buf.unread(data)
 
 class SocketUnreader(Unreader):
     def __init__(self, sock, max_chunk=8192):
         super(SocketUnreader, self).__init__()
         self.sock = sock
         self.mxchunk = max_chunk
-    
-    def chunk(self):
-        return self.sock.recv(self.mxchunk)
+        self.use_recv_into = memoryview is not None and \
+                hasattr(sock, "recv_into")
+        # Bytes received from the socket
+        self.received = 0
+
+    def chunk(self, size=None):
+        if size is None or size > self.mxchunk:
+            size = self.mxchunk
+        data = self.sock.recv(size)
+        self.received += len(data)
+        return data
+
+    def fill(self):
+        if not self.use_recv_into:
+            return super(SocketUnreader, self).fill()
+        received = self.buf.recv_from(self.sock, self.mxchunk)
+        self.received += received
+        return received
+
+    def readinto(self, b):
+        if len(self.buf) or not self.use_recv_into:
+            return super(SocketUnreader, self).readinto(b)
+        received = self.sock.recv_into(b, len(b))
+        self.received += received
+        return received
 
 class IterUnreader(Unreader):
     def __init__(self, iterable):
         super(IterUnreader, self).__init__()
         self.iter = iter(iterable)
 
-    def chunk(self):
+    def chunk(self, size=None):
         if not self.iter:
             return ""
         try:
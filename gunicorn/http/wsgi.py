@@ -6,72 +6,201 @@
 import logging
 import os
 import re
+import stat
 import sys
 from urllib import unquote
+import zlib
 
 from gunicorn import SERVER_SOFTWARE
+from gunicorn.http.body import ChunkedReader, LengthReader, spool
 import gunicorn.util as util
 
 NORMALIZE_SPACE = re.compile(r'(?:\r\n)?[ \t]+')
 
+# Upper bound on the number of cached header name translations.
+MAX_HEADER_KEYS = 512
+
 log = logging.getLogger(__name__)
 
+class FileWrapper(object):
+    """\
+    ``wsgi.file_wrapper``, iterating over a file in blocks. Responses
+    whose file has a real descriptor are sent with sendfile(2) instead,
+    see Response.write_file().
+    """
+
+    def __init__(self, filelike, blksize=8192):
+        self.filelike = filelike
+        self.blksize = blksize
+        if hasattr(filelike, 'close'):
+            self.close = filelike.close
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        data = self.filelike.read(self.blksize)
+        if not data:
+            raise StopIteration()
+        return data
+
+_header_keys = {}
+_base_environ = (None, None)
+
+def header_key(name):
+    """\
+    Return the CGI key for the header ``name``. Translations are
+    cached, an arbitrary entry is dropped once the cache is full so
+    that clients sending many distinct names can't grow it forever.
+    """
+    key = _header_keys.get(name)
+    if key is None:
+        if len(_header_keys) >= MAX_HEADER_KEYS:
+            _header_keys.popitem()
+        key = _header_keys[name] = 'HTTP_' + name.replace('-', '_')
+    return key
+
+def base_environ(cfg):
+    """\
+    Return the environ entries that are the same for every request
+    served with ``cfg``. They are only computed once per worker, each
+    request gets a copy.
+    """
+    global _base_environ
+    if _base_environ[0] is not cfg:
+        _base_environ = (cfg, {
+            "wsgi.errors": sys.stderr,
+            "wsgi.version": (1, 0),
+            "wsgi.multithread": False,
+            "wsgi.multiprocess": (cfg.workers > 1),
+            "wsgi.run_once": False,
+            "wsgi.url_scheme": "http",
+            "wsgi.file_wrapper": FileWrapper,
+            "SERVER_SOFTWARE": SERVER_SOFTWARE,
+            "SCRIPT_NAME": os.environ.get("SCRIPT_NAME", ""),
+            "CONTENT_TYPE": "",
+            "CONTENT_LENGTH": ""
+        })
+    return _base_environ[1]
+
+# Handlers for the headers that need more than being copied into
+# the environ. They return True when the header should still be
+# added as an HTTP_ variable.
+
+def _expect(environ, state, value):
+    if value.lower() == "100-continue":
+        environ["gunicorn.socket"].send("HTTP/1.1 100 Continue\r\n\r\n")
+    return True
+
+def _forwarded_for(environ, state, value):
+    state["forward"] = value
+    return True
+
+def _forwarded_protocol(environ, state, value):
+    if value.lower() == "ssl":
+        environ["wsgi.url_scheme"] = "https"
+    return True
+
+def _forwarded_ssl(environ, state, value):
+    if value.lower() == "on":
+        environ["wsgi.url_scheme"] = "https"
+    return True
+
+def _host(environ, state, value):
+    state["server"] = value
+    return True
+
+def _script_name(environ, state, value):
+    environ["SCRIPT_NAME"] = value
+    return True
+
+def _content_type(environ, state, value):
+    environ["CONTENT_TYPE"] = value
+    return False
+
+def _content_length(environ, state, value):
+    environ["CONTENT_LENGTH"] = value
+    return False
+
+HEADER_HANDLERS = {
+    "EXPECT": _expect,
+    "X-FORWARDED-FOR": _forwarded_for,
+    "X-FORWARDED-PROTOCOL": _forwarded_protocol,
+    "X-FORWARDED-SSL": _forwarded_ssl,
+    "HOST": _host,
+    "SCRIPT_NAME": _script_name,
+    "CONTENT-TYPE": _content_type,
+    "CONTENT-LENGTH": _content_length
+}
+
+def choose_encoding(accept, available=("gzip", "deflate")):
+    """\
+    Return the coding out of ``available`` that the Accept-Encoding
+    header value ``accept`` prefers, or None if it accepts none.
+    """
+    if not accept:
+        return None
+    qvalues = {}
+    for part in accept.split(","):
+        params = part.split(";")
+        coding = params[0].strip().lower()
+        qvalue = 1.0
+        for param in params[1:]:
+            param = param.strip()
+            if param.startswith("q="):
+                try:
+                    qvalue = float(param[2:])
+                except ValueError:
+                    qvalue = 0.0
+        qvalues[coding] = qvalue
+
+    best, best_qvalue = None, 0.0
+    for coding in available:
+        qvalue = qvalues.get(coding, qvalues.get("*", 0.0))
+        if qvalue > best_qvalue:
+            best, best_qvalue = coding, qvalue
+    return best
+
+PROTOCOLS = {
+    (1, 0): "HTTP/1.0",
+    (1, 1): "HTTP/1.1"
+}
+
+def has_body(req):
+    "Whether the client sends a body with the request ``req``."
+    reader = req.body.reader
+    if isinstance(reader, ChunkedReader):
+        return True
+    return isinstance(reader, LengthReader) and reader.length > 0
+
 def create(req, sock, client, server, cfg):
-    resp = Response(req, sock)
-
-    environ = {
-        "wsgi.input": req.body,
-        "wsgi.errors": sys.stderr,
-        "wsgi.version": (1, 0),
-        "wsgi.multithread": False,
-        "wsgi.multiprocess": (cfg.workers > 1),
-        "wsgi.run_once": False,
-        "gunicorn.socket": sock,
-        "SERVER_SOFTWARE": SERVER_SOFTWARE,
-        "REQUEST_METHOD": req.method,
-        "QUERY_STRING": req.query,
-        "RAW_URI": req.uri,
-        "SERVER_PROTOCOL": "HTTP/%s" % ".".join(map(str, req.version)),
-        "CONTENT_TYPE": "",
-        "CONTENT_LENGTH": ""
-    }
-    
+    resp = Response(req, sock, cfg)
+
+    environ = base_environ(cfg).copy()
+    environ["wsgi.input"] = req.body
+    environ["gunicorn.socket"] = sock
+    environ["gunicorn.flush"] = resp.flush
+    environ["REQUEST_METHOD"] = req.method
+    environ["QUERY_STRING"] = req.query
+    environ["RAW_URI"] = req.uri
+    protocol = PROTOCOLS.get(req.version)
+    if protocol is None:
+        protocol = "HTTP/%s" % ".".join(map(str, req.version))
+    environ["SERVER_PROTOCOL"] = protocol
+
     # authors should be aware that REMOTE_HOST and REMOTE_ADDR
     # may not qualify the remote addr:
     # http://www.ietf.org/rfc/rfc3875
-    client = client or "127.0.0.1"
-    forward = client
-    url_scheme = "http"
-    script_name = os.environ.get("SCRIPT_NAME", "")
+    state = {"forward": client or "127.0.0.1", "server": server}
 
+    handlers = HEADER_HANDLERS
     for hdr_name, hdr_value in req.headers:
-        if hdr_name == "EXPECT":
-            # handle expect
-            if hdr_value.lower() == "100-continue":
-                sock.send("HTTP/1.1 100 Continue\r\n\r\n")
-        elif hdr_name == "X-FORWARDED-FOR":
-            forward = hdr_value
-        elif hdr_name == "X-FORWARDED-PROTOCOL" and hdr_value.lower() == "ssl":
-            url_scheme = "https"
-        elif hdr_name == "X-FORWARDED-SSL" and hdr_value.lower() == "on":
-            url_scheme = "https"
-        elif hdr_name == "HOST":
-            server = hdr_value
-        elif hdr_name == "SCRIPT_NAME":
-            script_name = hdr_value
-        elif hdr_name == "CONTENT-TYPE":
-            environ['CONTENT_TYPE'] = hdr_value
-            continue
-        elif hdr_name == "CONTENT-LENGTH":
-            environ['CONTENT_LENGTH'] = hdr_value
+        handler = handlers.get(hdr_name)
+        if handler is not None and not handler(environ, state, hdr_value):
             continue
-        
-        key = 'HTTP_' + hdr_name.replace('-', '_')
-        environ[key] = hdr_value
-
-    environ['wsgi.url_scheme'] = url_scheme
-        
+        environ[header_key(hdr_name)] = hdr_value
 
+    forward = state["forward"]
     if isinstance(forward, basestring):
         # we only took the last one
         # http://en.wikipedia.org/wiki/X-Forwarded-For
@@ -86,7 +215,9 @@ def create(req, sock, client, server, cfg):
     environ['REMOTE_ADDR'] = remote[0]
     environ['REMOTE_PORT'] = str(remote[1])
 
+    server = state["server"]
     if isinstance(server, basestring):
+        url_scheme = environ['wsgi.url_scheme']
         server =  server.split(":")
         if len(server) == 1:
             if url_scheme == "http":
@@ -99,24 +230,77 @@ def create(req, sock, client, server, cfg):
     environ['SERVER_PORT'] = server[1]
 
     path_info = req.path
+    script_name = environ['SCRIPT_NAME']
     if script_name:
         path_info = path_info.split(script_name, 1)[1]
     environ['PATH_INFO'] = unquote(path_info)
-    environ['SCRIPT_NAME'] = script_name
+
+    if cfg.upload_spool_size and has_body(req):
+        body, length = spool(req.body, cfg.upload_spool_size,
+                cfg.tmp_upload_dir)
+        environ['wsgi.input'] = body
+        environ['CONTENT_LENGTH'] = str(length)
 
     return resp, environ
 
+class ResponseBatch(object):
+    """\
+    Gathers the responses to pipelined requests so that they can be
+    sent with a single vectored write. Only what is written while
+    ``gather`` is set, because another request is already waiting, is
+    held back. Whatever is gathered is sent early once ``max_size``
+    bytes are waiting.
+    """
+
+    def __init__(self, sock, max_size=64 * 1024):
+        self.sock = sock
+        self.max_size = max_size
+        self.gather = False
+        self.bufs = []
+        self.size = 0
+
+    def __len__(self):
+        return len(self.bufs)
+
+    def write(self, bufs):
+        for buf in bufs:
+            self.bufs.append(buf)
+            self.size += len(buf)
+        if not self.gather or self.size >= self.max_size:
+            self.flush()
+
+    def flush(self):
+        if self.bufs:
+            bufs = self.bufs
+            self.bufs = []
+            self.size = 0
+            util.writev(self.sock, bufs)
+
 class Response(object):
 
-    def __init__(self, req, sock):
+    def __init__(self, req, sock, cfg=None):
         self.req = req
         self.sock = sock
+        self.cfg = cfg
+        self.buffer_size = 0
+        if cfg is not None:
+            self.buffer_size = cfg.response_buffer
+        self.respiter = None
+        self.frame_body = False
+        self.compressor = None
+        self.precompressed = None
+        self.batch = None
+        self.pending = []
+        self.pending_size = 0
         self.version = SERVER_SOFTWARE
         self.status = None
         self.chunked = False
         self.should_close = req.should_close()
         self.headers = []
         self.headers_sent = False
+        self.finished = False
+        # Body bytes sent, after compression
+        self.sent = 0
 
     def force_close(self):
         self.should_close = True
@@ -167,18 +351,325 @@ class Response(object):
     def send_headers(self):
         if self.headers_sent:
             return
-        tosend = self.default_headers()
-        tosend.extend(["%s: %s\r\n" % (n, v) for n, v in self.headers])
-        util.write(self.sock, "%s\r\n" % "".join(tosend))
-        self.headers_sent = True
+        self.writelines([])
 
     def write(self, arg):
-        self.send_headers()
         assert isinstance(arg, basestring), "%r is not a string." % arg
-        util.write(self.sock, arg, self.chunked)
+        if not arg:
+            # An empty string asks for what is buffered to be sent.
+            self.flush()
+        elif self.buffer_size:
+            self.pending.append(arg)
+            self.pending_size += len(arg)
+            if self.pending_size >= self.buffer_size:
+                self.flush()
+        else:
+            self.writelines([arg])
 
-    def close(self):
+    def flush(self):
+        self.writelines([])
+        if self.batch is not None:
+            self.batch.flush()
+
+    def writelines(self, items, last=False):
+        """\
+        Send ``items`` as part of the body, after the header block if it
+        wasn't sent yet and whatever write() buffered, with a single
+        vectored write. In a chunked response they make up a single
+        chunk. ``last`` also ends the body of a chunked response.
+        """
         if not self.headers_sent:
-            self.send_headers()
-        if self.chunked:
-            util.write_chunk(self.sock, "")
+            self.choose_framing()
+        if self.pending:
+            items = self.pending + list(items)
+            self.pending = []
+            self.pending_size = 0
+
+        if self.compressor is not None and (items or last):
+            items = self.compress(items, last)
+
+        bufs = []
+        if not self.headers_sent:
+            if not self.chunked and self.content_length() is None \
+                    and self.has_body():
+                # Without any framing the end of the connection is the
+                # end of the body.
+                self.should_close = True
+            tosend = self.default_headers()
+            tosend.extend(["%s: %s\r\n" % (n, v) for n, v in self.headers])
+            bufs.append("%s\r\n" % "".join(tosend))
+            self.headers_sent = True
+
+        size = 0
+        for item in items:
+            assert isinstance(item, basestring), "%r is not a string." % item
+            size += len(item)
+        if size:
+            self.sent += size
+            if self.chunked:
+                bufs.append("%X\r\n" % size)
+                bufs.extend(items)
+                bufs.append("\r\n")
+            else:
+                bufs.extend(items)
+        if last:
+            if self.chunked:
+                bufs.append("0\r\n\r\n")
+            self.finished = True
+        if self.batch is not None:
+            self.batch.write(bufs)
+        else:
+            util.writev(self.sock, bufs)
+
+    def compress(self, items, last=False):
+        """\
+        Run ``items`` through the compressor. Unless this is the end of
+        the body, what was compressed is flushed so that it can be sent
+        right away.
+        """
+        compressor = self.compressor
+        ret = [compressor.compress(item) for item in items]
+        if last:
+            ret.append(compressor.flush())
+        else:
+            ret.append(compressor.flush(zlib.Z_SYNC_FLUSH))
+        return [data for data in ret if data]
+
+    def get_header(self, name):
+        name = name.lower()
+        for hname, value in self.headers:
+            if hname.lower() == name:
+                return value
+        return None
+
+    def remove_header(self, name):
+        name = name.lower()
+        self.headers = [(n, v) for n, v in self.headers if n.lower() != name]
+
+    def add_vary(self, value):
+        vary = self.get_header("Vary")
+        if vary is None:
+            self.headers.append(("Vary", value))
+            return
+        values = [v.strip().lower() for v in vary.split(",")]
+        if "*" in values or value.lower() in values:
+            return
+        self.remove_header("Vary")
+        self.headers.append(("Vary", "%s, %s" % (vary, value)))
+
+    def content_length(self):
+        value = self.get_header("Content-Length")
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            return None
+
+    def status_code(self):
+        try:
+            return int(self.status.split(None, 1)[0])
+        except (AttributeError, ValueError):
+            return None
+
+    def has_body(self):
+        if self.req.method == "HEAD":
+            return False
+        code = self.status_code()
+        return code is not None and code >= 200 and code not in (204, 304)
+
+    def body_length(self, respiter):
+        """\
+        Return the length of the body ``respiter`` will produce if it
+        can be known before iterating over it, None otherwise.
+        """
+        if isinstance(respiter, (list, tuple)):
+            length = 0
+            for item in respiter:
+                if not isinstance(item, str):
+                    return None
+                length += len(item)
+            return length
+        elif isinstance(respiter, FileWrapper):
+            try:
+                fileno = respiter.filelike.fileno()
+                st = os.fstat(fileno)
+                if not stat.S_ISREG(st.st_mode):
+                    return None
+                return max(st.st_size - respiter.filelike.tell(), 0)
+            except (AttributeError, IOError, OSError, ValueError):
+                return None
+        return None
+
+    def set_compression(self, respiter):
+        """\
+        Compress the body when compression is configured, the content
+        type is listed, the body isn't known to be too short and the
+        client accepts gzip or deflate. A gzip client is sent the ``.gz``
+        file next to the file of a FileWrapper instead, if there is one.
+        """
+        cfg = self.cfg
+        if cfg is None or not cfg.compress_level:
+            return
+        code = self.status_code()
+        if code < 200 or code >= 300 or code == 206:
+            return
+        if self.get_header("Content-Encoding") is not None:
+            return
+        ctype = self.get_header("Content-Type")
+        if ctype is None:
+            return
+        if ctype.split(";", 1)[0].strip().lower() not in cfg.compress_types:
+            return
+        length = self.content_length()
+        if length is None:
+            length = self.body_length(respiter)
+        if length is not None and length < cfg.compress_min_size:
+            return
+
+        self.add_vary("Accept-Encoding")
+        encoding = choose_encoding(self.req.get_header("ACCEPT-ENCODING"))
+        if encoding is None:
+            return
+        if encoding == "gzip" and self.set_precompressed(respiter):
+            return
+
+        wbits = zlib.MAX_WBITS
+        if encoding == "gzip":
+            wbits |= 16
+        self.compressor = zlib.compressobj(cfg.compress_level, zlib.DEFLATED,
+                wbits)
+        self.remove_header("Content-Length")
+        self.headers.append(("Content-Encoding", encoding))
+        etag = self.get_header("ETag")
+        if etag is not None and etag.startswith('"'):
+            # The compressed body isn't byte for byte the same.
+            self.remove_header("ETag")
+            self.headers.append(("ETag", "W/" + etag))
+
+    def set_precompressed(self, respiter):
+        if not isinstance(respiter, FileWrapper):
+            return False
+        filelike = respiter.filelike
+        name = getattr(filelike, "name", None)
+        if not isinstance(name, basestring):
+            return False
+        try:
+            if filelike.tell() != 0:
+                return False
+            st = os.fstat(filelike.fileno())
+            gz = open(name + ".gz", "rb")
+        except (AttributeError, IOError, OSError, ValueError):
+            return False
+        gz_st = os.fstat(gz.fileno())
+        if gz_st.st_mtime < st.st_mtime:
+            # Stale
+            gz.close()
+            return False
+
+        self.precompressed = FileWrapper(gz, respiter.blksize)
+        self.remove_header("Content-Length")
+        self.headers.append(("Content-Encoding", "gzip"))
+        self.headers.append(("Content-Length", str(gz_st.st_size)))
+        return True
+
+    def set_framing(self, respiter):
+        """\
+        Have the framing of the body chosen for ``respiter``. Unless
+        start_response was called already this happens when the headers
+        are about to be sent, generators only call it once iterated over.
+        """
+        self.respiter = respiter
+        self.frame_body = True
+        if self.status is not None:
+            self.choose_framing()
+
+    def choose_framing(self):
+        """\
+        Set up compression, then choose how the end of the body is
+        marked when the application didn't: with a Content-Length when
+        the length of the body is known up front, with chunked encoding
+        for HTTP/1.1 clients otherwise. Either way the connection can be
+        kept open.
+        """
+        if not self.frame_body:
+            return
+        self.frame_body = False
+        if self.headers_sent or not self.has_body():
+            return
+        respiter = self.respiter
+        self.set_compression(respiter)
+        if self.chunked or self.content_length() is not None:
+            return
+
+        length = None
+        if self.compressor is None:
+            length = self.body_length(respiter)
+        if length is not None:
+            self.headers.append(("Content-Length", str(length)))
+        elif self.req.version >= (1, 1):
+            self.chunked = True
+            self.headers.append(("Transfer-Encoding", "chunked"))
+
+    def sendfile(self, respiter):
+        """\
+        Send the file of a FileWrapper with sendfile(2) from its current
+        position on. Return False when that isn't possible, if the file
+        has no descriptor or the response is chunked for instance.
+        """
+        if not util.can_sendfile() or self.chunked:
+            return False
+        if not hasattr(self.sock, "fileno") and \
+                not hasattr(self.sock, "queue_file"):
+            return False
+        if self.compressor is not None:
+            return False
+        if not isinstance(respiter, FileWrapper):
+            return False
+        try:
+            fileno = respiter.filelike.fileno()
+            offset = respiter.filelike.tell()
+            size = os.fstat(fileno).st_size
+        except (AttributeError, IOError, OSError, ValueError):
+            return False
+
+        nbytes = max(size - offset, 0)
+        clength = self.content_length()
+        if clength is not None:
+            nbytes = min(nbytes, clength)
+
+        self.flush()
+        if nbytes:
+            if hasattr(self.sock, "queue_file"):
+                # The socket sends its output itself, later on.
+                sent = self.sock.queue_file(fileno, offset, nbytes)
+            else:
+                sent = util.sendfile(self.sock, fileno, offset, nbytes)
+            respiter.filelike.seek(offset + sent)
+            self.sent += sent
+        return True
+
+    def iter_file(self, respiter):
+        """\
+        Send the file of a FileWrapper with sendfile(2) when possible,
+        otherwise yield its blocks for the caller to write.
+        """
+        if not self.headers_sent:
+            self.choose_framing()
+        if self.precompressed is not None:
+            respiter = self.precompressed
+        try:
+            if not self.sendfile(respiter):
+                for item in respiter:
+                    yield item
+        finally:
+            if self.precompressed is not None:
+                self.precompressed.close()
+
+    def write_file(self, respiter):
+        for item in self.iter_file(respiter):
+            self.write(item)
+
+    def close(self):
+        if not self.finished:
+            self.writelines([], last=True)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+#
+# The arbiter samples the accept queue of its listening socket, where
+# connections wait while all the workers are busy, and the counters of
+# connections the kernel dropped because a listen queue was full.
+
+import logging
+import time
+
+from gunicorn.sock import listen_queue
+
+def read_listen_overflows(path="/proc/net/netstat"):
+    """\
+    Return the ListenOverflows and ListenDrops counters of the kernel,
+    None if they are unknown. They count the connections dropped on
+    every listening socket of the network namespace.
+    """
+    try:
+        handle = open(path)
+    except IOError:
+        return None
+    try:
+        lines = handle.readlines()
+    finally:
+        handle.close()
+    for names, values in zip(lines[::2], lines[1::2]):
+        if not names.startswith("TcpExt:"):
+            continue
+        counters = dict(zip(names.split()[1:], values.split()[1:]))
+        try:
+            return (int(counters["ListenOverflows"]),
+                int(counters["ListenDrops"]))
+        except (KeyError, ValueError):
+            return None
+    return None
+
+class ListenMonitor(object):
+    """\
+    Samples a listening socket every ``INTERVAL`` seconds. A warning is
+    logged when the accept queue fills past ``warning`` percent of the
+    backlog, and at most every ``WARN_INTERVAL`` seconds while
+    connections overflow listen queues.
+    """
+
+    INTERVAL = 1.0
+    WARN_INTERVAL = 60.0
+    NETSTAT = "/proc/net/netstat"
+
+    def __init__(self, warning):
+        self.warning = warning
+        self.log = logging.getLogger(__name__)
+        self.stats = {}
+        self.sampled = 0
+        self.counters = read_listen_overflows(self.NETSTAT)
+        self.full = False
+        self.warned = 0
+        self.unreported = 0
+
+    def sample(self, listener, now=None):
+        """\
+        Return the numbers of ``listener`` if it's time to sample it,
+        None otherwise. They are also kept in ``stats``.
+        """
+        if now is None:
+            now = time.time()
+        if now - self.sampled < self.INTERVAL:
+            return None
+        self.sampled = now
+
+        stats = {"queued": None, "backlog": None, "overflows": None,
+            "drops": None}
+        queue = listen_queue(listener)
+        if queue is not None:
+            stats["queued"], stats["backlog"] = queue
+            self.check_queue(listener, stats["queued"], stats["backlog"])
+        counters = read_listen_overflows(self.NETSTAT)
+        if counters is not None and self.counters is not None:
+            stats["overflows"] = max(counters[0] - self.counters[0], 0)
+            stats["drops"] = max(counters[1] - self.counters[1], 0)
+            self.check_overflows(stats["overflows"], now)
+        self.counters = counters
+        self.stats = stats
+        return stats
+
+    def check_queue(self, listener, queued, backlog):
+        if not self.warning or not backlog:
+            return
+        full = queued * 100 >= backlog * self.warning
+        if full and not self.full:
+            self.log.warning("Listen queue of %s is %d%% full (%d/%d), "
+                "all workers are busy." % (listener, queued * 100 // backlog,
+                queued, backlog))
+        elif self.full and not full:
+            self.log.info("Listen queue of %s is back to %d/%d." % (
+                listener, queued, backlog))
+        self.full = full
+
+    def check_overflows(self, overflows, now):
+        self.unreported += overflows
+        if self.unreported and now - self.warned >= self.WARN_INTERVAL:
+            self.log.warning("%d connections overflowed listen queues, "
+                "consider more workers or a larger backlog." %
+                self.unreported)
+            self.warned = now
+            self.unreported = 0
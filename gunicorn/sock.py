@@ -7,6 +7,7 @@ import errno
 import logging
 import os
 import socket
+import struct
 import sys
 import time
 
@@ -14,11 +15,26 @@ from gunicorn import util
 
 log = logging.getLogger(__name__)
 
+SO_REUSEPORT = getattr(socket, "SO_REUSEPORT", None)
+if SO_REUSEPORT is None and sys.platform.startswith("linux"):
+    SO_REUSEPORT = 15
+
+TCP_INFO = getattr(socket, "TCP_INFO", None)
+if TCP_INFO is None and sys.platform.startswith("linux"):
+    TCP_INFO = 11
+
+# sock_diag(7), to query the queues of Unix sockets
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+UDIAG_SHOW_RQLEN = 0x10
+UNIX_DIAG_RQLEN = 4
+
 class BaseSocket(object):
     
-    def __init__(self, conf, fd=None):
+    def __init__(self, conf, fd=None, listen=True):
         self.conf = conf
         self.address = conf.address
+        self.listening = listen
         if fd is None:
             sock = socket.socket(self.FAMILY, socket.SOCK_STREAM)
         else:
@@ -36,7 +52,8 @@ class BaseSocket(object):
         if not bound:
             self.bind(sock)
         sock.setblocking(0)
-        sock.listen(self.conf.backlog)
+        if self.listening:
+            sock.listen(self.conf.backlog)
         return sock
         
     def bind(self, sock):
@@ -59,6 +76,8 @@ class TCPSocket(BaseSocket):
     
     def set_options(self, sock, bound=False):
         sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if can_reuse_port(self.conf):
+            sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
         return super(TCPSocket, self).set_options(sock, bound=bound)
 
 class TCP6Socket(TCPSocket):
@@ -73,13 +92,13 @@ class UnixSocket(BaseSocket):
     
     FAMILY = socket.AF_UNIX
     
-    def __init__(self, conf, fd=None):
+    def __init__(self, conf, fd=None, listen=True):
         if fd is None:
             try:
                 os.remove(conf.address)
             except OSError:
                 pass
-        super(UnixSocket, self).__init__(conf, fd=fd)
+        super(UnixSocket, self).__init__(conf, fd=fd, listen=listen)
     
     def __str__(self):
         return "unix:%s" % self.address
@@ -94,30 +113,169 @@ class UnixSocket(BaseSocket):
         super(UnixSocket, self).close()
         os.unlink(self.address)
 
+def can_reuse_port(conf):
+    """\
+    Whether workers get listeners of their own, bound to the same
+    address with SO_REUSEPORT. Only TCP sockets are load balanced by
+    the kernel.
+    """
+    return conf.reuse_port and SO_REUSEPORT is not None and \
+        isinstance(conf.address, tuple)
+
+def listen_queue(listener):
+    """\
+    Return the number of connections waiting to be accepted on
+    ``listener`` and the backlog, or None when unknown. When workers
+    listen on sockets of their own their queues are added up.
+    """
+    if not isinstance(listener.address, tuple):
+        return unix_listen_queue(listener.sock)
+    if listener.listening and TCP_INFO is not None:
+        # tcpi_unacked and tcpi_sacked hold the length of the accept
+        # queue and the backlog of listening sockets.
+        try:
+            info = listener.sock.getsockopt(socket.IPPROTO_TCP, TCP_INFO,
+                    104)
+            return struct.unpack("8B6I", info[:32])[12:14]
+        except (socket.error, struct.error):
+            pass
+    return proc_listen_queue(listener.sock.getsockname()[1],
+            listener.FAMILY, listener.conf.backlog)
+
+def proc_listen_queue(port, family, backlog):
+    """\
+    Add up the accept queues of the sockets listening on ``port`` from
+    /proc/net/tcp, where they are the rx_queue of the LISTEN entries.
+    """
+    fname = "/proc/net/tcp"
+    if family == socket.AF_INET6:
+        fname = "/proc/net/tcp6"
+    try:
+        handle = open(fname)
+    except IOError:
+        return None
+    queued, listeners = 0, 0
+    try:
+        handle.readline()
+        for line in handle:
+            fields = line.split()
+            if fields[3] != "0A" or \
+                    int(fields[1].rsplit(":", 1)[1], 16) != port:
+                continue
+            queued += int(fields[4].split(":")[1], 16)
+            listeners += 1
+    finally:
+        handle.close()
+    if not listeners:
+        return None
+    return queued, backlog * listeners
+
+def unix_listen_queue(sock):
+    """\
+    Ask the kernel for the accept queue and backlog of the Unix socket
+    ``sock`` with sock_diag, /proc/net/unix doesn't show them.
+    """
+    family = getattr(socket, "AF_NETLINK", None)
+    if family is None:
+        return None
+    try:
+        inode = os.fstat(sock.fileno()).st_ino
+        request = struct.pack("=BBHIIIII", socket.AF_UNIX, 0, 0,
+            1 << 10, inode, UDIAG_SHOW_RQLEN, 0xffffffff, 0xffffffff)
+        header = struct.pack("=IHHII", 16 + len(request),
+            SOCK_DIAG_BY_FAMILY, 1, 1, 0)
+        nl = socket.socket(family, socket.SOCK_DGRAM, NETLINK_SOCK_DIAG)
+        try:
+            nl.sendto(header + request, (0, 0))
+            data = nl.recv(8192)
+        finally:
+            nl.close()
+    except (OSError, socket.error):
+        return None
+
+    return parse_unix_diag(data)
+
+def parse_unix_diag(data):
+    """\
+    Return the accept queue and backlog from a sock_diag reply about a
+    Unix socket: a unix_diag_msg followed by attributes. None if the
+    reply is an error message, truncated or otherwise malformed.
+    """
+    if len(data) < 32:
+        return None
+    length, kind = struct.unpack("=IH", data[:6])
+    if kind != SOCK_DIAG_BY_FAMILY:
+        return None
+    end = min(length, len(data))
+    pos = 32
+    while pos + 4 <= end:
+        size, attr = struct.unpack("=HH", data[pos:pos + 4])
+        if size < 4 or pos + size > end:
+            return None
+        if attr == UNIX_DIAG_RQLEN:
+            if size < 12:
+                return None
+            return struct.unpack("=II", data[pos + 4:pos + 12])
+        pos += (size + 3) & ~3
+    return None
+
+def socket_type(addr):
+    if isinstance(addr, tuple):
+        if util.is_ipv6(addr[0]):
+            return TCP6Socket
+        return TCPSocket
+    elif isinstance(addr, basestring):
+        return UnixSocket
+    raise TypeError("Unable to create socket from: %r" % addr)
+
+def create_worker_socket(conf):
+    """\
+    Create the listener of a single worker when the port is reused.
+    It joins the sockets bound to the address so far and the kernel
+    spreads the new connections over all of them.
+    """
+    return socket_type(conf.address)(conf)
+
+def switch_reuse_port(listener, conf):
+    """\
+    Return the listener to use once ``reuse_port`` was turned on or off
+    for the same address. Running workers keep listening on the sockets
+    they were given until they exit, so the sockets for the new workers
+    are bound alongside them with SO_REUSEPORT.
+    """
+    listener.sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+    if can_reuse_port(conf):
+        # The running workers share the old listener, which now lets a
+        # socket only holding the address be bound next to it.
+        holder = socket_type(conf.address)(conf, listen=False)
+        util.close(listener.sock)
+        return holder
+    # The old listener was bound with SO_REUSEPORT, listening on it
+    # shares the connections with the running workers.
+    listener.sock.listen(conf.backlog)
+    listener.listening = True
+    return listener
+
 def create_socket(conf):
     """
     Create a new socket for the given address. If the
     address is a tuple, a TCP socket is created. If it
     is a string, a Unix socket is created. Otherwise
     a TypeError is raised.
+
+    When workers listen on sockets of their own, this one is only
+    bound to hold the address, across re-executions too, and doesn't
+    accept connections.
     """
     # get it only once
     addr = conf.address
-    
-    if isinstance(addr, tuple):
-        if util.is_ipv6(addr[0]):
-            sock_type = TCP6Socket
-        else:
-            sock_type = TCPSocket
-    elif isinstance(addr, basestring):
-        sock_type = UnixSocket
-    else:
-        raise TypeError("Unable to create socket from: %r" % addr)
+    sock_type = socket_type(addr)
+    listen = not can_reuse_port(conf)
 
     if 'GUNICORN_FD' in os.environ:
         fd = int(os.environ.pop('GUNICORN_FD'))
         try:
-            return sock_type(conf, fd=fd)
+            return sock_type(conf, fd=fd, listen=listen)
         except socket.error, e:
             if e[0] == errno.ENOTCONN:
                 log.error("GUNICORN_FD should refer to an open socket.")
@@ -130,7 +288,7 @@ def create_socket(conf):
     
     for i in range(5):
         try:
-            return sock_type(conf)
+            return sock_type(conf, listen=listen)
         except socket.error, e:
             if e[0] == errno.EADDRINUSE:
                 log.error("Connection in use: %s" % str(addr))
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+#
+# gunicorn-status prints what the workers of a running master are doing
+# from its scoreboard, without bothering the master or its workers.
+
+import optparse
+import os
+import sys
+import time
+
+from gunicorn import __version__
+from gunicorn.workers.scoreboard import STATES, read_scoreboard, \
+scoreboard_path
+
+def format_size(size):
+    for unit in ("B", "K", "M", "G"):
+        if size < 1024:
+            return "%d%s" % (size, unit)
+        size //= 1024
+    return "%dT" % size
+
+def format_duration(seconds):
+    if seconds < 1:
+        return "%dms" % (seconds * 1000)
+    if seconds < 3600:
+        return "%dm%02ds" % divmod(int(seconds), 60)
+    return "%dh%02dm" % divmod(int(seconds) // 60, 60)
+
+def render(path, now=None):
+    "Return the scoreboard at ``path`` as a table."
+    if now is None:
+        now = time.time()
+    pid, started, scores = read_scoreboard(path)
+
+    counts = dict((state, 0) for state in STATES)
+    for score in scores:
+        counts[STATES[score["state"]]] += 1
+    lines = ["master %d, up %s, %d workers: %s" % (pid,
+        format_duration(now - started), len(scores),
+        ", ".join(["%d %s" % (counts[state], state) for state in STATES[1:]
+            if counts[state]])), ""]
+
+    lines.append("%7s %-8s %9s %7s %7s %7s  %s" % ("PID", "STATE",
+        "REQUESTS", "IN", "OUT", "TIME", "REQUEST"))
+    for score in sorted(scores, key=lambda s: s["pid"]):
+        state = STATES[score["state"]]
+        duration, request = "", ""
+        if state in ("app", "writing"):
+            duration = format_duration(now - score["request_start"])
+            request = "%s %s" % (score["method"], score["path"])
+        lines.append(("%7s %-8s %9d %7s %7s %7s  %s" % (score["pid"] or "-",
+            state, score["requests"], format_size(score["bytes_in"]),
+            format_size(score["bytes_out"]), duration, request)).rstrip())
+    return "\n".join(lines)
+
+def find_scoreboard(opts, args):
+    if args:
+        pid = int(args[0])
+    elif opts.pidfile:
+        handle = open(opts.pidfile)
+        try:
+            pid = int(handle.read().strip())
+        finally:
+            handle.close()
+    else:
+        raise ValueError("A pid or a pidfile is required.")
+    return scoreboard_path(pid, opts.tmpdir)
+
+def run():
+    parser = optparse.OptionParser(usage="%prog [OPTIONS] [PID]",
+        version="%prog (version " + __version__ + ")")
+    parser.add_option("-p", "--pid", dest="pidfile", metavar="FILE",
+        help="The pidfile of the master.")
+    parser.add_option("-d", "--dir", dest="tmpdir", metavar="DIR",
+        help="Where the scoreboard is. [the temporary directory]")
+    parser.add_option("-i", "--interval", type="float", default=1.0,
+        help="Seconds between refreshes, 0 to print once. [%default]")
+    opts, args = parser.parse_args()
+
+    try:
+        path = find_scoreboard(opts, args)
+        if not os.path.exists(path):
+            raise ValueError("No scoreboard at %s." % path)
+        if not opts.interval:
+            print render(path)
+            return
+        clear = ""
+        if sys.stdout.isatty():
+            clear = "\x1b[H\x1b[2J"
+        while True:
+            sys.stdout.write("%s%s\n" % (clear, render(path)))
+            sys.stdout.flush()
+            time.sleep(opts.interval)
+            if not clear:
+                sys.stdout.write("\n")
+    except KeyboardInterrupt:
+        pass
+    except (IOError, ValueError), e:
+        sys.stderr.write("%s\n" % e)
+        sys.exit(1)
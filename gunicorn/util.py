@@ -4,11 +4,15 @@
 # See the NOTICE for more information.
 
 
+import _socket
 import ctypes
+import errno
 import fcntl
+import mmap
 import os
 import pkg_resources
 import resource
+import select
 import socket
 import sys
 import textwrap
@@ -27,6 +31,54 @@ CHUNK_SIZE = (16 * 1024)
 
 MAX_BODY = 1024 * 132
 
+# Most buffers handed to a single writev(2)
+IOV_MAX = 1024
+
+class iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_char_p),
+                ("iov_len", ctypes.c_size_t)]
+
+try:
+    _libc = ctypes.CDLL(None, use_errno=True)
+    _writev = _libc.writev
+    _writev.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+    _writev.restype = getattr(ctypes, "c_ssize_t", ctypes.c_long)
+except (AttributeError, OSError, TypeError):
+    _writev = None
+
+_sendfile = None
+if sys.platform.startswith("linux"):
+    try:
+        if hasattr(_libc, "sendfile64"):
+            _sendfile = _libc.sendfile64
+            _sendfile.argtypes = [ctypes.c_int, ctypes.c_int,
+                    ctypes.POINTER(ctypes.c_longlong), ctypes.c_size_t]
+        else:
+            _sendfile = _libc.sendfile
+            _sendfile.argtypes = [ctypes.c_int, ctypes.c_int,
+                    ctypes.POINTER(ctypes.c_long), ctypes.c_size_t]
+        _sendfile.restype = getattr(ctypes, "c_ssize_t", ctypes.c_long)
+    except (AttributeError, NameError):
+        _sendfile = None
+
+class timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long),
+                ("tv_nsec", ctypes.c_long)]
+
+try:
+    _sem_init = _libc.sem_init
+    _sem_init.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_uint]
+    _sem_timedwait = _libc.sem_timedwait
+    _sem_timedwait.argtypes = [ctypes.c_void_p, ctypes.POINTER(timespec)]
+    _sem_post = _libc.sem_post
+    _sem_post.argtypes = [ctypes.c_void_p]
+except (AttributeError, NameError):
+    _sem_init = None
+
+# Sockets that writev() may write to directly, green sockets aren't
+# part of them.
+NATIVE_SOCKETS = (socket.socket, _socket.socket)
+
 weekdayname = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
 monthname = [None,
              'Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
@@ -139,6 +191,18 @@ def get_maxfd():
         maxfd = MAXFD
     return maxfd
 
+def get_rss():
+    "Resident memory of the process in bytes, None if it's unknown."
+    try:
+        fd = os.open("/proc/self/statm", os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        data = os.read(fd, 256)
+    finally:
+        os.close(fd)
+    return int(data.split()[1]) * mmap.PAGESIZE
+
 def close_on_exec(fd):
     flags = fcntl.fcntl(fd, fcntl.F_GETFD)
     flags |= fcntl.FD_CLOEXEC
@@ -154,9 +218,107 @@ def close(sock):
     except socket.error:
         pass
 
+def sendv(sock, bufs):
+    """\
+    Send all of ``bufs`` over the blocking socket ``sock`` with
+    writev(2), retrying with what is left after a partial write. A
+    socket with a timeout is waited on with select().
+    """
+    fd = sock.fileno()
+    while bufs:
+        count = min(len(bufs), IOV_MAX)
+        iov = (iovec * count)()
+        for i in range(count):
+            iov[i].iov_base = bufs[i]
+            iov[i].iov_len = len(bufs[i])
+        sent = _writev(fd, iov, count)
+        if sent < 0:
+            err = ctypes.get_errno()
+            if err == errno.EINTR:
+                continue
+            elif err == errno.EAGAIN:
+                if not select.select([], [fd], [], sock.gettimeout())[1]:
+                    raise socket.timeout("timed out")
+                continue
+            raise socket.error(err, os.strerror(err))
+        i = 0
+        while i < len(bufs) and sent >= len(bufs[i]):
+            sent -= len(bufs[i])
+            i += 1
+        bufs = bufs[i:]
+        if sent:
+            bufs[0] = bufs[0][sent:]
+
+def writev(sock, bufs):
+    """\
+    Send the strings in ``bufs`` in order, in a single system call when
+    the socket allows it. Plain sockets that block, with a timeout or not,
+    get a writev(2) so the strings aren't copied, other sockets (green
+    ones, for instance) get them joined into one sendall().
+    """
+    bufs = [str(buf) for buf in bufs if buf]
+    if not bufs:
+        return
+    if len(bufs) == 1:
+        sock.sendall(bufs[0])
+    elif _writev is not None and isinstance(sock, NATIVE_SOCKETS) \
+            and sock.gettimeout() != 0.0:
+        sendv(sock, bufs)
+    else:
+        sock.sendall("".join(bufs))
+
+def can_sendfile():
+    return _sendfile is not None
+
+def sendfile(sock, fileno, offset, nbytes):
+    """\
+    Send ``nbytes`` bytes of the file ``fileno`` from ``offset`` on
+    with sendfile(2), without moving the file position. Return the
+    number of bytes sent, less than asked for if the file was shorter.
+
+    Non blocking sockets are waited on with select(), which the gevent
+    and eventlet workers patch so that other connections are served
+    meanwhile.
+    """
+    fd = sock.fileno()
+    off = _sendfile.argtypes[2]._type_(offset)
+    sent = 0
+    while sent < nbytes:
+        ret = _sendfile(fd, fileno, ctypes.byref(off), nbytes - sent)
+        if ret < 0:
+            err = ctypes.get_errno()
+            if err == errno.EINTR:
+                continue
+            elif err == errno.EAGAIN:
+                timeout = sock.gettimeout() or None
+                if not select.select([], [fd], [], timeout)[1]:
+                    raise socket.timeout("timed out")
+                continue
+            raise socket.error(err, os.strerror(err))
+        elif ret == 0:
+            # end of file
+            break
+        sent += ret
+    return sent
+
+def sendfile_once(sock, fileno, offset, nbytes):
+    """\
+    Make a single sendfile(2) call for up to ``nbytes`` bytes of the
+    file ``fileno`` from ``offset`` on. Return the number of bytes sent,
+    0 at the end of the file. A non blocking socket that can't take any
+    raises EAGAIN, as send() does.
+    """
+    off = _sendfile.argtypes[2]._type_(offset)
+    while True:
+        ret = _sendfile(sock.fileno(), fileno, ctypes.byref(off), nbytes)
+        if ret >= 0:
+            return ret
+        err = ctypes.get_errno()
+        if err != errno.EINTR:
+            raise socket.error(err, os.strerror(err))
+
 def write_chunk(sock, data):
-    chunk = "".join(("%X\r\n" % len(data), data, "\r\n"))
-    sock.sendall(chunk)
+    writev(sock, ["%X\r\n" % len(data), data, "\r\n"])
     
 def write(sock, data, chunked=False):
     if chunked:
@@ -175,8 +337,13 @@ def write_nonblock(sock, data, chunked=False):
         return write(sock, data, chunked)
     
 def writelines(sock, lines, chunked=False):
-    for line in list(lines):
-        write(sock, line, chunked)
+    if not chunked:
+        return writev(sock, lines)
+    bufs = []
+    for line in lines:
+        if line:
+            bufs.extend(("%X\r\n" % len(line), line, "\r\n"))
+    writev(sock, bufs)
 
 def write_error(sock, msg, status_int=500, 
         reason="Internal Server Error"):
@@ -280,3 +447,84 @@ def daemonize():
         os.open(REDIRECT_TO, os.O_RDWR)
         os.dup2(0, 1)
         os.dup2(0, 2)
+
+class LRUCache(object):
+    """\
+    A bounded mapping approximating least recently used eviction with
+    two generations. Hits in the old generation are moved to the new
+    one, and when the new generation is full the old one is dropped
+    as a whole, so lookups and inserts never have to track an order.
+    """
+
+    def __init__(self, size):
+        self.size = max(1, size // 2)
+        self.new = {}
+        self.old = {}
+
+    def __len__(self):
+        return len(self.new) + len(self.old)
+
+    def get(self, key, default=None):
+        try:
+            return self.new[key]
+        except KeyError:
+            pass
+        try:
+            value = self.old.pop(key)
+        except KeyError:
+            return default
+        self.set(key, value)
+        return value
+
+    def set(self, key, value):
+        if len(self.new) >= self.size:
+            self.old = self.new
+            self.new = {}
+        self.new[key] = value
+
+def can_share_semaphore():
+    return _sem_init is not None
+
+class _shared_semaphore(ctypes.Structure):
+    # sem_t is 32 bytes at most on Linux
+    _fields_ = [("sem", ctypes.c_char * 64),
+                ("holder", ctypes.c_int)]
+
+class SharedSemaphore(object):
+    """\
+    A POSIX semaphore in an anonymous shared mapping, usable by the
+    processes forked after its creation. Unlike a file lock, releasing
+    it only wakes up one of the waiters. The holder is recorded so that
+    the semaphore can be recovered from a process killed holding it.
+    """
+
+    def __init__(self, value=1):
+        self.map = mmap.mmap(-1, ctypes.sizeof(_shared_semaphore))
+        self.shared = _shared_semaphore.from_buffer(self.map)
+        if _sem_init(ctypes.addressof(self.shared), 1, value) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def acquire(self, timeout):
+        """\
+        Wait up to ``timeout`` seconds for the semaphore. Returns False
+        when it wasn't acquired in time or a signal was received.
+        """
+        deadline = time.time() + timeout
+        ts = timespec(int(deadline), int((deadline % 1) * 1e9))
+        if _sem_timedwait(ctypes.addressof(self.shared), ctypes.byref(ts)):
+            err = ctypes.get_errno()
+            if err in (errno.ETIMEDOUT, errno.EINTR):
+                return False
+            raise OSError(err, os.strerror(err))
+        self.shared.holder = os.getpid()
+        return True
+
+    def release(self):
+        self.shared.holder = 0
+        _sem_post(ctypes.addressof(self.shared))
+
+    def recover(self, pid):
+        "Release the semaphore if the dead process ``pid`` held it."
+        if pid and self.shared.holder == pid:
+            self.release()
@@ -13,31 +13,50 @@ import gunicorn.http as http
 import gunicorn.http.wsgi as wsgi
 import gunicorn.util as util
 import gunicorn.workers.base as base
+from gunicorn.workers.scoreboard import IDLE, READING, WRITING
 
 ALREADY_HANDLED = object()
 
 class AsyncWorker(base.Worker):
 
+    reports_load = True
+
     def __init__(self, *args, **kwargs):
         super(AsyncWorker, self).__init__(*args, **kwargs)
         self.worker_connections = self.cfg.worker_connections
+        self.concurrency = self.worker_connections
     
     def timeout_ctx(self):
         raise NotImplementedError()
 
     def handle(self, client, addr):
+        batch = wsgi.ResponseBatch(client)
+        parser = http.RequestParser(client)
         try:
-            parser = http.RequestParser(client)
             try:
+                depth = 0
                 while True:
                     req = None
+                    self.score.set_state(READING)
                     with self.timeout_ctx():
                         req = parser.next()
                     if not req:
                         break
-                    self.handle_request(req, client, addr)
+                    if req.get_header("EXPECT") or req.get_header("UPGRADE"):
+                        # Those write to the socket on their own.
+                        batch.flush()
+                    # Only hold the response back while the next request
+                    # can be parsed right away, anything else streams.
+                    batch.gather = parser.has_buffered_message()
+                    self.handle_request(req, client, addr, batch)
+                    depth += 1
+                    if depth >= self.cfg.pipeline_depth or \
+                            not parser.has_buffered_message():
+                        batch.flush()
+                        depth = 0
             except StopIteration:
                 pass
+            batch.flush()
         except socket.error, e:
             if e[0] not in (errno.EPIPE, errno.ECONNRESET):
                 self.log.exception("Socket error processing request.")
@@ -48,37 +67,54 @@ class AsyncWorker(base.Worker):
                     self.log.debug("Ignoring EPIPE")
         except Exception, e:
             self.log.exception("General error processing request.")
+            try:
+                batch.flush()
+            except socket.error:
+                pass
             self.handle_error(client, e)
         finally:
+            self.score.received(parser.unreader.received)
+            self.score.set_state(IDLE)
             util.close(client)
 
-    def handle_request(self, req, sock, addr):
+    def handle_request(self, req, sock, addr, batch=None):
+        self.score.begin_request(req)
+        resp = None
         try:
             debug = self.cfg.debug or False
             self.cfg.pre_request(self, req)
             resp, environ = wsgi.create(req, sock, addr, self.address, self.cfg)
+            resp.batch = batch
             self.nr += 1
-            if self.alive and self.nr >= self.max_requests:
-                self.log.info("Autorestarting worker after current request.")
+            if self.recycle():
                 resp.force_close()
-                self.alive = False
             respiter = self.wsgi(environ, resp.start_response)
             if respiter == ALREADY_HANDLED:
                 return False
-            for item in respiter:
-                resp.write(item)
+            self.score.set_state(WRITING)
+            resp.set_framing(respiter)
+            if isinstance(respiter, environ['wsgi.file_wrapper']):
+                resp.write_file(respiter)
+            elif isinstance(respiter, (list, tuple)):
+                resp.writelines(respiter, last=True)
+            else:
+                for item in respiter:
+                    resp.write(item)
             resp.close()
             if hasattr(respiter, "close"):
                 respiter.close()
-            if req.should_close():
+            if resp.should_close:
                 raise StopIteration()
         except StopIteration:
             raise
         except Exception, e:
+            if batch is not None:
+                batch.flush()
             #Only send back traceback in HTTP in debug mode.
             self.handle_error(sock, e)
             return False
         finally:
+            self.score.end_request(resp is not None and resp.sent or 0)
             try:
                 self.cfg.post_request(self, req)
             except:
@@ -10,11 +10,12 @@ import random
 import signal
 import sys
 import tempfile
+import time
 import traceback
 
 
 from gunicorn import util
-from gunicorn.workers.workertmp import WorkerTmp
+from gunicorn.workers.scoreboard import NullScore
 
 from gunicorn.http.errors import InvalidHeader, InvalidHeaderName, \
 InvalidRequestLine, InvalidRequestMethod, InvalidHTTPVersion
@@ -29,6 +30,13 @@ class Worker(object):
     
     PIPE = []
 
+    # How often, in seconds, max_rss looks at the resident set size.
+    RSS_INTERVAL = 1.0
+
+    # Whether the worker keeps its scoreboard slot busy or idle, which
+    # autoscaling relies on.
+    reports_load = False
+
     def __init__(self, age, ppid, socket, app, timeout, cfg):
         """\
         This is called pre-fork so it shouldn't do anything to the
@@ -45,11 +53,24 @@ class Worker(object):
 
         self.nr = 0
         self.max_requests = cfg.max_requests or sys.maxint
+        if cfg.max_requests and cfg.max_requests_jitter:
+            self.max_requests += random.randint(0, cfg.max_requests_jitter)
+        self.max_rss = cfg.max_rss * 1024 * 1024
+        self.max_lifetime = cfg.max_lifetime
+        self.started = time.time()
+        self.rss_checked = 0
+        self.retiring = False
         self.alive = True
         self.log = logging.getLogger(__name__)
         self.debug = cfg.debug
         self.address = self.socket.getsockname()
-        self.tmp = WorkerTmp() 
+        # Heartbeat and scoreboard slots, given by the arbiter
+        self.tmp = None
+        self.score = NullScore()
+        # Requests served at the same time, reported to the scoreboard
+        self.concurrency = 1
+        # Shared by the workers taking turns to accept, see accept_mutex
+        self.accept_lock = None
         
     def __str__(self):
         return "<Worker %s>" % self.pid
@@ -65,6 +86,52 @@ class Worker(object):
         this task, the master process will murder your workers.
         """
         self.tmp.notify()
+        self.recycle()
+
+    def notify_interval(self):
+        """\
+        Seconds between the calls to notify() of a worker waking up on
+        a timer, short enough for small ``timeout`` values.
+        """
+        return min(1.0, self.timeout / 2.0)
+
+    def retire_reason(self):
+        "Why the worker is due to restart, None if it isn't."
+        if self.nr >= self.max_requests:
+            return "%s requests" % self.nr
+        now = time.time()
+        if self.max_lifetime and now - self.started >= self.max_lifetime:
+            return "%s seconds" % self.max_lifetime
+        if self.max_rss and now - self.rss_checked >= self.RSS_INTERVAL:
+            self.rss_checked = now
+            rss = util.get_rss()
+            if rss is not None and rss >= self.max_rss:
+                return "using %sMB" % (rss // (1024 * 1024))
+        return None
+
+    def recycle(self):
+        """\
+        Apply the recycling policy, between requests. A worker due to
+        restart stops after the current request, unless ``max_restarting``
+        is set: it then asks the arbiter, which sends it SIGQUIT once few
+        enough workers are restarting. Returns True if the worker stops.
+        """
+        if not self.alive:
+            return True
+        if self.retiring:
+            return False
+        reason = self.retire_reason()
+        if reason is None:
+            return False
+        self.retiring = True
+        if self.cfg.max_restarting:
+            self.log.info("Worker due to restart after %s." % reason)
+            self.tmp.retire()
+            return False
+        self.log.info("Autorestarting worker after current request (%s)."
+            % reason)
+        self.alive = False
+        return True
 
     def run(self):
         """\
@@ -93,10 +160,10 @@ class Worker(object):
         
         # Prevent fd inherientence
         util.close_on_exec(self.socket)
-        util.close_on_exec(self.tmp.fileno())
         self.init_signals()
         
         self.wsgi = self.app.wsgi()
+        self.score.boot(self.concurrency)
         
         # Enter main run loop
         self.booted = True
@@ -144,7 +211,7 @@ class Worker(object):
             util.write_error(client, mesg, status_int=status_int, 
                     reason=reason)
         except:
-            self.log.warning("Unexpected error" % traceback.format_exc())
+            self.log.warning("Unexpected error %s" % traceback.format_exc())
             pass
         
     def handle_winch(self, sig, fname):
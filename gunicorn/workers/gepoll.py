@@ -0,0 +1,691 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+#
+# A worker multiplexing its connections with epoll(7). The main thread
+# accepts connections and reads them without blocking, a request only
+# reaches the application once it has been entirely received, and the
+# response is sent as fast as the client takes it, the application
+# being paused while too much of it waits. The application runs in the
+# main thread, or on a pool of ``threads`` threads. An idle Keep-Alive
+# connection or a slow client costs a file descriptor and its buffers,
+# nothing more. Linux only.
+
+from __future__ import with_statement
+
+import collections
+import errno
+import os
+import select
+import socket
+import threading
+import time
+
+import gunicorn.http as http
+import gunicorn.http.wsgi as wsgi
+import gunicorn.util as util
+import gunicorn.workers.base as base
+from gunicorn.http.body import Body, ChunkedReader, LengthReader
+from gunicorn.http.errors import InvalidChunkSize
+from gunicorn.http.unreader import ByteBuffer, IterUnreader
+from gunicorn.workers.gthread import ThreadPool
+
+RECV_SIZE = 64 * 1024
+
+# Connections whose request head grows past this size without being
+# complete are dropped.
+MAX_HEAD_SIZE = 64 * 1024
+
+# Once this much of a response waits for the client the application is
+# paused, until the client took half of it.
+OUTPUT_LIMIT = 64 * 1024
+
+# Input read past the request being served, the next requests are left
+# in the socket beyond that.
+MAX_READ_AHEAD = 16 * 1024
+
+CONTINUE = "HTTP/1.1 100 Continue\r\n\r\n"
+
+def parse_head(data):
+    "Parse the head of a request, ``data`` ending with its empty line."
+    return http.Request(IterUnreader([data]))
+
+class BodyTooLarge(Exception):
+    pass
+
+class ChunkScanner(object):
+    """\
+    Follows the framing of a chunked body as it arrives, without
+    decoding it, to find where the body ends. The body is decoded once
+    all of it arrived. Nothing is looked at twice however it's split.
+    """
+
+    def __init__(self, pos):
+        # How far into the buffer the body was followed
+        self.pos = pos
+        # Bytes of chunk data and of their \r\n still to skip
+        self.left = 0
+        self.trailers = False
+        # Where the search for the end of a line resumes
+        self.scanned = pos
+
+    def scan(self, buf):
+        """\
+        Follow the body further into ``buf``. Return the offset of the
+        end of the body, None while it hasn't arrived.
+        """
+        while True:
+            if self.left:
+                step = min(self.left, len(buf) - self.pos)
+                self.pos += step
+                self.left -= step
+                if self.left:
+                    return None
+            elif self.trailers:
+                if len(buf) - self.pos < 2:
+                    return None
+                if buf.startswith("\r\n", self.pos):
+                    return self.pos + 2
+                idx = buf.find("\r\n\r\n", max(self.scanned, self.pos))
+                if idx < 0:
+                    self.scanned = max(len(buf) - 3, self.pos)
+                    return None
+                return idx + 4
+            else:
+                idx = buf.find("\r\n", max(self.scanned, self.pos))
+                if idx < 0:
+                    self.scanned = max(len(buf) - 1, self.pos)
+                    return None
+                line = buf.peek(idx - self.pos, self.pos)
+                chunk_size = line.split(";", 1)[0].strip()
+                try:
+                    chunk_size = int(chunk_size, 16)
+                except ValueError:
+                    raise InvalidChunkSize(chunk_size)
+                if chunk_size < 0:
+                    raise InvalidChunkSize(chunk_size)
+                self.pos = idx + 2
+                if chunk_size == 0:
+                    self.trailers = True
+                else:
+                    self.left = chunk_size + 2
+
+class FilePart(object):
+    """\
+    A part of a file queued to be sent with sendfile(2). It has its own
+    descriptor as the application closes the file once it's queued.
+    """
+
+    def __init__(self, fileno, offset, nbytes):
+        self.fd = os.dup(fileno)
+        self.offset = offset
+        self.left = nbytes
+
+    def close(self):
+        os.close(self.fd)
+
+class Stream(object):
+    """\
+    Stands for both the socket and the batch of a response: what it
+    writes is queued on the connection for the event loop to send, and
+    files are queued to be sent with sendfile(2).
+    """
+
+    def __init__(self, worker, conn):
+        self.worker = worker
+        self.conn = conn
+
+    def write(self, bufs):
+        self.worker.queue(self.conn, [str(buf) for buf in bufs if buf])
+
+    def flush(self):
+        pass
+
+    def sendall(self, data):
+        self.write([data])
+
+    def send(self, data):
+        # Only used for "100 Continue", which the event loop sends
+        # itself when it starts waiting for the body.
+        return len(data)
+
+    def queue_file(self, fileno, offset, nbytes):
+        self.worker.queue(self.conn, [FilePart(fileno, offset, nbytes)])
+        return nbytes
+
+    def gettimeout(self):
+        return 0.0
+
+class EConn(object):
+    "A non-blocking client connection and its buffers."
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.fd = sock.fileno()
+        self.inbuf = ByteBuffer()
+        # Strings and file parts waiting to be sent, and how much of the
+        # first string was sent already
+        self.outbuf = collections.deque()
+        self.offset = 0
+        # Output of the pool thread serving the connection, not moved
+        # to outbuf yet
+        self.incoming = []
+        # Size of the strings waiting to be sent
+        self.queued = 0
+        self.events = select.EPOLLIN
+        self.busy = False
+        # The response being produced in the main thread
+        self.producer = None
+        self.keepalive = False
+        self.closing = False
+        self.closed = False
+        self.served = 0
+        self.deadline = None
+        self.reset()
+
+    def reset(self):
+        "Forget about the request being received."
+        # The request once its head was parsed, the size of its head and
+        # where it ends in inbuf if that is known.
+        self.req = None
+        self.head_size = 0
+        self.end = None
+        self.chunks = None
+        self.continued = False
+        # Where the search for the end of the head resumes
+        self.scanned = 0
+
+    def close(self):
+        util.close(self.sock)
+
+class EpollWorker(base.Worker):
+
+    reports_load = True
+
+    def __init__(self, *args, **kwargs):
+        super(EpollWorker, self).__init__(*args, **kwargs)
+        self.threads = max(self.cfg.threads, 1)
+        self.concurrency = self.threads
+        self.pool = None
+        self.lock = threading.Lock()
+        # Notified as the clients take the output of the pool threads
+        self.drained = threading.Condition(self.lock)
+        self.ready = []
+        self.done = []
+        self.conns = {}
+        self.poller = None
+
+    @classmethod
+    def setup(cls):
+        if not hasattr(select, "epoll"):
+            raise RuntimeError("The epoll worker requires Linux.")
+
+    def run(self):
+        self.socket.setblocking(0)
+        self.poller = select.epoll()
+        self.poller.register(self.socket.fileno(), select.EPOLLIN)
+        self.poller.register(self.PIPE[0], select.EPOLLIN)
+        if self.threads > 1:
+            self.pool = ThreadPool(self.threads, self.handle)
+            self.pool.start()
+
+        while self.alive:
+            self.notify()
+            try:
+                events = self.poller.poll(self.poll_timeout())
+            except IOError, e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+
+            for fd, mask in events:
+                if fd == self.socket.fileno():
+                    self.accept()
+                elif fd == self.PIPE[0]:
+                    self.drain_pipe()
+                else:
+                    conn = self.conns.get(fd)
+                    if conn is None:
+                        continue
+                    if mask & (select.EPOLLHUP | select.EPOLLERR):
+                        self.close(conn)
+                        continue
+                    if mask & select.EPOLLOUT:
+                        self.send(conn)
+                        if conn.producer is not None and not conn.closed \
+                                and conn.queued < OUTPUT_LIMIT // 2:
+                            self.produce(conn)
+                    if mask & select.EPOLLIN and not conn.closed:
+                        self.receive(conn)
+
+            self.complete()
+            self.murder_idle()
+
+            if self.ppid != os.getppid():
+                self.log.info("Parent changed, shutting down: %s" % self)
+                break
+
+        # Wakes up the pool threads waiting for their clients.
+        for conn in self.conns.values():
+            self.close(conn)
+        if self.pool is not None:
+            self.pool.stop(self.timeout)
+        self.poller.close()
+
+    def poll_timeout(self):
+        timeout = self.notify_interval()
+        now = time.time()
+        for conn in self.conns.itervalues():
+            if conn.deadline is not None:
+                timeout = min(timeout, max(conn.deadline - now, 0))
+        return timeout
+
+    def drain_pipe(self):
+        try:
+            while os.read(self.PIPE[0], 4096):
+                pass
+        except OSError, e:
+            if e.errno not in (errno.EAGAIN, errno.EINTR):
+                raise
+
+    def wakeup(self):
+        try:
+            os.write(self.PIPE[1], ".")
+        except OSError, e:
+            if e.errno not in (errno.EAGAIN, errno.EINTR):
+                raise
+
+    def accept(self):
+        while True:
+            try:
+                client, addr = self.socket.accept()
+            except socket.error, e:
+                if e[0] not in (errno.EAGAIN, errno.ECONNABORTED):
+                    raise
+                return
+            client.setblocking(0)
+            util.close_on_exec(client)
+            conn = EConn(client, addr)
+            conn.deadline = time.time() + self.cfg.keepalive
+            self.conns[conn.fd] = conn
+            self.poller.register(conn.fd, conn.events)
+
+    def close(self, conn):
+        del self.conns[conn.fd]
+        try:
+            self.poller.unregister(conn.fd)
+        except (IOError, ValueError):
+            pass
+        conn.close()
+        with self.lock:
+            conn.closed = True
+            parts = list(conn.outbuf) + conn.incoming
+            conn.outbuf.clear()
+            conn.incoming = []
+            self.drained.notify_all()
+        for item in parts:
+            if isinstance(item, FilePart):
+                item.close()
+        if conn.producer is not None:
+            producer, conn.producer = conn.producer, None
+            producer.close()
+
+    def set_events(self, conn, events):
+        if events != conn.events:
+            conn.events = events
+            self.poller.modify(conn.fd, events)
+
+    def murder_idle(self):
+        now = time.time()
+        for conn in self.conns.values():
+            if conn.deadline is not None and conn.deadline <= now:
+                self.close(conn)
+
+    def receive(self, conn):
+        eof = False
+        while True:
+            if conn.busy and len(conn.inbuf) >= MAX_READ_AHEAD:
+                # Leave the next requests in the socket until the
+                # response is complete.
+                self.set_events(conn, conn.events & ~select.EPOLLIN)
+                break
+            try:
+                received = conn.inbuf.recv_from(conn.sock, RECV_SIZE)
+            except socket.error, e:
+                if e[0] == errno.EINTR:
+                    continue
+                if e[0] == errno.EAGAIN:
+                    break
+                self.close(conn)
+                return
+            if not received:
+                eof = True
+                break
+
+        if not conn.busy and not conn.closing:
+            conn.deadline = time.time() + self.timeout
+            self.dispatch(conn)
+        if eof and not conn.closed:
+            # The client may still read what it asked for before
+            # shutting its side down.
+            if conn.busy or conn.outbuf:
+                conn.closing = True
+                self.set_events(conn, conn.events & ~select.EPOLLIN)
+            else:
+                self.close(conn)
+
+    def dispatch(self, conn):
+        "Start serving the next request of a connection once it arrived."
+        inbuf = conn.inbuf
+        if conn.req is None:
+            idx = inbuf.find("\r\n\r\n", conn.scanned)
+            if idx < 0:
+                if len(inbuf) > MAX_HEAD_SIZE:
+                    self.close(conn)
+                elif not len(inbuf) and not conn.outbuf:
+                    conn.deadline = time.time() + self.cfg.keepalive
+                else:
+                    conn.scanned = max(len(inbuf) - 3, 0)
+                return
+
+        try:
+            if conn.req is None:
+                self.parse_head(conn, idx + 4)
+            size = self.request_end(conn)
+            if size is not None:
+                req = conn.req
+                req.body = self.read_body(conn, size)
+        except Exception, e:
+            stream = Stream(self, conn)
+            if isinstance(e, BodyTooLarge):
+                util.write_error(stream, "<p>Request body too large</p>",
+                        status_int=413, reason="Request Entity Too Large")
+            else:
+                self.log.debug("Invalid request: %s" % e)
+                self.handle_error(stream, e)
+            conn.closing = True
+            self.send(conn)
+            return
+
+        if size is None:
+            req = conn.req
+            if not conn.continued and req.version >= (1, 1) and \
+                    (req.get_header("EXPECT") or "").lower() == "100-continue":
+                conn.continued = True
+                self.queue(conn, [CONTINUE])
+                self.send(conn)
+            return
+
+        inbuf.skip(size)
+        conn.reset()
+        conn.served += 1
+        conn.busy = True
+        conn.deadline = None
+        if self.pool is not None:
+            self.pool.put((conn, req))
+        else:
+            conn.producer = self.handle_request(req, conn)
+            self.produce(conn)
+
+    def parse_head(self, conn, size):
+        """\
+        Parse the head of the request at the start of the input of a
+        connection, the first ``size`` bytes, and find out how its body
+        ends. This is only done once per request.
+        """
+        req = parse_head(conn.inbuf.peek(size))
+        reader = req.body.reader
+        if isinstance(reader, LengthReader):
+            limit = self.cfg.max_buffered_body
+            if limit and reader.length > limit:
+                raise BodyTooLarge()
+            conn.end = size + reader.length
+        else:
+            conn.chunks = ChunkScanner(size)
+        conn.req = req
+        conn.head_size = size
+
+    def request_end(self, conn):
+        """\
+        Return where the request being received ends in the input of a
+        connection, None while it hasn't arrived entirely.
+        """
+        if conn.end is not None:
+            if len(conn.inbuf) < conn.end:
+                return None
+            return conn.end
+        end = conn.chunks.scan(conn.inbuf)
+        limit = self.cfg.max_buffered_body
+        if end is None and limit and \
+                len(conn.inbuf) - conn.head_size > limit:
+            raise BodyTooLarge()
+        return end
+
+    def read_body(self, conn, size):
+        "Return the body of the request that ends ``size`` bytes in."
+        data = conn.inbuf.peek(size - conn.head_size, conn.head_size)
+        if conn.chunks is not None:
+            data = Body(ChunkedReader(conn.req, IterUnreader([data]))).read()
+        return Body(LengthReader(IterUnreader([data]), len(data)))
+
+    def handle(self, item):
+        "Serve a request in a pool thread."
+        conn, req = item
+        producer = self.handle_request(req, conn)
+        for paused in producer:
+            if not self.wait_drained(conn):
+                producer.close()
+                break
+        with self.lock:
+            self.done.append(conn)
+        self.wakeup()
+
+    def wait_drained(self, conn):
+        """\
+        Wait for the client to take most of the output waiting for it
+        if there is too much. Return False if the connection was closed.
+        """
+        with self.lock:
+            if conn.queued >= OUTPUT_LIMIT:
+                while conn.queued >= OUTPUT_LIMIT // 2 and not conn.closed:
+                    self.drained.wait()
+            return not conn.closed
+
+    def produce(self, conn):
+        """\
+        Serve the request of a connection in the main thread, until too
+        much output waits for the client or the response is complete.
+        """
+        while True:
+            try:
+                conn.producer.next()
+            except StopIteration:
+                conn.producer = None
+                self.done.append(conn)
+                self.send(conn)
+                return
+            self.send(conn)
+            if conn.closed or conn.queued >= OUTPUT_LIMIT:
+                return
+
+    def queue(self, conn, items):
+        "Queue output to send to a connection, from any thread."
+        size = 0
+        for item in items:
+            if not isinstance(item, FilePart):
+                size += len(item)
+        wake = False
+        with self.lock:
+            if not conn.closed:
+                conn.queued += size
+                if self.pool is None:
+                    conn.outbuf.extend(items)
+                else:
+                    wake = not conn.incoming
+                    conn.incoming.extend(items)
+                    if wake:
+                        self.ready.append(conn)
+                items = []
+        for item in items:
+            if isinstance(item, FilePart):
+                item.close()
+        if conn.closed:
+            raise socket.error(errno.EPIPE, os.strerror(errno.EPIPE))
+        if wake:
+            self.wakeup()
+
+    def complete(self):
+        """\
+        Send the output the pool threads queued, and serve what follows
+        the responses that are complete.
+        """
+        while True:
+            with self.lock:
+                ready, self.ready = self.ready, []
+                done, self.done = self.done, []
+            if not ready and not done:
+                return
+            for conn in ready:
+                if not conn.closed:
+                    self.send(conn)
+            for conn in done:
+                self.finish(conn)
+
+    def finish(self, conn):
+        "Serve the next request of a connection once a response is complete."
+        conn.busy = False
+        if conn.closed:
+            return
+        if not conn.keepalive or not self.alive:
+            conn.closing = True
+        elif not conn.closing:
+            self.set_events(conn, conn.events | select.EPOLLIN)
+        self.send(conn)
+        if not conn.closed and not conn.closing:
+            self.dispatch(conn)
+
+    def send(self, conn):
+        if self.pool is not None:
+            with self.lock:
+                conn.outbuf.extend(conn.incoming)
+                conn.incoming = []
+        outbuf = conn.outbuf
+        sent = 0
+        blocked = False
+        while outbuf:
+            item = outbuf[0]
+            try:
+                if isinstance(item, FilePart):
+                    count = util.sendfile_once(conn.sock, item.fd,
+                            item.offset, item.left)
+                    if not count:
+                        # The file is shorter than the response said.
+                        self.close(conn)
+                        return
+                    item.offset += count
+                    item.left -= count
+                    if not item.left:
+                        outbuf.popleft()
+                        item.close()
+                    continue
+                data = item
+                if conn.offset:
+                    data = buffer(item, conn.offset)
+                count = conn.sock.send(data)
+            except socket.error, e:
+                if e[0] == errno.EINTR:
+                    continue
+                if e[0] == errno.EAGAIN:
+                    blocked = True
+                    break
+                self.close(conn)
+                return
+            sent += count
+            if count < len(data):
+                conn.offset += count
+                blocked = True
+                break
+            outbuf.popleft()
+            conn.offset = 0
+
+        if sent:
+            with self.lock:
+                conn.queued -= sent
+                if conn.queued < OUTPUT_LIMIT // 2:
+                    self.drained.notify_all()
+        if blocked:
+            self.set_events(conn, conn.events | select.EPOLLOUT)
+            conn.deadline = time.time() + self.timeout
+            return
+        self.set_events(conn, conn.events & ~select.EPOLLOUT)
+        if conn.busy:
+            conn.deadline = None
+        elif conn.closing:
+            self.close(conn)
+        elif not len(conn.inbuf):
+            conn.deadline = time.time() + self.cfg.keepalive
+
+    def can_keepalive(self, conn):
+        if not self.alive:
+            return False
+        limit = self.cfg.keepalive_requests
+        return not limit or conn.served < limit
+
+    def handle_request(self, req, conn):
+        """\
+        Run the application for a request, writing the response to the
+        output of the connection. A generator pausing after each part of
+        the body so that the caller can wait for the client to take it.
+        ``conn.keepalive`` tells in the end whether the connection can be
+        used for another request.
+        """
+        stream = Stream(self, conn)
+        conn.keepalive = False
+        with self.lock:
+            self.score.begin_request(req)
+        resp = None
+        try:
+            self.cfg.pre_request(self, req)
+            resp, environ = wsgi.create(req, stream, conn.addr,
+                    self.address, self.cfg)
+            resp.batch = stream
+            environ["gunicorn.socket"] = conn.sock
+            environ["wsgi.multithread"] = self.threads > 1
+            if not self.can_keepalive(conn):
+                resp.force_close()
+            with self.lock:
+                self.nr += 1
+                if self.recycle():
+                    resp.force_close()
+            respiter = self.wsgi(environ, resp.start_response)
+            resp.set_framing(respiter)
+            if isinstance(respiter, environ['wsgi.file_wrapper']):
+                items = resp.iter_file(respiter)
+            elif isinstance(respiter, (list, tuple)):
+                resp.writelines(respiter, last=True)
+                items = ()
+            else:
+                items = respiter
+            for item in items:
+                resp.write(item)
+                yield
+            resp.close()
+            if hasattr(respiter, "close"):
+                respiter.close()
+            conn.keepalive = not resp.should_close
+        except socket.error, e:
+            self.log.debug("Client went away: %s" % e)
+        except Exception, e:
+            self.log.exception("Error processing request.")
+            if resp is None or not resp.headers_sent:
+                # Only send back traceback in HTTP in debug mode.
+                self.handle_error(stream, e)
+        finally:
+            with self.lock:
+                self.score.end_request(resp is not None and resp.sent or 0)
+            try:
+                self.cfg.post_request(self, req)
+            except:
+                pass
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+#
+# A worker serving requests from a pool of threads. The main thread
+# accepts connections and watches them while they are idle, new ones
+# included, the pool threads parse requests and run the application.
+# Suited to thread safe applications blocking on I/O that can't be made
+# cooperative, in C database drivers for instance.
+
+from __future__ import with_statement
+
+import errno
+import os
+import Queue
+import select
+import socket
+import threading
+import time
+
+import gunicorn.http as http
+import gunicorn.http.wsgi as wsgi
+import gunicorn.util as util
+import gunicorn.workers.base as base
+
+class TConn(object):
+    "A client connection and its parser, kept across requests."
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.parser = http.RequestParser(sock)
+        self.served = 0
+        self.deadline = None
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        util.close(self.sock)
+
+class ThreadPool(object):
+    """\
+    A fixed number of daemon threads calling ``func`` on the items put
+    in the pool. Callers are expected to track how many items are in
+    flight so that the queue stays bounded.
+    """
+
+    def __init__(self, size, func):
+        self.size = size
+        self.func = func
+        self.queue = Queue.Queue()
+        self.threads = []
+
+    def start(self):
+        for i in range(self.size):
+            thread = threading.Thread(target=self.loop)
+            thread.setDaemon(True)
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            self.func(item)
+
+    def stop(self, timeout):
+        for thread in self.threads:
+            self.queue.put(None)
+        limit = time.time() + timeout
+        for thread in self.threads:
+            thread.join(max(limit - time.time(), 0))
+
+class ThreadWorker(base.Worker):
+
+    reports_load = True
+
+    def __init__(self, *args, **kwargs):
+        super(ThreadWorker, self).__init__(*args, **kwargs)
+        self.threads = max(self.cfg.threads, 1)
+        self.concurrency = self.threads
+        self.worker_connections = self.cfg.worker_connections
+        self.pool = None
+        self.lock = threading.Lock()
+        self.active = 0
+        self.idle = []
+        self.returned = []
+
+    def run(self):
+        self.socket.setblocking(0)
+        self.pool = ThreadPool(self.threads, self.handle)
+        self.pool.start()
+
+        while self.alive:
+            with self.lock:
+                # The pool threads apply the recycling policy too.
+                self.notify()
+                self.idle.extend(self.returned)
+                self.returned = []
+                can_serve = self.active < self.threads
+
+            # Only accept while the pool can serve right away and leave
+            # the rest to the other workers. A connection only goes to
+            # the pool once its request starts to arrive. poll() rather
+            # than select() as idle connections get past FD_SETSIZE.
+            poller = select.poll()
+            poller.register(self.PIPE[0], select.POLLIN)
+            watched = {}
+            if can_serve:
+                if len(self.idle) < self.worker_connections:
+                    poller.register(self.socket, select.POLLIN)
+                for conn in self.idle:
+                    poller.register(conn.sock, select.POLLIN)
+                    watched[conn.fileno()] = conn
+            try:
+                events = poller.poll(self.poll_timeout())
+            except select.error, e:
+                if e[0] == errno.EINTR:
+                    continue
+                raise
+
+            for fd, event in events:
+                if fd == self.PIPE[0]:
+                    self.drain_pipe()
+                elif fd in watched:
+                    if self.active < self.threads:
+                        conn = watched[fd]
+                        self.idle.remove(conn)
+                        self.submit(conn)
+                else:
+                    self.accept()
+
+            self.murder_idle()
+
+            if self.ppid != os.getppid():
+                self.log.info("Parent changed, shutting down: %s" % self)
+                break
+
+        self.pool.stop(self.timeout)
+        for conn in self.idle + self.returned:
+            conn.close()
+
+    def poll_timeout(self):
+        """\
+        Milliseconds until the next idle connection expires, or until
+        notify() is due.
+        """
+        timeout = self.notify_interval()
+        now = time.time()
+        for conn in self.idle:
+            timeout = min(timeout, max(conn.deadline - now, 0))
+        return int(timeout * 1000)
+
+    def drain_pipe(self):
+        try:
+            while os.read(self.PIPE[0], 4096):
+                pass
+        except OSError, e:
+            if e.errno not in (errno.EAGAIN, errno.EINTR):
+                raise
+
+    def wakeup(self):
+        try:
+            os.write(self.PIPE[1], ".")
+        except OSError, e:
+            if e.errno not in (errno.EAGAIN, errno.EINTR):
+                raise
+
+    def accept(self):
+        while len(self.idle) < self.worker_connections:
+            try:
+                client, addr = self.socket.accept()
+            except socket.error, e:
+                if e[0] not in (errno.EAGAIN, errno.ECONNABORTED):
+                    raise
+                return
+            # Reads and writes of the pool threads give up on clients
+            # that stall.
+            client.settimeout(self.timeout)
+            util.close_on_exec(client)
+            conn = TConn(client, addr)
+            conn.deadline = time.time() + self.cfg.keepalive
+            self.idle.append(conn)
+
+    def submit(self, conn):
+        with self.lock:
+            self.active += 1
+        self.pool.put(conn)
+
+    def murder_idle(self):
+        now = time.time()
+        expired = [conn for conn in self.idle if conn.deadline <= now]
+        for conn in expired:
+            self.idle.remove(conn)
+            conn.close()
+
+    def handle(self, conn):
+        """\
+        Serve the requests of a connection until it has to be closed or
+        no further request is buffered, then hand it back to the main
+        thread to wait for its next request.
+        """
+        keepalive = False
+        try:
+            while True:
+                try:
+                    req = conn.parser.next()
+                except StopIteration:
+                    if conn.served:
+                        # The client closed an idle connection.
+                        keepalive = False
+                        break
+                    raise
+                conn.served += 1
+                keepalive = self.handle_request(req, conn)
+                if not keepalive or not conn.parser.has_buffered_message():
+                    break
+        except StopIteration:
+            self.log.debug("Ignored premature client disconnection.")
+        except socket.timeout:
+            self.log.debug("Client timed out.")
+        except socket.error, e:
+            if e[0] not in (errno.EPIPE, errno.ECONNRESET):
+                self.log.exception("Error processing request.")
+            else:
+                self.log.debug("Ignoring EPIPE or connection reset")
+        except Exception, e:
+            self.log.exception("Error processing request.")
+            self.handle_error(conn.sock, e)
+        finally:
+            with self.lock:
+                self.active -= 1
+                if keepalive and self.alive:
+                    conn.deadline = time.time() + self.cfg.keepalive
+                    self.returned.append(conn)
+                else:
+                    conn.close()
+            self.wakeup()
+
+    def can_keepalive(self, conn):
+        if not self.alive:
+            return False
+        limit = self.cfg.keepalive_requests
+        return not limit or conn.served < limit
+
+    def handle_request(self, req, conn):
+        """\
+        Handle a single request, return True if the connection can be
+        used for another one.
+        """
+        with self.lock:
+            self.score.begin_request(req)
+        resp = None
+        try:
+            debug = self.cfg.debug or False
+            self.cfg.pre_request(self, req)
+            resp, environ = wsgi.create(req, conn.sock, conn.addr,
+                    self.address, self.cfg)
+            environ["wsgi.multithread"] = self.threads > 1
+            if not self.can_keepalive(conn):
+                resp.force_close()
+            with self.lock:
+                self.nr += 1
+                if self.recycle():
+                    resp.force_close()
+            respiter = self.wsgi(environ, resp.start_response)
+            resp.set_framing(respiter)
+            if isinstance(respiter, environ['wsgi.file_wrapper']):
+                resp.write_file(respiter)
+            elif isinstance(respiter, (list, tuple)):
+                resp.writelines(respiter, last=True)
+            else:
+                for item in respiter:
+                    resp.write(item)
+            resp.close()
+            if hasattr(respiter, "close"):
+                respiter.close()
+            return not resp.should_close
+        except socket.error:
+            raise
+        except Exception, e:
+            # Only send back traceback in HTTP in debug mode.
+            self.handle_error(conn.sock, e)
+            return False
+        finally:
+            with self.lock:
+                self.score.end_request(resp is not None and resp.sent or 0)
+            try:
+                self.cfg.post_request(self, req)
+            except:
+                pass
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+#
+# Liveness of the workers. The arbiter maps a table in anonymous shared
+# memory before forking and hands a slot of it to each worker. Workers
+# notify by writing the time in their slot, without a system call, and
+# the arbiter scans the slots. Workers due to restart also say so there.
+
+import ctypes
+import mmap
+import time
+
+class _slot(ctypes.Structure):
+    _fields_ = [("last", ctypes.c_double),
+                ("booted", ctypes.c_int),
+                ("retire", ctypes.c_int)]
+
+class HeartbeatTable(object):
+    """\
+    A fixed number of heartbeat slots. Once they are all used the
+    arbiter maps a larger table for the next workers, those already
+    forked keep theirs.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.map = mmap.mmap(-1, ctypes.sizeof(_slot) * size)
+        self.slots = (_slot * size).from_buffer(self.map)
+        self.free = range(size - 1, -1, -1)
+
+    def acquire(self):
+        "Return the heartbeat of a free slot, None if there is none."
+        if not self.free:
+            return None
+        index = self.free.pop()
+        slot = self.slots[index]
+        slot.last = time.time()
+        slot.booted = 0
+        slot.retire = 0
+        return Heartbeat(self, index)
+
+    def release(self, index):
+        self.free.append(index)
+
+class Heartbeat(object):
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+        self.slot = table.slots[index]
+        self.closed = False
+
+    def notify(self):
+        slot = self.slot
+        slot.last = time.time()
+        slot.booted = 1
+
+    @property
+    def last_update(self):
+        return self.slot.last
+
+    @property
+    def booted(self):
+        "True once the worker notified, which it does when it's running."
+        return self.slot.booted != 0
+
+    def retire(self):
+        "Ask the arbiter to let the worker restart."
+        self.slot.retire = 1
+
+    @property
+    def retiring(self):
+        return self.slot.retire != 0
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.table.release(self.index)
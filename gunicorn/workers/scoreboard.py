@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+#
+# What the workers are doing. The arbiter maps the scoreboard from a
+# file named after its pid before forking and hands a slot of it to
+# each worker, which records its state and counters there with plain
+# memory writes. gunicorn-status reads the file from another process,
+# running as the same user since only the owner may read it.
+
+import ctypes
+import errno
+import mmap
+import os
+import tempfile
+import time
+
+MAGIC = "gunicorn-score-2"
+
+O_NOFOLLOW = getattr(os, "O_NOFOLLOW", 0)
+
+# States of a slot
+FREE, BOOTING, IDLE, READING, APP, WRITING = range(6)
+STATES = ["free", "booting", "idle", "reading", "app", "writing"]
+
+class _header(ctypes.Structure):
+    _fields_ = [("magic", ctypes.c_char * 16),
+                ("pid", ctypes.c_int),
+                ("size", ctypes.c_int),
+                ("started", ctypes.c_double)]
+
+class _score(ctypes.Structure):
+    _fields_ = [("pid", ctypes.c_int),
+                ("state", ctypes.c_int),
+                ("concurrency", ctypes.c_int),
+                ("active", ctypes.c_int),
+                ("requests", ctypes.c_ulonglong),
+                ("bytes_in", ctypes.c_ulonglong),
+                ("bytes_out", ctypes.c_ulonglong),
+                ("request_start", ctypes.c_double),
+                ("method", ctypes.c_char * 8),
+                ("path", ctypes.c_char * 64)]
+
+# States of a worker busy with a request
+BUSY = (READING, APP, WRITING)
+
+FIELDS = [name for name, ctype in _score._fields_]
+
+def scoreboard_path(pid, tmpdir=None):
+    return os.path.join(tmpdir or tempfile.gettempdir(),
+        "gunicorn-%d.scoreboard" % pid)
+
+class Scoreboard(object):
+    """\
+    A fixed number of slots, in a file when ``path`` is given so that
+    other processes can read it. Workers spawned while all slots are
+    used aren't recorded.
+    """
+
+    def __init__(self, size, path=None):
+        self.size = size
+        self.path = path
+        length = ctypes.sizeof(_header) + ctypes.sizeof(_score) * size
+        if path is None:
+            self.map = mmap.mmap(-1, length)
+        else:
+            # The name is predictable, never open a file or a symlink
+            # someone else put there.
+            try:
+                os.unlink(path)
+            except OSError, e:
+                if e.errno != errno.ENOENT:
+                    raise
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL |
+                O_NOFOLLOW, 0600)
+            try:
+                os.ftruncate(fd, length)
+                self.map = mmap.mmap(fd, length)
+            finally:
+                os.close(fd)
+        self.header = _header.from_buffer(self.map)
+        self.scores = (_score * size).from_buffer(self.map,
+            ctypes.sizeof(_header))
+        self.header.pid = os.getpid()
+        self.header.size = size
+        self.header.started = time.time()
+        self.header.magic = MAGIC
+        self.free = range(size - 1, -1, -1)
+
+    def acquire(self):
+        "Return the score of a free slot, None if there is none."
+        if not self.free:
+            return None
+        index = self.free.pop()
+        ctypes.memset(ctypes.addressof(self.scores[index]), 0,
+            ctypes.sizeof(_score))
+        self.scores[index].state = BOOTING
+        return Score(self, index)
+
+    def release(self, index):
+        self.scores[index].state = FREE
+        self.free.append(index)
+
+    def close(self):
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+class Score(object):
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+        self.slot = table.scores[index]
+        self.closed = False
+
+    def boot(self, concurrency=1):
+        self.slot.pid = os.getpid()
+        self.slot.concurrency = concurrency
+        self.slot.state = IDLE
+
+    @property
+    def state(self):
+        return self.slot.state
+
+    def load(self):
+        """\
+        Return how busy the worker is, from 0 to 1. A worker serving
+        several requests at a time counts its requests, others their
+        state so that reading a request counts too.
+        """
+        slot = self.slot
+        if slot.concurrency > 1:
+            return min(slot.active, slot.concurrency) / float(slot.concurrency)
+        return float(slot.state in BUSY)
+
+    def set_state(self, state):
+        # The state of a single request can't stand for a worker that
+        # serves several, those are only shown busy or idle.
+        if self.slot.concurrency <= 1:
+            self.slot.state = state
+
+    def begin_request(self, req):
+        slot = self.slot
+        slot.active += 1
+        slot.state = APP
+        slot.request_start = time.time()
+        slot.method = req.method[:7]
+        slot.path = req.path[:63]
+
+    def end_request(self, sent):
+        slot = self.slot
+        slot.active = max(slot.active - 1, 0)
+        if not slot.active:
+            slot.state = IDLE
+        slot.requests += 1
+        slot.bytes_out += sent
+
+    def received(self, size):
+        self.slot.bytes_in += size
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.table.release(self.index)
+
+class NullScore(object):
+    "The score of workers the scoreboard has no slot for."
+
+    state = None
+
+    def boot(self, concurrency=1):
+        pass
+
+    def load(self):
+        return None
+
+    def set_state(self, state):
+        pass
+
+    def begin_request(self, req):
+        pass
+
+    def end_request(self, sent):
+        pass
+
+    def received(self, size):
+        pass
+
+    def close(self):
+        pass
+
+def read_scoreboard(path):
+    """\
+    Return the pid and start time of the arbiter which wrote the
+    scoreboard at ``path``, and a dict per slot in use.
+    """
+    handle = open(path, "rb")
+    try:
+        data = handle.read()
+    finally:
+        handle.close()
+    if len(data) < ctypes.sizeof(_header):
+        raise ValueError("%s isn't a scoreboard." % path)
+    header = _header.from_buffer_copy(data)
+    if header.magic != MAGIC:
+        raise ValueError("%s isn't a scoreboard." % path)
+    size = min(header.size, (len(data) - ctypes.sizeof(_header)) //
+        ctypes.sizeof(_score))
+    scores = (_score * size).from_buffer_copy(data, ctypes.sizeof(_header))
+    ret = []
+    for score in scores:
+        if score.state == FREE:
+            continue
+        ret.append(dict((name, getattr(score, name)) for name in FIELDS))
+    return header.pid, header.started, ret
@@ -13,36 +13,45 @@ import gunicorn.http as http
 import gunicorn.http.wsgi as wsgi
 import gunicorn.util as util
 import gunicorn.workers.base as base
+from gunicorn.sock import can_reuse_port
+from gunicorn.workers.scoreboard import IDLE, READING, WRITING
+
+EPOLLEXCLUSIVE = getattr(select, "EPOLLEXCLUSIVE", 1 << 28)
 
 class SyncWorker(base.Worker):
+
+    reports_load = True
+    poller = None
     
     def run(self):
         # self.socket appears to lose its blocking status after
         # we fork in the arbiter. Reset it here.
         self.socket.setblocking(0)
 
+        if self.cfg.accept_mutex == "epoll" and hasattr(select, "epoll"):
+            self.poller = select.epoll()
+            self.poller.register(self.socket.fileno(),
+                    select.EPOLLIN | EPOLLEXCLUSIVE)
+            self.poller.register(self.PIPE[0], select.EPOLLIN)
+
         while self.alive:
             self.notify()
             
-            # Accept a connection. If we get an error telling us
-            # that no connection is waiting we fall down to the
-            # select which is where we'll wait for a bit for new
-            # workers to come give us some love.
-            try:
-                client, addr = self.socket.accept()
-                client.setblocking(1)
-                util.close_on_exec(client)
-                self.handle(client, addr)
+            # Accept a connection. If none is waiting we fall down to
+            # the select which is where we'll wait for a bit for new
+            # workers to come give us some love. Workers taking turns
+            # with the accept lock only accept while they hold it.
+            accepted = None
+            if self.accept_lock is None:
+                accepted = self.accept()
+            if accepted is not None:
+                self.handle(*accepted)
 
                 # Keep processing clients until no one is waiting. This
                 # prevents the need to select() for every client that we
                 # process.
                 continue
 
-            except socket.error, e:
-                if e[0] not in (errno.EAGAIN, errno.ECONNABORTED):
-                    raise
-
             # If our parent changed then we shut down.
             if self.ppid != os.getppid():
                 self.log.info("Parent changed, shutting down: %s" % self)
@@ -50,8 +59,11 @@ class SyncWorker(base.Worker):
             
             try:
                 self.notify()
-                ret = select.select([self.socket], [], self.PIPE, self.timeout)
-                if ret[0]:
+                if self.accept_lock is not None:
+                    accepted = self.accept_in_turn()
+                    if accepted is not None:
+                        self.handle(*accepted)
+                elif self.wait_listener():
                     continue
             except select.error, e:
                 if e[0] == errno.EINTR:
@@ -62,12 +74,95 @@ class SyncWorker(base.Worker):
                     else:
                         return
                 raise
+
+        if can_reuse_port(self.cfg):
+            self.drain()
+
+    def accept(self):
+        "Accept a connection, return None if none is waiting."
+        try:
+            client, addr = self.socket.accept()
+        except socket.error, e:
+            if e[0] not in (errno.EAGAIN, errno.ECONNABORTED):
+                raise
+            return None
+        client.setblocking(1)
+        util.close_on_exec(client)
+        return client, addr
+
+    def accept_in_turn(self):
+        """\
+        Accept a connection holding the accept lock, waiting up to
+        ``timeout`` seconds for one. The lock is only released once
+        accept() returned, so that the next worker to get it doesn't
+        wake up for the same connection, and before the connection is
+        served.
+        """
+        if not self.accept_lock.acquire(self.timeout):
+            return None
+        try:
+            accepted = self.accept()
+            if accepted is None and select.select([self.socket], [],
+                    self.PIPE, self.timeout)[0]:
+                accepted = self.accept()
+            return accepted
+        finally:
+            self.accept_lock.release()
+
+    def wait_listener(self):
+        """\
+        Wait up to ``timeout`` seconds for a connection to accept,
+        return True if there may be one. Depending on ``accept_mutex``
+        idle workers all wait on the listener, or only one of them is
+        woken up.
+        """
+        if self.poller is not None:
+            try:
+                return bool(self.poller.poll(self.timeout))
+            except IOError, e:
+                if e.errno == errno.EINTR:
+                    return False
+                raise
+
+        ret = select.select([self.socket], [], self.PIPE, self.timeout)
+        return bool(ret[0])
+
+    def drain(self):
+        """\
+        Serve the connections queued on a listener of our own before
+        closing it, the kernel would reset them otherwise.
+        """
+        while True:
+            try:
+                client, addr = self.socket.accept()
+            except socket.error, e:
+                if e[0] == errno.ECONNABORTED:
+                    continue
+                break
+            client.setblocking(1)
+            util.close_on_exec(client)
+            self.handle(client, addr)
+        util.close(self.socket.sock)
     
     def handle(self, client, addr):
+        parser = http.RequestParser(client)
         try:
-            parser = http.RequestParser(client)
+            self.score.set_state(READING)
             req = parser.next()
-            self.handle_request(req, client, addr)
+            served = 1
+            keepalive = self.handle_request(req, client, addr,
+                    self.can_keepalive(served))
+            while keepalive and self.wait_next(client, parser):
+                self.notify()
+                self.score.set_state(READING)
+                try:
+                    req = parser.next()
+                except StopIteration:
+                    # The client closed an idle connection.
+                    break
+                served += 1
+                keepalive = self.handle_request(req, client, addr,
+                        self.can_keepalive(served))
         except StopIteration:
             self.log.debug("Ignored premature client disconnection.")
         except socket.error, e:
@@ -79,35 +174,77 @@ class SyncWorker(base.Worker):
             self.log.exception("Error processing request.")
             self.handle_error(client, e)
         finally:    
+            self.score.received(parser.unreader.received)
+            self.score.set_state(IDLE)
             util.close(client)
 
-    def handle_request(self, req, client, addr):
+    def can_keepalive(self, served):
+        if not self.cfg.sync_keepalive or not self.alive:
+            return False
+        limit = self.cfg.keepalive_requests
+        return not limit or served < limit
+
+    def wait_next(self, client, parser):
+        """\
+        Wait for the next request on a Keep-Alive connection. Give up
+        when the connection stays idle for ``keepalive`` seconds, or
+        right away if it is idle while other clients are waiting to be
+        accepted, so that they don't wait behind it.
+        """
+        if len(parser.unreader.buf):
+            # Pipelined request
+            return True
+        try:
+            ret = select.select([client, self.socket], [], self.PIPE,
+                    self.cfg.keepalive)
+        except select.error, e:
+            if e[0] == errno.EINTR:
+                return False
+            raise
+        return client in ret[0] and self.alive
+
+    def handle_request(self, req, client, addr, keepalive=False):
+        """\
+        Handle a single request, return True if the connection can be
+        used for another one.
+        """
+        self.score.begin_request(req)
+        resp = None
         try:
             debug = self.cfg.debug or False
             self.cfg.pre_request(self, req)
             resp, environ = wsgi.create(req, client, addr,
                     self.address, self.cfg)
-            # Force the connection closed until someone shows
-            # a buffering proxy that supports Keep-Alive to
-            # the backend.
-            resp.force_close()
+            # Unless asked to, force the connection closed as
+            # Keep-Alive only makes sense behind a buffering proxy
+            # that supports it to the backend.
+            if not keepalive:
+                resp.force_close()
             self.nr += 1
-            if self.nr >= self.max_requests:
-                self.log.info("Autorestarting worker after current request.")
-                self.alive = False
+            if self.recycle():
+                resp.force_close()
             respiter = self.wsgi(environ, resp.start_response)
-            for item in respiter:
-                resp.write(item)
+            self.score.set_state(WRITING)
+            resp.set_framing(respiter)
+            if isinstance(respiter, environ['wsgi.file_wrapper']):
+                resp.write_file(respiter)
+            elif isinstance(respiter, (list, tuple)):
+                resp.writelines(respiter, last=True)
+            else:
+                for item in respiter:
+                    resp.write(item)
             resp.close()
             if hasattr(respiter, "close"):
                 respiter.close()
+            return not resp.should_close
         except socket.error:
             raise
         except Exception, e:
             # Only send back traceback in HTTP in debug mode.
             self.handle_error(client, e) 
-            return
+            return False
         finally:
+            self.score.end_request(resp is not None and resp.sent or 0)
             try:
                 self.cfg.post_request(self, req)
             except:
@@ -50,9 +50,12 @@ setup(
     gunicorn=gunicorn.app.wsgiapp:run
     gunicorn_django=gunicorn.app.djangoapp:run
     gunicorn_paster=gunicorn.app.pasterapp:run
+    gunicorn-status=gunicorn.status:run
 
     [gunicorn.workers]
     sync=gunicorn.workers.sync:SyncWorker
+    gthread=gunicorn.workers.gthread:ThreadWorker
+    epoll=gunicorn.workers.gepoll:EpollWorker
     eventlet=gunicorn.workers.geventlet:EventletWorker
     gevent=gunicorn.workers.ggevent:GeventWorker
     gevent_wsgi=gunicorn.workers.ggevent:GeventWSGIWorker
@@ -6,6 +6,11 @@
 import os
 import t
 
+from gunicorn.http.errors import InvalidHeader, InvalidHeaderName
+from gunicorn.http.body import ChunkedReader
+from gunicorn.http.message import Request, split_target
+from gunicorn.http.unreader import IterUnreader
+
 # from gunicorn.http import tee
 # 
 # @t.http_request("001.http")
@@ -147,5 +152,66 @@ import t
 #     t.eq(e['SCRIPT_NAME'], "/stuff")
 #     t.eq(e['PATH_INFO'], "/here")
 #     t.eq(e["wsgi.input"].read(), "")
-#     
+#
+
+def request(data, piece=None):
+    "Parse ``data`` received ``piece`` bytes at a time."
+    if piece is None:
+        piece = len(data)
+    return Request(IterUnreader([data[i:i+piece]
+        for i in range(0, len(data), piece)]))
+
+FOLDED = "GET / HTTP/1.1\r\nX-Long: a\r\n  b\r\n\tc\r\nHost: x\r\n\r\n"
+
+def test_obs_fold():
+    req = request(FOLDED)
+    t.eq(req.headers, [("X-LONG", "a\r\n  b\r\n\tc"), ("HOST", "x")])
+    t.eq(req.get_header("X-LONG"), "a\r\n  b\r\n\tc")
+
+def test_obs_fold_first_line():
+    # A continuation line needs a header to continue.
+    t.raises(InvalidHeader, request,
+        "GET / HTTP/1.1\r\n  b\r\nHost: x\r\n\r\n")
+    t.raises(InvalidHeaderName, request,
+        "GET / HTTP/1.1\r\n X: b\r\nHost: x\r\n\r\n")
+
+def test_repeated_headers():
+    req = request("GET / HTTP/1.1\r\nX-A: 1\r\nHost: x\r\nX-A: 2\r\n\r\n")
+    t.eq(req.headers, [("X-A", "1"), ("HOST", "x"), ("X-A", "2")])
+    t.eq(req.headers_index, {"X-A": ["1", "2"], "HOST": ["x"]})
+    t.eq(req.get_header("X-A"), "1")
+    t.eq(req.get_header("X-B", "none"), "none")
+
+def test_split_head():
+    # Every piece size splits lines, and the \r\n ending them, in
+    # every place.
+    data = FOLDED.replace("\r\n\r\n", "\r\nContent-Length: 4\r\n\r\nbody")
+    for piece in range(1, len(data) + 1):
+        req = request(data, piece)
+        t.eq(req.method, "GET")
+        t.eq(req.path, "/")
+        t.eq(req.headers, [("X-LONG", "a\r\n  b\r\n\tc"), ("HOST", "x"),
+            ("CONTENT-LENGTH", "4")])
+        t.eq(req.body.read(), "body")
+
+def test_chunked_over_length():
+    # Transfer-Encoding: chunked wins over Content-Length.
+    req = request("POST / HTTP/1.1\r\nContent-Length: 3\r\n"
+        "Transfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n0\r\n\r\n")
+    t.eq(isinstance(req.body.reader, ChunkedReader), True)
+    t.eq(req.body.read(), "hello")
+
+def test_target_params():
+    # Path parameters stay in the path of origin-form targets.
+    req = request("GET /a;p=1/b;q?x=1;y=2#frag HTTP/1.1\r\n\r\n")
+    t.eq(req.path, "/a;p=1/b;q")
+    t.eq(req.query, "x=1;y=2")
+    t.eq(req.fragment, "frag")
+
+def test_target_cache():
+    parts = split_target("/cached?a=1")
+    t.eq(parts, ("/cached", "a=1", ""))
+    t.eq(split_target("/cached?a=1") is parts, True)
+    req = request("GET /cached?a=1 HTTP/1.1\r\n\r\n")
+    t.eq((req.path, req.query, req.fragment), parts)
 
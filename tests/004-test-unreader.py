@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+
+from gunicorn.http.unreader import ByteBuffer, IterUnreader, SocketUnreader
+
+def test_buffer_read_write():
+    buf = ByteBuffer(4)
+    buf.write("hello ")
+    buf.write("world")
+    t.eq(len(buf), 11)
+    t.eq(buf.read(5), "hello")
+    t.eq(buf.peek(), " world")
+    t.eq(buf.find("w"), 1)
+    t.eq(buf.find("h"), -1)
+    t.eq(buf.startswith(" w"), True)
+    t.eq(buf.read(), " world")
+    t.eq(len(buf), 0)
+
+def test_buffer_compacts():
+    buf = ByteBuffer(8)
+    buf.write("abcdef")
+    t.eq(buf.read(4), "abcd")
+    buf.write("ghij")
+    t.eq(len(buf.data), 8)
+    t.eq(buf.read(), "efghij")
+
+def test_buffer_unread():
+    buf = ByteBuffer()
+    buf.write("abcdef")
+    buf.skip(3)
+    buf.unread("xy")
+    t.eq(buf.read(), "xydef")
+    buf.unread("123")
+    buf.unread("0")
+    t.eq(buf.read(), "0123")
+
+def test_unreader():
+    u = IterUnreader(iter(["ab", "cd", "ef"]))
+    t.eq(u.read(3), "abc")
+    u.unread("bc")
+    t.eq(u.read(), "bcd")
+    t.eq(u.read(10), "ef")
+    t.eq(u.read(), "")
+
+class FakeSocket(object):
+
+    def __init__(self, data):
+        self.data = data
+        self.recvs = []
+
+    def recv(self, size):
+        self.recvs.append(size)
+        ret, self.data = self.data[:size], self.data[size:]
+        return ret
+
+def test_socket_unreader_tops_up():
+    sock = FakeSocket("x" * 18292)
+    u = SocketUnreader(sock, 8192)
+    t.eq(u.read(100), "x" * 100)
+    t.eq(sock.recvs, [8192])
+    # A read of a whole chunk only asks for what it is short of.
+    t.eq(len(u.read(8192)), 8192)
+    t.eq(sock.recvs, [8192, 100])
+    t.eq(len(u.buf), 0)
+    t.eq(len(u.read(10000)), 10000)
+    t.eq(u.read(10), "")
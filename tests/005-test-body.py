@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+
+import os
+import tempfile
+
+from gunicorn.http.body import Body, ChunkedReader, LengthReader, spool
+from gunicorn.http.errors import ChunkMissingTerminator, InvalidChunkSize
+from gunicorn.http.message import Message
+from gunicorn.http.unreader import IterUnreader
+
+class FakeRequest(Message):
+
+    def __init__(self):
+        self.trailers = []
+
+CHUNKED = "3\r\nabc\r\n1;ext=1\r\nd\r\nA\r\n0123456789\r\n" \
+    "0\r\nX-Sum: 1\r\n\r\n"
+
+def body(chunks):
+    data = "".join(chunks)
+    return Body(LengthReader(IterUnreader(iter(chunks)), len(data)))
+
+def test_readline():
+    b = body(["ab", "c\nde", "f\n", "g"])
+    t.eq(b.readline(), "abc\n")
+    t.eq(b.readline(), "def\n")
+    t.eq(b.readline(), "g")
+    t.eq(b.readline(), "")
+
+def test_readline_size():
+    b = body(["abcdef\n", "gh\n"])
+    t.eq(b.readline(4), "abcd")
+    t.eq(b.readline(10), "ef\n")
+    t.eq(b.readline(2), "gh")
+    t.eq(b.readline(2), "\n")
+    t.eq(b.readline(2), "")
+
+def test_readline_large():
+    lines = ["%d\n" % i for i in range(10000)]
+    b = body(["".join(lines)])
+    t.eq(list(b), lines)
+
+def test_readlines():
+    b = body(["a\nb\n", "c\nd"])
+    t.eq(b.readlines(3), ["a\n", "b\n"])
+    t.eq(b.readlines(), ["c\n", "d"])
+    t.eq(b.readlines(), [])
+
+def test_spool_memory():
+    tmp, size = spool(body(["abc", "def"]), 10)
+    t.eq(size, 6)
+    t.eq(tmp._rolled, False)
+    t.eq(tmp.read(), "abcdef")
+    tmp.seek(0)
+    t.eq(tmp.read(3), "abc")
+
+def test_spool_file():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        tmp, size = spool(body(["x" * 100] * 10), 10, tmpdir)
+        t.eq(size, 1000)
+        t.eq(tmp._rolled, True)
+        t.eq(tmp.read(), "x" * 1000)
+    finally:
+        os.rmdir(tmpdir)
+
+def chunked(data, piece):
+    chunks = [data[i:i+piece] for i in range(0, len(data), piece)]
+    req = FakeRequest()
+    return req, ChunkedReader(req, IterUnreader(chunks))
+
+def test_chunked_read():
+    # Whichever way the body is split, chunk size lines included.
+    for piece in range(1, len(CHUNKED) + 1):
+        for size in (1, 2, 5, 100):
+            req, reader = chunked(CHUNKED, piece)
+            ret = []
+            data = reader.read(size)
+            while data:
+                ret.append(data)
+                data = reader.read(size)
+            t.eq("".join(ret), "abcd0123456789")
+            t.eq(req.trailers, [("X-SUM", "1")])
+
+def test_chunked_readinto():
+    for piece in range(1, len(CHUNKED) + 1):
+        for size in (1, 3, 100):
+            req, reader = chunked(CHUNKED, piece)
+            buf = bytearray(size)
+            ret = []
+            read = reader.readinto(buf)
+            while read:
+                ret.append(str(buf[:read]))
+                read = reader.readinto(buf)
+            t.eq("".join(ret), "abcd0123456789")
+
+def test_chunked_invalid():
+    req, reader = chunked("3\r\nabcXX1\r\nd\r\n0\r\n\r\n", 100)
+    t.raises(ChunkMissingTerminator, reader.read, 100)
+    req, reader = chunked("3\r\nabc\r\nzz\r\nd\r\n0\r\n\r\n", 100)
+    t.raises(InvalidChunkSize, reader.read, 100)
+    req, reader = chunked("3\r\nabc\r\n-1\r\nd\r\n0\r\n\r\n", 100)
+    t.raises(InvalidChunkSize, reader.read, 100)
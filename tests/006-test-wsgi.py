@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+
+import os
+import socket
+import tempfile
+import zlib
+from StringIO import StringIO
+
+from gunicorn.config import Config
+from gunicorn.http import wsgi
+from gunicorn.http.parser import RequestParser
+
+class Socket(object):
+    def __init__(self):
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+        return len(data)
+
+    sendall = send
+
+def environ(data, cfg=None):
+    req = RequestParser(StringIO(data)).next()
+    sock = Socket()
+    resp, env = wsgi.create(req, sock, ("10.0.0.1", 1234),
+            ("127.0.0.1", "8000"), cfg or Config())
+    return sock, env
+
+def test_environ():
+    sock, env = environ("GET /a%20b?x=1 HTTP/1.1\r\n"
+        "Host: example.com\r\n"
+        "Content-Type: text/plain\r\n"
+        "Content-Length: 0\r\n"
+        "X-Custom-Header: foo\r\n"
+        "\r\n")
+    t.eq(env["SERVER_PROTOCOL"], "HTTP/1.1")
+    t.eq(env["PATH_INFO"], "/a b")
+    t.eq(env["QUERY_STRING"], "x=1")
+    t.eq(env["SERVER_NAME"], "example.com")
+    t.eq(env["SERVER_PORT"], "80")
+    t.eq(env["REMOTE_ADDR"], "10.0.0.1")
+    t.eq(env["REMOTE_PORT"], "1234")
+    t.eq(env["CONTENT_TYPE"], "text/plain")
+    t.eq(env["CONTENT_LENGTH"], "0")
+    t.eq(env["HTTP_X_CUSTOM_HEADER"], "foo")
+    t.eq("HTTP_CONTENT_TYPE" in env, False)
+    t.eq(env["wsgi.url_scheme"], "http")
+
+def test_special_headers():
+    sock, env = environ("POST / HTTP/1.1\r\n"
+        "Host: example.com\r\n"
+        "Expect: 100-continue\r\n"
+        "X-Forwarded-For: 1.2.3.4, 5.6.7.8:90\r\n"
+        "X-Forwarded-SSL: on\r\n"
+        "Content-Length: 0\r\n"
+        "\r\n")
+    t.eq(sock.sent, ["HTTP/1.1 100 Continue\r\n\r\n"])
+    t.eq(env["wsgi.url_scheme"], "https")
+    t.eq(env["SERVER_PORT"], "443")
+    t.eq(env["REMOTE_ADDR"], "5.6.7.8")
+    t.eq(env["REMOTE_PORT"], "90")
+    t.eq(env["HTTP_EXPECT"], "100-continue")
+
+def test_upload_spool():
+    cfg = Config()
+    cfg.set("upload_spool_size", 1024)
+    sock, env = environ("POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n"
+        "\r\n5\r\nhello\r\n0\r\n\r\n", cfg)
+    t.eq(env["CONTENT_LENGTH"], "5")
+    t.eq(env["wsgi.input"].read(), "hello")
+    t.eq(env["wsgi.input"].seek(0), None)
+
+    # Requests without a body are left alone.
+    sock, env = environ("GET / HTTP/1.1\r\n\r\n", cfg)
+    t.eq(env["CONTENT_LENGTH"], "")
+    t.eq(hasattr(env["wsgi.input"], "seek"), False)
+    sock, env = environ("POST / HTTP/1.1\r\nContent-Length: 0\r\n\r\n",
+        cfg)
+    t.eq(env["CONTENT_LENGTH"], "0")
+    t.eq(hasattr(env["wsgi.input"], "seek"), False)
+
+def test_base_environ_copied():
+    cfg = Config()
+    sock, env = environ("GET / HTTP/1.0\r\nX-Forwarded-SSL: on\r\n\r\n", cfg)
+    t.eq(env["wsgi.url_scheme"], "https")
+    t.eq(env["SERVER_PROTOCOL"], "HTTP/1.0")
+    t.eq(wsgi.base_environ(cfg)["wsgi.url_scheme"], "http")
+    t.eq("HTTP_X_FORWARDED_SSL" in wsgi.base_environ(cfg), False)
+
+def test_header_key_cache_bounded():
+    for i in range(wsgi.MAX_HEADER_KEYS * 2):
+        t.eq(wsgi.header_key("X-%d" % i), "HTTP_X_%d" % i)
+    t.eq(len(wsgi._header_keys) <= wsgi.MAX_HEADER_KEYS, True)
+
+def response(chunked=False):
+    sock = Socket()
+    req = RequestParser(StringIO("GET / HTTP/1.1\r\n\r\n")).next()
+    resp = wsgi.Response(req, sock)
+    headers = [("Content-Type", "text/plain")]
+    if chunked:
+        headers.append(("Transfer-Encoding", "chunked"))
+    resp.start_response("200 OK", headers)
+    return sock, resp
+
+def test_response_single_write():
+    sock, resp = response()
+    resp.writelines(["hello", " ", "world"], last=True)
+    resp.close()
+    t.eq(len(sock.sent), 1)
+    head, body = sock.sent[0].split("\r\n\r\n", 1)
+    t.eq(head.startswith("HTTP/1.1 200 OK\r\n"), True)
+    t.eq(body, "hello world")
+
+def test_response_chunked():
+    sock, resp = response(chunked=True)
+    resp.write("hello")
+    resp.write("")
+    resp.write("world!")
+    resp.close()
+    t.eq(len(sock.sent), 3)
+    t.eq(sock.sent[0].split("\r\n\r\n", 1)[1], "5\r\nhello\r\n")
+    t.eq(sock.sent[1:], ["6\r\nworld!\r\n", "0\r\n\r\n"])
+
+def send_file(filelike, headers):
+    a, b = socket.socketpair()
+    req = RequestParser(StringIO("GET / HTTP/1.1\r\n\r\n")).next()
+    resp = wsgi.Response(req, a)
+    resp.start_response("200 OK", headers)
+    resp.write_file(wsgi.FileWrapper(filelike))
+    resp.close()
+    a.close()
+    data = []
+    chunk = b.recv(8192)
+    while chunk:
+        data.append(chunk)
+        chunk = b.recv(8192)
+    b.close()
+    return "".join(data).split("\r\n\r\n", 1)[1]
+
+def test_file_wrapper_sendfile():
+    tmp = tempfile.TemporaryFile()
+    tmp.write("x" * 100000 + "tail")
+    tmp.seek(10)
+    t.eq(send_file(tmp, [("Content-Length", "99994")]),
+        "x" * 99990 + "tail")
+    t.eq(tmp.tell(), 100004)
+
+def test_file_wrapper_content_length():
+    tmp = tempfile.TemporaryFile()
+    tmp.write("abcdef")
+    tmp.seek(0)
+    t.eq(send_file(tmp, [("Content-Length", "3")]), "abc")
+
+def test_file_wrapper_fallback():
+    t.eq(send_file(StringIO("abc" * 5000), []), "abc" * 5000)
+
+def framed(body, request="GET / HTTP/1.1\r\n\r\n", status="200 OK"):
+    sock = Socket()
+    req = RequestParser(StringIO(request)).next()
+    resp = wsgi.Response(req, sock)
+    resp.start_response(status, [("Content-Type", "text/plain")])
+    resp.set_framing(body)
+    for item in body:
+        resp.write(item)
+    resp.close()
+    head, body = "".join(sock.sent).split("\r\n\r\n", 1)
+    return dict(l.split(": ", 1) for l in head.split("\r\n")[1:]), body
+
+def test_framing_length():
+    headers, body = framed(["hello", " world"])
+    t.eq(headers["Content-Length"], "11")
+    t.eq(headers["Connection"], "keep-alive")
+    t.eq(body, "hello world")
+
+def test_framing_file():
+    tmp = tempfile.TemporaryFile()
+    tmp.write("abcdef")
+    tmp.seek(2)
+    headers, body = framed(wsgi.FileWrapper(tmp))
+    t.eq(headers["Content-Length"], "4")
+    t.eq(body, "cdef")
+
+def test_framing_chunked():
+    headers, body = framed(iter(["hello", "world"]))
+    t.eq(headers["Transfer-Encoding"], "chunked")
+    t.eq(headers["Connection"], "keep-alive")
+    t.eq(body, "5\r\nhello\r\n5\r\nworld\r\n0\r\n\r\n")
+
+def test_framing_http10():
+    headers, body = framed(iter(["hello"]),
+        request="GET / HTTP/1.0\r\nConnection: keep-alive\r\n\r\n")
+    t.eq("Transfer-Encoding" in headers, False)
+    t.eq(headers["Connection"], "close")
+    t.eq(body, "hello")
+
+def test_framing_no_body():
+    headers, body = framed(iter([]), status="304 Not Modified")
+    t.eq("Transfer-Encoding" in headers, False)
+    t.eq("Content-Length" in headers, False)
+    t.eq(headers["Connection"], "keep-alive")
+    headers, body = framed(iter([]),
+        request="HEAD / HTTP/1.1\r\n\r\n")
+    t.eq("Content-Length" in headers, False)
+    t.eq(headers["Connection"], "keep-alive")
+
+def test_response_buffer():
+    sock = Socket()
+    req = RequestParser(StringIO("GET / HTTP/1.1\r\n\r\n")).next()
+    cfg = Config()
+    cfg.set("response_buffer", 10)
+    resp = wsgi.Response(req, sock, cfg)
+    resp.start_response("200 OK", [("Transfer-Encoding", "chunked")])
+    for item in ["a", "b", "c", "", "d" * 5, "e" * 5, "f"]:
+        resp.write(item)
+    t.eq(len(sock.sent), 2)
+    resp.close()
+    t.eq(len(sock.sent), 3)
+    t.eq(sock.sent[0].split("\r\n\r\n", 1)[1], "3\r\nabc\r\n")
+    t.eq(sock.sent[1:], ["A\r\ndddddeeeee\r\n",
+        "1\r\nf\r\n0\r\n\r\n"])
+
+def compressed(body, accept="gzip", ctype="text/html", write=None):
+    cfg = Config()
+    cfg.set("compress_level", 6)
+    cfg.set("compress_min_size", 100)
+    a, b = socket.socketpair()
+    req = RequestParser(StringIO("GET / HTTP/1.1\r\n"
+        "Accept-Encoding: %s\r\n\r\n" % accept)).next()
+    resp = wsgi.Response(req, a, cfg)
+    resp.start_response("200 OK", [("Content-Type", ctype)])
+    resp.set_framing(body)
+    if isinstance(body, wsgi.FileWrapper):
+        resp.write_file(body)
+    else:
+        for item in body:
+            resp.write(item)
+    resp.close()
+    a.close()
+    data = []
+    chunk = b.recv(8192)
+    while chunk:
+        data.append(chunk)
+        chunk = b.recv(8192)
+    b.close()
+    head, body = "".join(data).split("\r\n\r\n", 1)
+    return dict(l.split(": ", 1) for l in head.split("\r\n")[1:]), body
+
+def dechunk(body):
+    ret = []
+    while True:
+        size, body = body.split("\r\n", 1)
+        size = int(size, 16)
+        if not size:
+            return "".join(ret)
+        ret.append(body[:size])
+        body = body[size+2:]
+
+def test_choose_encoding():
+    t.eq(wsgi.choose_encoding("gzip, deflate"), "gzip")
+    t.eq(wsgi.choose_encoding("gzip;q=0.5, deflate"), "deflate")
+    t.eq(wsgi.choose_encoding("gzip;q=0, *"), "deflate")
+    t.eq(wsgi.choose_encoding("identity"), None)
+    t.eq(wsgi.choose_encoding(None), None)
+
+def test_compress_gzip():
+    page = "<p>hello world</p>" * 100
+    headers, body = compressed(iter([page[:900], page[900:]]))
+    t.eq(headers["Content-Encoding"], "gzip")
+    t.eq(headers["Vary"], "Accept-Encoding")
+    t.eq(headers["Transfer-Encoding"], "chunked")
+    t.eq(zlib.decompress(dechunk(body), 16 + zlib.MAX_WBITS), page)
+
+def test_compress_deflate():
+    page = "<p>hello world</p>" * 100
+    headers, body = compressed([page], accept="deflate")
+    t.eq(headers["Content-Encoding"], "deflate")
+    t.eq(zlib.decompress(dechunk(body)), page)
+
+def test_compress_skipped():
+    page = "<p>hello world</p>" * 100
+    headers, body = compressed([page], accept="identity")
+    t.eq("Content-Encoding" in headers, False)
+    t.eq(headers["Vary"], "Accept-Encoding")
+    t.eq(body, page)
+    headers, body = compressed([page], ctype="image/png")
+    t.eq("Content-Encoding" in headers, False)
+    headers, body = compressed(["<p>short</p>"])
+    t.eq("Content-Encoding" in headers, False)
+
+def test_compress_precompressed():
+    tmpdir = tempfile.mkdtemp()
+    name = os.path.join(tmpdir, "page.html")
+    try:
+        f = open(name, "wb")
+        f.write("<p>hello world</p>" * 100)
+        f.close()
+        f = open(name + ".gz", "wb")
+        f.write("precompressed")
+        f.close()
+        headers, body = compressed(wsgi.FileWrapper(open(name, "rb")))
+        t.eq(headers["Content-Encoding"], "gzip")
+        t.eq(headers["Content-Length"], "13")
+        t.eq(body, "precompressed")
+    finally:
+        for fname in os.listdir(tmpdir):
+            os.unlink(os.path.join(tmpdir, fname))
+        os.rmdir(tmpdir)
+
+def test_framing_generator():
+    sock = Socket()
+    req = RequestParser(StringIO("GET / HTTP/1.1\r\n\r\n")).next()
+    resp = wsgi.Response(req, sock)
+    def app():
+        resp.start_response("200 OK", [("Content-Type", "text/plain")])
+        yield "hello"
+    body = app()
+    resp.set_framing(body)
+    for item in body:
+        resp.write(item)
+    resp.close()
+    t.eq("Transfer-Encoding: chunked" in sock.sent[0], True)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+import treq
+
+from StringIO import StringIO
+
+from gunicorn.http.parser import RequestParser
+from gunicorn.util import LRUCache
+
+TARGETS = [
+    "/",
+    "/stuff/here?foo=bar",
+    "/forums/1/topics/2375?page=1#posts-17408",
+    "/a;b/c;d?x=1",
+    "/a#b?c",
+    "/a?b#c?d",
+    "/?",
+    "//host/path",
+    "*",
+    "http://example.com/path?q=1#frag",
+    "http://example.com:8080/path",
+    "https://example.com",
+]
+
+def check_target(target):
+    src = StringIO("GET %s HTTP/1.1\r\n\r\n" % target)
+    req = RequestParser(src).next()
+    exp = treq.uri(target)
+    for name in ("scheme", "host", "port", "path", "query", "fragment"):
+        t.eq(getattr(req, name), exp[name])
+
+def test_targets():
+    for target in TARGETS:
+        yield check_target, target
+
+def test_targets_cached():
+    # A second parse is served from the cache.
+    for target in TARGETS:
+        yield check_target, target
+
+def test_lru_cache():
+    cache = LRUCache(4)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+    t.eq(cache.get("a"), 1)
+    cache.set("d", 4)
+    cache.set("e", 5)
+    t.eq(len(cache) <= 4, True)
+    t.eq(cache.get("a"), 1)
+    t.eq(cache.get("b"), None)
+    t.eq(cache.get("missing", 0), 0)
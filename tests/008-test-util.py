@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+
+import os
+import socket
+import threading
+import time
+
+from nose.plugins.skip import SkipTest
+
+from gunicorn import util
+
+def writev_read(bufs):
+    a, b = socket.socketpair()
+    received = []
+    def reader():
+        data = b.recv(65536)
+        while data:
+            received.append(data)
+            data = b.recv(65536)
+    thread = threading.Thread(target=reader)
+    thread.start()
+    try:
+        util.writev(a, bufs)
+    finally:
+        a.close()
+    thread.join()
+    b.close()
+    return "".join(received)
+
+def test_writev():
+    bufs = ["abc", "", "def", "\x00ghi"]
+    t.eq(writev_read(bufs), "abcdef\x00ghi")
+
+def test_writev_partial():
+    # Larger than the socket buffers, so writev returns short.
+    bufs = [chr(65 + i % 26) * 100000 for i in range(40)]
+    t.eq(writev_read(bufs), "".join(bufs))
+
+def test_writev_many():
+    bufs = ["%d," % i for i in range(util.IOV_MAX * 3)]
+    t.eq(writev_read(bufs), "".join(bufs))
+
+def test_shared_semaphore():
+    if not util.can_share_semaphore():
+        raise SkipTest()
+    sem = util.SharedSemaphore()
+    t.eq(sem.acquire(1), True)
+    pid = os.fork()
+    if pid == 0:
+        # Held by the parent, then recovered for it.
+        os._exit(int(not sem.acquire(0.05) and sem.acquire(5)))
+    time.sleep(0.2)
+    sem.recover(os.getpid())
+    t.eq(os.waitpid(pid, 0)[1] >> 8, 1)
+    t.eq(sem.shared.holder, pid)
+    sem.recover(pid)
+    t.eq(sem.acquire(0.05), True)
+
+def test_get_rss():
+    rss = util.get_rss()
+    if rss is None:
+        raise SkipTest()
+    t.gt(rss, 1024 * 1024)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+
+import os
+import socket
+import sys
+import threading
+
+from nose.plugins.skip import SkipTest
+
+from gunicorn import util
+from gunicorn.config import Config
+from gunicorn.workers.heartbeat import HeartbeatTable
+from gunicorn.workers.sync import SyncWorker
+
+def app(environ, start_response):
+    body = environ["PATH_INFO"]
+    start_response("200 OK", [("Content-Length", str(len(body)))])
+    return [body]
+
+def serve(cfg, data):
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(5)
+    worker = SyncWorker(0, 0, listener, None, 30, cfg)
+    worker.notify = lambda: None
+    worker.wsgi = app
+
+    client = socket.create_connection(listener.getsockname())
+    client.sendall(data)
+    conn, addr = listener.accept()
+    worker.handle(conn, addr)
+    listener.close()
+
+    ret = []
+    chunk = client.recv(8192)
+    while chunk:
+        ret.append(chunk)
+        chunk = client.recv(8192)
+    client.close()
+    return [l for l in "".join(ret).split("\r\n") if l.startswith("Connection")]
+
+REQUESTS = "GET /a HTTP/1.1\r\n\r\n" * 4
+
+def test_close():
+    t.eq(serve(Config(), REQUESTS), ["Connection: close"])
+
+def test_keepalive():
+    cfg = Config()
+    cfg.set("sync_keepalive", True)
+    cfg.set("keepalive_requests", 3)
+    t.eq(serve(cfg, REQUESTS), ["Connection: keep-alive"] * 2 +
+        ["Connection: close"])
+
+class Listener(object):
+    "Records who holds the accept lock when a connection is accepted."
+
+    def __init__(self, sock, lock):
+        self.sock = sock
+        self.lock = lock
+        self.holders = []
+
+    def accept(self):
+        self.holders.append(self.lock.shared.holder)
+        return self.sock.accept()
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+def run_worker(cfg, accept_lock=None):
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(5)
+    if accept_lock is not None:
+        listener = Listener(listener, accept_lock)
+    worker = SyncWorker(0, os.getppid(), listener, None, 0.2, cfg)
+    worker.notify = lambda: None
+    worker.wsgi = app
+    worker.accept_lock = accept_lock
+    worker.PIPE = os.pipe()
+    map(util.set_non_blocking, worker.PIPE)
+    thread = threading.Thread(target=worker.run)
+    thread.setDaemon(True)
+    thread.start()
+    try:
+        for path in ("/a", "/b"):
+            client = socket.create_connection(listener.getsockname())
+            client.sendall("GET %s HTTP/1.1\r\n\r\n" % path)
+            t.eq(client.recv(4096).split("\r\n\r\n")[1], path)
+            client.close()
+    finally:
+        worker.alive = False
+        thread.join(2)
+        listener.close()
+    return listener
+
+def test_accept_mutex_epoll():
+    cfg = Config()
+    cfg.set("accept_mutex", "epoll")
+    run_worker(cfg)
+
+def test_accept_mutex_lock():
+    if not util.can_share_semaphore():
+        raise SkipTest()
+    cfg = Config()
+    cfg.set("accept_mutex", "lock")
+    lock = util.SharedSemaphore()
+    listener = run_worker(cfg, lock)
+    t.eq(lock.acquire(1), True)
+    # Connections are only accepted holding the lock.
+    t.gt(len(listener.holders), 0)
+    t.eq(set(listener.holders), set([os.getpid()]))
+
+def recycling_worker(**settings):
+    cfg = Config()
+    for name, value in settings.items():
+        cfg.set(name, value)
+    worker = SyncWorker(0, 0, socket.socket(), None, 30, cfg)
+    worker.tmp = HeartbeatTable(1).acquire()
+    return worker
+
+def test_max_requests_jitter():
+    limits = set(recycling_worker(max_requests=100,
+        max_requests_jitter=10).max_requests for i in range(50))
+    t.eq(min(limits) >= 100 and max(limits) <= 110, True)
+    t.gt(len(limits), 1)
+    t.eq(recycling_worker(max_requests_jitter=10).max_requests, sys.maxint)
+
+def test_recycle():
+    worker = recycling_worker(max_requests=2, max_restarting=0)
+    worker.nr = 1
+    t.eq(worker.recycle(), False)
+    worker.nr = 2
+    t.eq(worker.recycle(), True)
+    t.eq(worker.alive, False)
+
+def test_recycle_staggered():
+    worker = recycling_worker(max_lifetime=10)
+    t.eq(worker.recycle(), False)
+    worker.started -= 10
+    t.eq(worker.retire_reason(), "10 seconds")
+    # The arbiter lets it go.
+    t.eq(worker.recycle(), False)
+    t.eq(worker.alive, True)
+    t.eq(worker.tmp.retiring, True)
+
+def test_recycle_rss():
+    if util.get_rss() is None:
+        raise SkipTest()
+    worker = recycling_worker(max_rss=1)
+    t.isin("MB", worker.retire_reason())
+    worker = recycling_worker(max_rss=1024 * 1024)
+    t.eq(worker.retire_reason(), None)
+
+def test_recycle_rss_interval():
+    calls = []
+    def get_rss():
+        calls.append(1)
+        return 2 * 1024 * 1024
+    saved, util.get_rss = util.get_rss, get_rss
+    try:
+        worker = recycling_worker()
+        t.eq(worker.retire_reason(), None)
+        t.eq(len(calls), 0)
+        worker = recycling_worker(max_rss=1)
+        t.eq(worker.retire_reason(), "using 2MB")
+        t.eq(worker.retire_reason(), None)
+        t.eq(len(calls), 1)
+        worker.rss_checked -= worker.RSS_INTERVAL
+        t.eq(worker.retire_reason(), "using 2MB")
+        t.eq(len(calls), 2)
+    finally:
+        util.get_rss = saved
+
+def test_notify_interval():
+    # The arbiter hands workers half of the timeout setting.
+    t.eq(SyncWorker(0, 0, socket.socket(), None, 15, Config())
+        .notify_interval(), 1.0)
+    t.eq(SyncWorker(0, 0, socket.socket(), None, 0.5, Config())
+        .notify_interval(), 0.25)
+
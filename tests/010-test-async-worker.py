@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+
+from __future__ import with_statement
+
+import t
+
+import select
+import socket
+
+from gunicorn import util
+from gunicorn.config import Config
+from gunicorn.workers.async import AsyncWorker
+
+class Timeout(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+class Worker(AsyncWorker):
+    def timeout_ctx(self):
+        return Timeout()
+
+def app(environ, start_response):
+    body = environ["PATH_INFO"]
+    start_response("200 OK", [("Content-Length", str(len(body)))])
+    return [body]
+
+def connect(cfg, data, wsgi=app):
+    listener = socket.socket()
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(5)
+    worker = Worker(0, 0, listener, None, 30, cfg)
+    worker.wsgi = wsgi
+
+    client = socket.create_connection(listener.getsockname())
+    client.sendall(data)
+    client.shutdown(socket.SHUT_WR)
+    conn, addr = listener.accept()
+    listener.close()
+    return worker, client, conn, addr
+
+def read_all(client):
+    ret = []
+    chunk = client.recv(8192)
+    while chunk:
+        ret.append(chunk)
+        chunk = client.recv(8192)
+    client.close()
+    return "".join(ret)
+
+def serve(cfg, data):
+    worker, client, conn, addr = connect(cfg, data)
+
+    writes = []
+    writev = util.writev
+    def counting_writev(sock, bufs):
+        writes.append(len(bufs))
+        return writev(sock, bufs)
+    util.writev = counting_writev
+    try:
+        worker.handle(conn, addr)
+    finally:
+        util.writev = writev
+    return writes, read_all(client)
+
+REQUESTS = "".join(["GET /%d HTTP/1.1\r\n\r\n" % i for i in range(5)])
+
+def test_pipelined():
+    writes, data = serve(Config(), REQUESTS)
+    t.eq(len(writes), 1)
+    t.eq(data.count("HTTP/1.1 200 OK"), 5)
+    bodies = [part.split("\r\n\r\n", 1)[1][:2]
+        for part in data.split("HTTP/1.1 200 OK")[1:]]
+    t.eq(bodies, ["/0", "/1", "/2", "/3", "/4"])
+
+def test_pipeline_depth():
+    cfg = Config()
+    cfg.set("pipeline_depth", 2)
+    writes, data = serve(cfg, REQUESTS)
+    t.eq(len(writes), 3)
+    t.eq(data.count("HTTP/1.1 200 OK"), 5)
+
+def test_streaming():
+    received = []
+    def streaming(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        def body():
+            yield "first"
+            environ["gunicorn.flush"]()
+            received.append(arrived())
+            yield "second"
+            yield ""
+            received.append(arrived())
+        return body()
+
+    # Nothing was pipelined behind the request, so what the generator
+    # flushes reaches the client before it goes on.
+    worker, client, conn, addr = connect(Config(), "GET / HTTP/1.1\r\n\r\n",
+        streaming)
+
+    def arrived():
+        "How much the client can read, without consuming it."
+        if not select.select([client], [], [], 1.0)[0]:
+            return 0
+        return len(client.recv(8192, socket.MSG_PEEK))
+
+    worker.handle(conn, addr)
+    data = read_all(client)
+    t.eq(received[0] > 0, True)
+    t.eq(received[1] > received[0], True)
+    t.eq(data.split("\r\n\r\n", 1)[1],
+        "5\r\nfirst\r\n6\r\nsecond\r\n0\r\n\r\n")
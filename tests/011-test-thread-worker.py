@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+
+import os
+import resource
+import socket
+import threading
+import time
+
+from nose.plugins.skip import SkipTest
+
+from gunicorn import util
+from gunicorn.config import Config
+from gunicorn.workers.gthread import ThreadWorker
+
+def app(environ, start_response):
+    if environ["PATH_INFO"] == "/slow":
+        time.sleep(0.3)
+    body = "%s %s" % (environ["PATH_INFO"], environ["wsgi.multithread"])
+    start_response("200 OK", [("Content-Length", str(len(body)))])
+    return [body]
+
+def start_worker(threads=4):
+    cfg = Config()
+    cfg.set("threads", threads)
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(16)
+    worker = ThreadWorker(0, os.getppid(), listener, None, 30, cfg)
+    worker.notify = lambda: None
+    worker.wsgi = app
+    worker.PIPE = os.pipe()
+    map(util.set_non_blocking, worker.PIPE)
+    thread = threading.Thread(target=worker.run)
+    thread.setDaemon(True)
+    thread.start()
+    return worker, thread, listener.getsockname()
+
+def stop_worker(worker, thread):
+    worker.alive = False
+    thread.join(5)
+
+def request(sock, path):
+    sock.sendall("GET %s HTTP/1.1\r\n\r\n" % path)
+    data = ""
+    while "\r\n\r\n" not in data:
+        data += sock.recv(4096)
+    head, body = data.split("\r\n\r\n", 1)
+    length = int([l for l in head.split("\r\n")
+        if l.startswith("Content-Length")][0].split(": ")[1])
+    while len(body) < length:
+        body += sock.recv(4096)
+    return head, body
+
+def test_keepalive():
+    worker, thread, addr = start_worker()
+    try:
+        sock = socket.create_connection(addr)
+        for i in range(3):
+            head, body = request(sock, "/%d" % i)
+            t.eq(body, "/%d True" % i)
+            t.eq("Connection: keep-alive" in head, True)
+        sock.close()
+    finally:
+        stop_worker(worker, thread)
+
+def test_concurrent():
+    worker, thread, addr = start_worker()
+    try:
+        socks = [socket.create_connection(addr) for i in range(4)]
+        start = time.time()
+        for sock in socks:
+            sock.sendall("GET /slow HTTP/1.1\r\n\r\n")
+        for sock in socks:
+            t.eq(sock.recv(4096).split("\r\n\r\n", 1)[1], "/slow True")
+            sock.close()
+        t.eq(time.time() - start < 1.0, True)
+    finally:
+        stop_worker(worker, thread)
+
+def test_idle_connections():
+    worker, thread, addr = start_worker(threads=2)
+    try:
+        # Connections that send nothing don't take up the threads.
+        silent = [socket.create_connection(addr) for i in range(4)]
+        sock = socket.create_connection(addr)
+        sock.settimeout(5)
+        head, body = request(sock, "/a")
+        t.eq(body, "/a True")
+        sock.close()
+        for conn in silent:
+            conn.close()
+    finally:
+        stop_worker(worker, thread)
+
+def test_idle_connections_expire():
+    worker, thread, addr = start_worker()
+    try:
+        worker.cfg.set("keepalive", 0)
+        sock = socket.create_connection(addr)
+        sock.settimeout(5)
+        t.eq(sock.recv(4096), "")
+        sock.close()
+    finally:
+        stop_worker(worker, thread)
+
+def test_high_fds():
+    if resource.getrlimit(resource.RLIMIT_NOFILE)[0] < 1200:
+        raise SkipTest("Not enough file descriptors")
+    # Push the connections past FD_SETSIZE, which select() can't watch.
+    reserved = [os.open(os.devnull, os.O_RDONLY) for i in range(1100)]
+    try:
+        worker, thread, addr = start_worker()
+        try:
+            sock = socket.create_connection(addr)
+            sock.settimeout(5)
+            for i in range(2):
+                head, body = request(sock, "/%d" % i)
+                t.eq(body, "/%d True" % i)
+            sock.close()
+            t.eq(thread.isAlive(), True)
+        finally:
+            stop_worker(worker, thread)
+    finally:
+        for fd in reserved:
+            os.close(fd)
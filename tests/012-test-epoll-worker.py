@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from gunicorn import util
+from gunicorn.config import Config
+from gunicorn.http.errors import InvalidChunkSize
+from gunicorn.http.unreader import ByteBuffer
+from gunicorn.workers import gepoll
+from gunicorn.workers.gepoll import ChunkScanner, EpollWorker
+
+def app(environ, start_response):
+    if environ["PATH_INFO"] == "/slow":
+        time.sleep(0.3)
+    body = "%s %s %s" % (environ["PATH_INFO"], environ["wsgi.multithread"],
+        environ["wsgi.input"].read())
+    start_response("200 OK", [("Content-Length", str(len(body)))])
+    return [body]
+
+def start_worker(threads=1, **settings):
+    cfg = Config()
+    cfg.set("threads", threads)
+    for name, value in settings.items():
+        cfg.set(name, value)
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(16)
+    worker = EpollWorker(0, os.getppid(), listener, None, 30, cfg)
+    worker.notify = lambda: None
+    worker.wsgi = app
+    worker.PIPE = os.pipe()
+    map(util.set_non_blocking, worker.PIPE)
+    thread = threading.Thread(target=worker.run)
+    thread.setDaemon(True)
+    thread.start()
+    return worker, thread, listener.getsockname()
+
+def stop_worker(worker, thread):
+    worker.alive = False
+    thread.join(5)
+
+def read_response(sock):
+    data = ""
+    while "\r\n\r\n" not in data:
+        data += sock.recv(4096)
+    head, body = data.split("\r\n\r\n", 1)
+    length = int([l for l in head.split("\r\n")
+        if l.startswith("Content-Length")][0].split(": ")[1])
+    while len(body) < length:
+        body += sock.recv(4096)
+    return head, body
+
+def scan(data, pieces):
+    buf = ByteBuffer()
+    scanner = ChunkScanner(0)
+    ends = []
+    for piece in pieces:
+        buf.write(data[:piece])
+        data = data[piece:]
+        ends.append(scanner.scan(buf))
+    return ends
+
+def test_chunk_scanner():
+    body = "3\r\nabc\r\n10\r\n%s\r\n0\r\n\r\nGET" % ("x" * 16)
+    size = len(body) - 3
+    t.eq(scan(body, [len(body)]), [size])
+    t.eq(scan(body, [1] * len(body))[size-1:], [size] * 4)
+    t.eq(scan(body, [1] * len(body))[:size-1], [None] * (size - 1))
+    t.eq(scan(body, [7, 12, 100]), [None, None, size])
+
+def test_chunk_scanner_trailers():
+    body = "3\r\nabc\r\n0\r\nX-Sum: 1\r\n\r\n"
+    t.eq(scan(body, [len(body) - 2, 2]), [None, len(body)])
+    t.raises(InvalidChunkSize, scan, "zz\r\n", [4])
+
+def test_keepalive():
+    worker, thread, addr = start_worker()
+    try:
+        sock = socket.create_connection(addr)
+        for i in range(3):
+            sock.sendall("GET /%d HTTP/1.1\r\n\r\n" % i)
+            head, body = read_response(sock)
+            t.eq(body, "/%d False " % i)
+            t.eq("Connection: keep-alive" in head, True)
+        sock.close()
+    finally:
+        stop_worker(worker, thread)
+
+def test_slow_client():
+    worker, thread, addr = start_worker()
+    try:
+        req = "POST /post HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello"
+        slow = socket.create_connection(addr)
+        slow.sendall(req[:20])
+        # The partial request doesn't hold up other clients.
+        sock = socket.create_connection(addr)
+        sock.sendall("GET /other HTTP/1.1\r\n\r\n")
+        t.eq(read_response(sock)[1], "/other False ")
+        for i in range(20, len(req)):
+            slow.sendall(req[i])
+        t.eq(read_response(slow)[1], "/post False hello")
+        sock.close()
+        slow.close()
+    finally:
+        stop_worker(worker, thread)
+
+def test_pipelined():
+    worker, thread, addr = start_worker()
+    try:
+        sock = socket.create_connection(addr)
+        sock.sendall("GET /1 HTTP/1.1\r\n\r\nGET /2 HTTP/1.1\r\n\r\n")
+        data = ""
+        while not data.endswith("/2 False "):
+            data += sock.recv(4096)
+        t.eq([r.split("\r\n\r\n")[1] for r in data.split("HTTP/1.1 ")[1:]],
+            ["/1 False ", "/2 False "])
+        sock.close()
+    finally:
+        stop_worker(worker, thread)
+
+def test_threads():
+    worker, thread, addr = start_worker(threads=4)
+    try:
+        socks = [socket.create_connection(addr) for i in range(4)]
+        start = time.time()
+        for sock in socks:
+            sock.sendall("GET /slow HTTP/1.1\r\n\r\n")
+        for sock in socks:
+            t.eq(read_response(sock)[1], "/slow True ")
+            sock.close()
+        t.eq(time.time() - start < 1.0, True)
+    finally:
+        stop_worker(worker, thread)
+
+def test_chunked_upload():
+    worker, thread, addr = start_worker()
+    try:
+        sock = socket.create_connection(addr)
+        sock.sendall("POST /up HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n")
+        for i in range(20):
+            chunk = "x" * (i + 10)
+            data = "%X\r\n%s\r\n" % (len(chunk), chunk)
+            # Split up so that chunk size lines straddle receives.
+            for j in range(0, len(data), 7):
+                sock.sendall(data[j:j+7])
+        sock.sendall("0\r\n\r\n")
+        head, body = read_response(sock)
+        t.eq(body, "/up False " + "".join(["x" * (i + 10) for i in range(20)]))
+        sock.close()
+    finally:
+        stop_worker(worker, thread)
+
+def test_body_too_large():
+    worker, thread, addr = start_worker(max_buffered_body=10)
+    try:
+        sock = socket.create_connection(addr)
+        sock.sendall("POST / HTTP/1.1\r\nContent-Length: 11\r\n\r\n")
+        head, body = read_response(sock)
+        t.eq(head.split("\r\n")[0], "HTTP/1.1 413 Request Entity Too Large")
+        sock.close()
+
+        sock = socket.create_connection(addr)
+        sock.sendall("POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+            "20\r\n" + "x" * 20)
+        head, body = read_response(sock)
+        t.eq(head.split("\r\n")[0], "HTTP/1.1 413 Request Entity Too Large")
+        sock.close()
+    finally:
+        stop_worker(worker, thread)
+
+def test_large_response():
+    def big(environ, start_response):
+        start_response("200 OK", [("Content-Length", str(4 * 1024 * 1024))])
+        return ["x" * (1024 * 1024)] * 4
+    worker, thread, addr = start_worker()
+    worker.wsgi = big
+    try:
+        sock = socket.create_connection(addr)
+        sock.sendall("GET / HTTP/1.1\r\n\r\n")
+        # Let the worker fill up the socket buffers.
+        time.sleep(0.1)
+        head, body = read_response(sock)
+        t.eq(len(body), 4 * 1024 * 1024)
+        sock.close()
+    finally:
+        stop_worker(worker, thread)
+
+def test_streaming():
+    for threads in (1, 2):
+        resume = threading.Event()
+        def stream(environ, start_response):
+            start_response("200 OK", [("Content-Type", "text/plain")])
+            yield "first"
+            resume.wait(5)
+            yield "second"
+        worker, thread, addr = start_worker(threads=threads)
+        worker.wsgi = stream
+        try:
+            sock = socket.create_connection(addr)
+            sock.settimeout(5)
+            sock.sendall("GET / HTTP/1.1\r\n\r\n")
+            # The first part arrives while the application still runs.
+            data = ""
+            while not data.endswith("first\r\n"):
+                data += sock.recv(4096)
+            resume.set()
+            while not data.endswith("0\r\n\r\n"):
+                data += sock.recv(4096)
+            t.isin("second", data)
+            sock.close()
+        finally:
+            stop_worker(worker, thread)
+
+def test_backpressure():
+    produced = []
+    def big(environ, start_response):
+        start_response("200 OK", [("Content-Length", str(16 * 1024 * 1024))])
+        for i in range(16):
+            produced.append(i)
+            yield "x" * (1024 * 1024)
+    for threads in (1, 2):
+        del produced[:]
+        worker, thread, addr = start_worker(threads=threads)
+        worker.wsgi = big
+        try:
+            sock = socket.create_connection(addr)
+            sock.sendall("GET / HTTP/1.1\r\n\r\n")
+            time.sleep(0.2)
+            # The application waits for the client to read.
+            t.eq(len(produced) < 16, True)
+            head, body = read_response(sock)
+            t.eq(len(body), 16 * 1024 * 1024)
+            sock.close()
+        finally:
+            stop_worker(worker, thread)
+
+def test_sendfile():
+    if not util.can_sendfile():
+        return
+    fd, path = tempfile.mkstemp()
+    os.write(fd, "".join([chr(i % 256) for i in range(256)]) * 8192)
+    os.close(fd)
+    calls = []
+    sendfile_once = util.sendfile_once
+    def counting(*args):
+        calls.append(args)
+        return sendfile_once(*args)
+    def send(environ, start_response):
+        t.eq(isinstance(environ["gunicorn.socket"], socket.socket), True)
+        start_response("200 OK", [])
+        return environ["wsgi.file_wrapper"](open(path, "rb"))
+    util.sendfile_once = counting
+    worker, thread, addr = start_worker(threads=2)
+    worker.wsgi = send
+    try:
+        sock = socket.create_connection(addr)
+        sock.sendall("GET / HTTP/1.1\r\n\r\n")
+        head, body = read_response(sock)
+        t.eq(body, open(path, "rb").read())
+        t.eq(len(calls) > 0, True)
+        sock.close()
+    finally:
+        stop_worker(worker, thread)
+        util.sendfile_once = sendfile_once
+        os.unlink(path)
+
+def test_read_ahead():
+    worker, thread, addr = start_worker(threads=2)
+    try:
+        sock = socket.create_connection(addr)
+        sock.sendall("GET /slow HTTP/1.1\r\n\r\n")
+        time.sleep(0.05)
+        # Pipelined requests sent while the first one is served aren't
+        # all read into memory.
+        sock.setblocking(0)
+        pipelined = "GET /next HTTP/1.1\r\n\r\n" * 20000
+        sent = 0
+        try:
+            while sent < len(pipelined):
+                sent += sock.send(pipelined[sent:sent + 65536])
+        except socket.error:
+            pass
+        time.sleep(0.1)
+        for conn in worker.conns.values():
+            t.eq(len(conn.inbuf) < gepoll.MAX_READ_AHEAD + gepoll.RECV_SIZE,
+                True)
+        sock.close()
+    finally:
+        stop_worker(worker, thread)
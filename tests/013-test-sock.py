@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+
+import os
+import select
+import socket
+import struct
+
+from nose.plugins.skip import SkipTest
+
+from gunicorn import sock
+from gunicorn.config import Config
+
+def reuse_port_config():
+    cfg = Config()
+    cfg.set("bind", "127.0.0.1:0")
+    cfg.set("reuse_port", True)
+    return cfg
+
+def accept_all(listener):
+    count = 0
+    while select.select([listener], [], [], 0.2)[0]:
+        client, addr = listener.accept()
+        client.close()
+        count += 1
+    return count
+
+def test_can_reuse_port():
+    cfg = Config()
+    t.eq(sock.can_reuse_port(cfg), False)
+    cfg.set("reuse_port", True)
+    t.eq(sock.can_reuse_port(cfg), sock.SO_REUSEPORT is not None)
+    cfg.set("bind", "unix:/tmp/gunicorn.sock")
+    t.eq(sock.can_reuse_port(cfg), False)
+
+def test_reuse_port():
+    if sock.SO_REUSEPORT is None:
+        raise SkipTest("SO_REUSEPORT isn't available")
+    cfg = reuse_port_config()
+    holder = sock.create_socket(cfg)
+    port = holder.getsockname()[1]
+    cfg.set("bind", "127.0.0.1:%d" % port)
+    listeners = [sock.create_worker_socket(cfg) for i in range(2)]
+    try:
+        # The arbiter's socket only holds the address.
+        t.raises(socket.error, holder.accept)
+        clients = [socket.create_connection(("127.0.0.1", port))
+            for i in range(32)]
+        counts = [accept_all(l) for l in listeners]
+        t.eq(sum(counts), 32)
+        t.eq(0 in counts, False)
+        for client in clients:
+            client.close()
+    finally:
+        for l in listeners + [holder]:
+            l.sock.close()
+
+def test_listen_queue():
+    cfg = Config()
+    cfg.set("bind", "127.0.0.1:0")
+    listener = sock.create_socket(cfg)
+    port = listener.getsockname()[1]
+    try:
+        queue = sock.listen_queue(listener)
+        if queue is None:
+            raise SkipTest("The listen queue isn't available")
+        t.eq(queue, (0, cfg.backlog))
+        clients = [socket.create_connection(("127.0.0.1", port))
+            for i in range(3)]
+        t.eq(sock.listen_queue(listener)[0], 3)
+        # As with the sockets of the workers
+        t.eq(sock.proc_listen_queue(port, socket.AF_INET, cfg.backlog),
+            (3, cfg.backlog))
+        t.eq(accept_all(listener), 3)
+        t.eq(sock.listen_queue(listener)[0], 0)
+        for client in clients:
+            client.close()
+    finally:
+        listener.sock.close()
+
+def test_unix_listen_queue():
+    path = "/tmp/gunicorn-test-%d.sock" % os.getpid()
+    listener = socket.socket(socket.AF_UNIX)
+    try:
+        listener.bind(path)
+        listener.listen(7)
+        queue = sock.unix_listen_queue(listener)
+        if queue is None:
+            raise SkipTest("sock_diag isn't available")
+        t.eq(queue, (0, 7))
+        clients = []
+        for i in range(3):
+            client = socket.socket(socket.AF_UNIX)
+            client.connect(path)
+            clients.append(client)
+        t.eq(sock.unix_listen_queue(listener), (3, 7))
+        for client in clients:
+            client.close()
+    finally:
+        listener.close()
+        os.unlink(path)
+
+def test_parse_unix_diag():
+    rqlen = struct.pack("=HHII", 12, sock.UNIX_DIAG_RQLEN, 2, 5)
+    other = struct.pack("=HH", 5, 1) + "x\0\0\0"
+    def reply(attrs, kind=sock.SOCK_DIAG_BY_FAMILY, length=None):
+        if length is None:
+            length = 32 + len(attrs)
+        return struct.pack("=IHHII", length, kind, 0, 1, 0) + "\0" * 16 + \
+            attrs
+    t.eq(sock.parse_unix_diag(reply(other + rqlen)), (2, 5))
+    # Error messages, short or truncated replies and bogus attributes
+    t.eq(sock.parse_unix_diag(reply(rqlen, kind=2)), None)
+    t.eq(sock.parse_unix_diag(""), None)
+    t.eq(sock.parse_unix_diag(reply(rqlen)[:5]), None)
+    t.eq(sock.parse_unix_diag(reply(rqlen)[:38]), None)
+    t.eq(sock.parse_unix_diag(reply(rqlen, length=40)), None)
+    t.eq(sock.parse_unix_diag(reply(struct.pack("=HH", 2, 1))), None)
+    t.eq(sock.parse_unix_diag(reply(struct.pack("=HHI", 8,
+        sock.UNIX_DIAG_RQLEN, 2))), None)
+
+def test_switch_reuse_port():
+    if sock.SO_REUSEPORT is None:
+        raise SkipTest("SO_REUSEPORT isn't available")
+    cfg = Config()
+    cfg.set("bind", "127.0.0.1:0")
+    old = sock.create_socket(cfg)
+    port = old.getsockname()[1]
+    cfg.set("bind", "127.0.0.1:%d" % port)
+    # Turned on while old workers still listen on the shared socket
+    cfg.set("reuse_port", True)
+    holder = sock.switch_reuse_port(old, cfg)
+    worker = sock.create_worker_socket(cfg)
+    try:
+        t.raises(socket.error, holder.accept)
+        client = socket.create_connection(("127.0.0.1", port))
+        t.eq(accept_all(worker), 1)
+        client.close()
+
+        # And off again while the worker still listens
+        cfg.set("reuse_port", False)
+        listener = sock.switch_reuse_port(holder, cfg)
+        t.eq(listener, holder)
+        clients = [socket.create_connection(("127.0.0.1", port))
+            for i in range(16)]
+        t.eq(accept_all(listener) + accept_all(worker), 16)
+        for client in clients:
+            client.close()
+    finally:
+        worker.sock.close()
+        holder.sock.close()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+
+import os
+import time
+
+from gunicorn.workers.heartbeat import HeartbeatTable
+
+def test_notify_across_fork():
+    table = HeartbeatTable(4)
+    heartbeat = table.acquire()
+    t.eq(heartbeat.booted, False)
+    start = heartbeat.last_update
+    time.sleep(0.01)
+    pid = os.fork()
+    if pid == 0:
+        heartbeat.notify()
+        os._exit(0)
+    os.waitpid(pid, 0)
+    t.eq(heartbeat.booted, True)
+    t.gt(heartbeat.last_update, start)
+
+def test_slots():
+    table = HeartbeatTable(2)
+    a, b = table.acquire(), table.acquire()
+    t.eq(table.acquire(), None)
+    a.notify()
+    a.close()
+    a.close()
+    c = table.acquire()
+    t.eq(c.index, a.index)
+    t.eq(c.booted, False)
+    t.eq(table.acquire(), None)
+
+def test_retire():
+    table = HeartbeatTable(1)
+    heartbeat = table.acquire()
+    t.eq(heartbeat.retiring, False)
+    pid = os.fork()
+    if pid == 0:
+        heartbeat.retire()
+        os._exit(0)
+    os.waitpid(pid, 0)
+    t.eq(heartbeat.retiring, True)
+    heartbeat.close()
+    t.eq(table.acquire().retiring, False)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+
+import os
+import socket
+import tempfile
+
+from gunicorn.config import Config
+from gunicorn.status import render
+from gunicorn.workers.scoreboard import Scoreboard, read_scoreboard, \
+IDLE, READING, APP
+from gunicorn.workers.async import AsyncWorker
+from gunicorn.workers.base import Worker
+from gunicorn.workers.gepoll import EpollWorker
+from gunicorn.workers.gthread import ThreadWorker
+from gunicorn.workers.sync import SyncWorker
+
+def app(environ, start_response):
+    start_response("200 OK", [("Content-Length", "5")])
+    return ["hello"]
+
+class FakeRequest(object):
+    method = "POST"
+    path = "/" + "x" * 100
+
+def scoreboard(size):
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    return Scoreboard(size, path)
+
+def test_slots():
+    board = scoreboard(2)
+    try:
+        a = board.acquire()
+        b = board.acquire()
+        t.eq(board.acquire(), None)
+        a.boot()
+        a.begin_request(FakeRequest())
+        b.close()
+        pid, started, scores = read_scoreboard(board.path)
+        t.eq(pid, os.getpid())
+        t.eq(len(scores), 1)
+        t.eq(scores[0]["state"], APP)
+        t.eq(scores[0]["method"], "POST")
+        t.eq(len(scores[0]["path"]), 63)
+        a.end_request(10)
+        a.received(20)
+        table = render(board.path)
+        t.isnotin("POST", table)
+        t.isin("idle             1     20B     10B", table)
+    finally:
+        path = board.path
+        board.close()
+    t.eq(os.path.exists(path), False)
+
+def test_load():
+    board = scoreboard(2)
+    try:
+        single = board.acquire()
+        single.boot()
+        t.eq(single.load(), 0.0)
+        single.set_state(READING)
+        t.eq(single.load(), 1.0)
+
+        pooled = board.acquire()
+        pooled.boot(4)
+        pooled.begin_request(FakeRequest())
+        pooled.begin_request(FakeRequest())
+        t.eq(pooled.load(), 0.5)
+        pooled.end_request(0)
+        t.eq(pooled.load(), 0.25)
+        t.eq(pooled.state, APP)
+        pooled.end_request(0)
+        t.eq(pooled.load(), 0.0)
+        t.eq(pooled.state, IDLE)
+    finally:
+        board.close()
+
+def test_reports_load():
+    for worker_class in (SyncWorker, AsyncWorker, ThreadWorker, EpollWorker):
+        t.eq(worker_class.reports_load, True)
+    t.eq(Worker.reports_load, False)
+
+def test_sync_worker():
+    board = scoreboard(1)
+    try:
+        listener = socket.socket()
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(5)
+        worker = SyncWorker(0, 0, listener, None, 30, Config())
+        worker.notify = lambda: None
+        worker.wsgi = app
+        worker.score = board.acquire()
+        worker.score.boot()
+
+        client = socket.create_connection(listener.getsockname())
+        request = "GET /a HTTP/1.1\r\n\r\n"
+        client.sendall(request)
+        conn, addr = listener.accept()
+        worker.handle(conn, addr)
+        client.close()
+        listener.close()
+
+        score = read_scoreboard(board.path)[2][0]
+        t.eq(score["state"], IDLE)
+        t.eq(score["requests"], 1)
+        t.eq(score["bytes_in"], len(request))
+        t.eq(score["bytes_out"], 5)
+        t.eq(score["path"], "/a")
+    finally:
+        board.close()
+
+def test_scoreboard_file():
+    tmpdir = tempfile.mkdtemp()
+    target = os.path.join(tmpdir, "target")
+    handle = open(target, "w")
+    handle.write("keep")
+    handle.close()
+    path = os.path.join(tmpdir, "board")
+    os.symlink(target, path)
+    board = Scoreboard(2, path)
+    try:
+        # A symlink planted at the path isn't followed.
+        t.eq(os.path.islink(path), False)
+        t.eq(open(target).read(), "keep")
+        t.eq(os.stat(path).st_mode & 0777, 0600)
+        t.eq(read_scoreboard(path)[0], os.getpid())
+    finally:
+        board.close()
+        os.unlink(target)
+        os.rmdir(tmpdir)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+
+from gunicorn.autoscale import Autoscaler
+
+def test_clamp():
+    scaler = Autoscaler(2, 8)
+    t.eq(scaler.update(1, 0, 1, 0, now=100), 2)
+    t.eq(scaler.update(12, 0, 12, 0, now=100), 8)
+    t.eq(Autoscaler(0, 0).clamp(0), 1)
+
+def test_scale_up():
+    scaler = Autoscaler(1, 8)
+    # Busy for less than UP_DELAY
+    t.eq(scaler.update(4, 4, 4, 0, now=100), 4)
+    t.eq(scaler.update(4, 4, 4, 0, now=100.5), 4)
+    t.eq(scaler.update(4, 4, 4, 0, now=101), 5)
+    # Cooldown
+    t.eq(scaler.update(5, 5, 5, 0, now=103), 5)
+    t.eq(scaler.update(5, 5, 5, 0, now=106), 6)
+    # A sample below the threshold starts over.
+    t.eq(scaler.update(6, 3, 6, 0, now=120), 6)
+    t.eq(scaler.update(6, 6, 6, 0, now=121), 6)
+    t.eq(scaler.update(6, 6, 6, 0, now=122), 7)
+    t.eq(scaler.update(7, 7, 7, 0, now=130), 7)
+    t.eq(scaler.update(7, 7, 7, 0, now=131), 8)
+    t.eq(scaler.update(8, 8, 8, 0, now=140), 8)
+    t.eq(scaler.update(8, 8, 8, 0, now=150), 8)
+
+def test_scale_up_queued():
+    scaler = Autoscaler(1, 10)
+    t.eq(scaler.update(8, 2, 8, 5, now=100), 8)
+    t.eq(scaler.update(8, 2, 8, 5, now=101), 10)
+
+def test_scale_down():
+    scaler = Autoscaler(2, 8)
+    t.eq(scaler.update(4, 1, 4, 0, now=100), 4)
+    t.eq(scaler.update(4, 1, 4, 0, now=129), 4)
+    t.eq(scaler.update(4, 1, 4, None, now=130), 3)
+    # Cooldown, then one at a time
+    t.eq(scaler.update(3, 0, 3, 0, now=131), 3)
+    t.eq(scaler.update(3, 0, 3, 0, now=161), 2)
+    t.eq(scaler.update(2, 0, 2, 0, now=200), 2)
+
+def test_hysteresis():
+    scaler = Autoscaler(1, 8)
+    # Between the thresholds nothing changes.
+    for now in range(100, 200, 5):
+        t.eq(scaler.update(4, 3, 4, 0, now=now), 4)
+    # Removing a worker would overload the others.
+    scaler = Autoscaler(1, 8)
+    for now in range(100, 200, 5):
+        t.eq(scaler.update(2, 1, 2, 0, now=now), 2)
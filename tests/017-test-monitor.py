@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+
+import logging
+import os
+import socket
+import tempfile
+
+from nose.plugins.skip import SkipTest
+
+from gunicorn import monitor, sock
+from gunicorn.config import Config
+
+NETSTAT = """\
+TcpExt: SyncookiesSent ListenOverflows ListenDrops TCPTimeouts
+TcpExt: 0 %d %d 12
+IpExt: InNoRoutes InTruncatedPkts
+IpExt: 0 0
+"""
+
+class Records(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+def write_netstat(path, overflows, drops):
+    handle = open(path, "w")
+    try:
+        handle.write(NETSTAT % (overflows, drops))
+    finally:
+        handle.close()
+
+def test_read_listen_overflows():
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        write_netstat(path, 5, 7)
+        t.eq(monitor.read_listen_overflows(path), (5, 7))
+        open(path, "w").close()
+        t.eq(monitor.read_listen_overflows(path), None)
+    finally:
+        os.unlink(path)
+    t.eq(monitor.read_listen_overflows(path), None)
+
+def test_sample():
+    cfg = Config()
+    cfg.set("bind", "127.0.0.1:0")
+    listener = sock.create_socket(cfg)
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    records = Records()
+    log = logging.getLogger(monitor.__name__)
+    level = log.level
+    # Don't depend on the test runner configuring logging for the INFO
+    # record below.
+    log.setLevel(logging.INFO)
+    log.addHandler(records)
+    try:
+        write_netstat(path, 10, 10)
+        mon = monitor.ListenMonitor(50)
+        mon.NETSTAT = path
+        mon.counters = monitor.read_listen_overflows(path)
+        mon.warning = 1
+        backlog = cfg.backlog
+
+        stats = mon.sample(listener, now=100)
+        if stats["queued"] is None:
+            raise SkipTest("The listen queue isn't available")
+        t.eq(stats, {"queued": 0, "backlog": backlog, "overflows": 0,
+            "drops": 0})
+        t.eq(mon.sample(listener, now=100.5), None)
+
+        # Queue a percent of the backlog.
+        count = backlog // 100 + 1
+        clients = [socket.create_connection(listener.getsockname())
+            for i in range(count)]
+        write_netstat(path, 13, 14)
+        stats = mon.sample(listener, now=101)
+        t.eq(stats, {"queued": count, "backlog": backlog, "overflows": 3,
+            "drops": 4})
+        t.eq(mon.stats, stats)
+        t.eq([r.levelname for r in records.records], ["WARNING", "WARNING"])
+
+        # Overflows are only reported once a minute.
+        write_netstat(path, 15, 16)
+        mon.sample(listener, now=102)
+        t.eq(len(records.records), 2)
+        for client in clients:
+            listener.sock.accept()[0].close()
+            client.close()
+        t.eq(mon.sample(listener, now=103)["queued"], 0)
+        t.eq(records.records[-1].levelname, "INFO")
+        mon.sample(listener, now=161)
+        t.isin("2 connections", records.records[-1].getMessage())
+    finally:
+        log.removeHandler(records)
+        log.setLevel(level)
+        os.unlink(path)
+        listener.sock.close()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+#
+# Context switches of the sync workers per request for each accept
+# mode, with many workers mostly idle. Runs gunicorn over the
+# examples/test.py application and reads the counters of its workers
+# from /proc, so it is Linux only.
+#
+#   $ python tests/bench_accept.py [-w workers] [-n requests] [-c clients]
+
+import optparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+root = os.path.join(dirname, "..")
+
+MODES = [
+    ("shared", ["--accept-mutex", "off"]),
+    ("epoll", ["--accept-mutex", "epoll"]),
+    ("lock", ["--accept-mutex", "lock"]),
+    ("reuse-port", ["--reuse-port"]),
+]
+
+RUN = ("import sys; sys.path.insert(0, %r); "
+    "from gunicorn.app.wsgiapp import run; run()" % root)
+
+def children(ppid):
+    ret = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            stat = open("/proc/%s/stat" % name).read()
+        except IOError:
+            continue
+        if int(stat.rsplit(")", 1)[1].split()[1]) == ppid:
+            ret.append(int(name))
+    return ret
+
+def switches(pids):
+    "Sum of the voluntary and involuntary context switches of pids."
+    total = 0
+    for pid in pids:
+        try:
+            handle = open("/proc/%d/status" % pid)
+        except IOError:
+            continue
+        try:
+            for line in handle:
+                if "ctxt_switches" in line:
+                    total += int(line.split()[1])
+        finally:
+            handle.close()
+    return total
+
+def get(addr):
+    sock = socket.create_connection(addr)
+    try:
+        sock.sendall("GET / HTTP/1.0\r\n\r\n")
+        while sock.recv(8192):
+            pass
+    finally:
+        sock.close()
+
+def load(addr, requests, clients):
+    def client(count):
+        for i in range(count):
+            get(addr)
+    threads = [threading.Thread(target=client, args=(requests // clients,))
+        for i in range(clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start
+
+def bench(args, opts, port):
+    addr = ("127.0.0.1", port)
+    cmd = [sys.executable, "-c", RUN, "-w", str(opts.workers),
+        "-b", "%s:%d" % addr, "--log-level", "warning"] + args + ["test:app"]
+    proc = subprocess.Popen(cmd, cwd=os.path.join(root, "examples"))
+    try:
+        deadline = time.time() + 30
+        while len(children(proc.pid)) < opts.workers:
+            if time.time() > deadline:
+                raise RuntimeError("workers didn't boot")
+            time.sleep(0.1)
+        time.sleep(1)
+        get(addr)
+
+        workers = children(proc.pid)
+        before = switches(workers)
+        elapsed = load(addr, opts.requests, opts.clients)
+        after = switches(workers)
+        count = opts.requests // opts.clients * opts.clients
+        return float(after - before) / count, count / elapsed
+    finally:
+        os.kill(proc.pid, signal.SIGTERM)
+        proc.wait()
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("-w", "--workers", type="int", default=32,
+        help="Number of workers. [%default]")
+    parser.add_option("-n", "--requests", type="int", default=2000,
+        help="Number of requests for each mode. [%default]")
+    parser.add_option("-c", "--clients", type="int", default=2,
+        help="Number of concurrent clients. [%default]")
+    parser.add_option("-p", "--port", type="int", default=18020,
+        help="Port to bind. [%default]")
+    opts, args = parser.parse_args()
+
+    print "%-12s %16s %10s" % ("mode", "switches/req", "req/s")
+    for name, mode_args in MODES:
+        per_request, rate = bench(mode_args, opts, opts.port)
+        print "%-12s %16.1f %10.1f" % (name, per_request, rate)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+#
+# Throughput of the chunked body decoder for several chunk sizes,
+# compared with the generator based decoder it replaced.
+#
+#   $ python tests/bench_chunked.py [total_mb]
+
+import os
+import sys
+import time
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from gunicorn.http.body import Body, ChunkedReader
+from gunicorn.http.errors import NoMoreData, ChunkMissingTerminator, \
+InvalidChunkSize
+from gunicorn.http.message import Message
+from gunicorn.http.unreader import SocketUnreader
+
+CHUNK_SIZES = [1024, 64 * 1024, 1024 * 1024]
+RECV_SIZE = 8192
+READ_SIZE = 8192
+
+class LegacyChunkedReader(object):
+    "The StringIO and generator based decoder, kept for comparison."
+
+    def __init__(self, req, unreader):
+        self.req = req
+        self.parser = self.parse_chunked(unreader)
+        self.buf = StringIO()
+
+    def read(self, size):
+        if self.parser:
+            while self.buf.tell() < size:
+                try:
+                    self.buf.write(self.parser.next())
+                except StopIteration:
+                    self.parser = None
+                    break
+
+        data = self.buf.getvalue()
+        ret, rest = data[:size], data[size:]
+        self.buf.truncate(0)
+        self.buf.write(rest)
+        return ret
+
+    def parse_trailers(self, unreader, data):
+        buf = StringIO()
+        buf.write(data)
+
+        idx = buf.getvalue().find("\r\n\r\n")
+        done = buf.getvalue()[:2] == "\r\n"
+        while idx < 0 and not done:
+            self.get_data(unreader, buf)
+            idx = buf.getvalue().find("\r\n\r\n")
+            done = buf.getvalue()[:2] == "\r\n"
+        if done:
+            unreader.unread(buf.getvalue()[2:])
+            return ""
+        self.req.trailers = self.req.parse_headers(buf.getvalue()[:idx])
+        unreader.unread(buf.getvalue()[idx+4:])
+
+    def parse_chunked(self, unreader):
+        (size, rest) = self.parse_chunk_size(unreader)
+        while size > 0:
+            while size > len(rest):
+                size -= len(rest)
+                yield rest
+                rest = unreader.read()
+                if not rest:
+                    raise NoMoreData()
+            yield rest[:size]
+            rest = rest[size:]
+            while len(rest) < 2:
+                rest += unreader.read()
+            if rest[:2] != '\r\n':
+                raise ChunkMissingTerminator(rest[:2])
+            (size, rest) = self.parse_chunk_size(unreader, data=rest[2:])
+
+    def parse_chunk_size(self, unreader, data=None):
+        buf = StringIO()
+        if data is not None:
+            buf.write(data)
+
+        idx = buf.getvalue().find("\r\n")
+        while idx < 0:
+            self.get_data(unreader, buf)
+            idx = buf.getvalue().find("\r\n")
+
+        data = buf.getvalue()
+        line, rest_chunk = data[:idx], data[idx+2:]
+
+        chunk_size = line.split(";", 1)[0].strip()
+        try:
+            chunk_size = int(chunk_size, 16)
+        except ValueError:
+            raise InvalidChunkSize(chunk_size)
+
+        if chunk_size == 0:
+            try:
+                self.parse_trailers(unreader, rest_chunk)
+            except NoMoreData:
+                pass
+            return (0, None)
+        return (chunk_size, rest_chunk)
+
+    def get_data(self, unreader, buf):
+        data = unreader.read()
+        if not data:
+            raise NoMoreData()
+        buf.write(data)
+
+class FakeRequest(Message):
+    "Just enough of a Message to parse chunk headers and trailers."
+
+    def __init__(self):
+        self.trailers = []
+
+def chunked_body(chunk_size, total):
+    chunk = "%X\r\n%s\r\n" % (chunk_size, "x" * chunk_size)
+    return chunk * (total // chunk_size) + "0\r\n\r\n"
+
+class FakeSocket(object):
+    "Hands out the data the way a socket would, copying on each call."
+
+    def __init__(self, data):
+        self.data = data
+        self.view = memoryview(data)
+        self.pos = 0
+
+    def recv(self, size):
+        ret = self.data[self.pos:self.pos+size]
+        self.pos += len(ret)
+        return ret
+
+    def recv_into(self, buf, size):
+        chunk = self.view[self.pos:self.pos+size]
+        buf[:len(chunk)] = chunk
+        self.pos += len(chunk)
+        return len(chunk)
+
+def decode_read(reader_class, data):
+    reader = reader_class(FakeRequest(), SocketUnreader(FakeSocket(data), RECV_SIZE))
+    body = Body(reader)
+    size = 0
+    chunk = body.read(READ_SIZE)
+    while chunk:
+        size += len(chunk)
+        chunk = body.read(READ_SIZE)
+    return size
+
+def decode_readinto(reader_class, data):
+    reader = reader_class(FakeRequest(), SocketUnreader(FakeSocket(data), RECV_SIZE))
+    buf = bytearray(READ_SIZE)
+    size = 0
+    read = reader.readinto(buf)
+    while read:
+        size += read
+        read = reader.readinto(buf)
+    return size
+
+def run(name, func, reader_class, data, expected):
+    start = time.time()
+    size = func(reader_class, data)
+    elapsed = time.time() - start
+    assert size == expected, "%s decoded %d bytes, expected %d" % (
+        name, size, expected)
+    return elapsed
+
+def main():
+    total = 16 * 1024 * 1024
+    if len(sys.argv) > 1:
+        total = int(sys.argv[1]) * 1024 * 1024
+
+    cases = [
+        ("legacy read", decode_read, LegacyChunkedReader),
+        ("read", decode_read, ChunkedReader),
+        ("readinto", decode_readinto, ChunkedReader),
+    ]
+
+    print "%-10s %-12s %10s %10s" % ("chunk", "decoder", "seconds", "MB/s")
+    for chunk_size in CHUNK_SIZES:
+        data = chunked_body(chunk_size, total)
+        expected = (total // chunk_size) * chunk_size
+        for name, func, reader_class in cases:
+            elapsed = run(name, func, reader_class, data, expected)
+            rate = expected / elapsed / (1024 * 1024)
+            print "%-10s %-12s %10.3f %10.1f" % (chunk_size, name,
+                elapsed, rate)
+
+if __name__ == "__main__":
+    main()
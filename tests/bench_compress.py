@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+#
+# CPU time against bytes sent for the response compression levels,
+# over the examples/test.py application and a few applications
+# producing typical HTML and JSON bodies.
+#
+#   $ python tests/bench_compress.py [requests]
+
+import os
+import sys
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(dirname, ".."))
+sys.path.insert(0, os.path.join(dirname, "..", "examples"))
+
+from gunicorn.config import Config
+from gunicorn.http import wsgi
+from gunicorn.http.parser import RequestParser
+
+import test as example_test
+
+LEVELS = [0, 1, 6, 9]
+REQUEST = ("GET / HTTP/1.1\r\nHost: localhost\r\n"
+    "Accept-Encoding: gzip, deflate\r\n\r\n")
+
+def html_app(environ, start_response):
+    "A template engine yielding many small strings."
+    start_response("200 OK", [("Content-Type", "text/html; charset=utf-8")])
+    yield "<html><head><title>Items</title></head><body><ul>\n"
+    for i in range(500):
+        yield '  <li class="item">'
+        yield "Item number %d" % i
+        yield "</li>\n"
+    yield "</ul></body></html>\n"
+
+def json_app(environ, start_response):
+    body = json.dumps([{"id": i, "name": "item %d" % i, "tags": ["a", "b"],
+        "price": i * 1.5} for i in range(1000)])
+    start_response("200 OK", [("Content-Type", "application/json"),
+        ("Content-Length", str(len(body)))])
+    return [body]
+
+APPS = [
+    ("examples/test.py", example_test.app),
+    ("html", html_app),
+    ("json", json_app),
+]
+
+class NullSocket(object):
+    "Counts what is sent."
+
+    def __init__(self):
+        self.sent = 0
+
+    def sendall(self, data):
+        self.sent += len(data)
+
+def run_request(app, cfg):
+    sock = NullSocket()
+    req = RequestParser(StringIO(REQUEST)).next()
+    resp, environ = wsgi.create(req, sock, ("127.0.0.1", 0),
+        ("127.0.0.1", "8000"), cfg)
+    respiter = app(environ, resp.start_response)
+    resp.set_framing(respiter)
+    if isinstance(respiter, (list, tuple)):
+        resp.writelines(respiter, last=True)
+    else:
+        for item in respiter:
+            resp.write(item)
+    resp.close()
+    return sock.sent
+
+def bench(app, level, buffer_size, count):
+    cfg = Config()
+    cfg.set("compress_level", level)
+    cfg.set("response_buffer", buffer_size)
+    start = time.clock()
+    for i in range(count):
+        sent = run_request(app, cfg)
+    return sent, (time.clock() - start) / count
+
+def main():
+    count = 200
+    if len(sys.argv) > 1:
+        count = int(sys.argv[1])
+
+    print "%-18s %6s %7s %10s %8s %12s" % ("app", "level", "buffer",
+        "bytes", "ratio", "cpu us/req")
+    for name, app in APPS:
+        for buffer_size in (0, 16384):
+            plain = None
+            for level in LEVELS:
+                sent, cpu = bench(app, level, buffer_size, count)
+                if plain is None:
+                    plain = sent
+                print "%-18s %6d %7d %10d %8.2f %12.1f" % (name, level,
+                    buffer_size, sent, float(sent) / plain, cpu * 1e6)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -
+#
+# This file is part of gunicorn released under the MIT license.
+# See the NOTICE for more information.
+#
+# Throughput of the request parser over the tests/requests/valid
+# corpus and a few synthetic requests, fed to the parser whole, in
+# random sized pieces and one byte at a time. Every body is read to
+# its end so the body readers are measured too.
+#
+#   $ python tests/bench_parser.py [-t seconds] [-o results.json]
+#   $ python tests/bench_parser.py -c before.json
+#
+# Allocations are measured as the growth of the peak RSS of a child
+# forked to parse each case once, in KB.
+
+import gc
+import glob
+import optparse
+import os
+import random
+import resource
+import sys
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+dirname = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(dirname, ".."))
+sys.path.insert(0, dirname)
+
+import treq
+from gunicorn.http.parser import RequestParser
+
+READ_SIZE = 8192
+
+# Sending a request one byte at a time is slow enough that it is
+# only done for requests up to this size.
+MAX_BYTES_SIZE = 64 * 1024
+
+def corpus():
+    "Yield (name, data, number of requests) for the valid corpus."
+    pattern = os.path.join(dirname, "requests", "valid", "*.http")
+    for fname in sorted(glob.glob(pattern)):
+        expect = treq.load_py(os.path.splitext(fname)[0] + ".py")
+        req = treq.request(fname, expect)
+        yield os.path.basename(fname), req.data, len(req.expect)
+
+def many_headers(count=100):
+    headers = "".join(["X-Header-%d: value %d\r\n" % (i, i)
+        for i in range(count)])
+    return "GET /many/headers HTTP/1.1\r\nHost: localhost\r\n%s\r\n" % headers
+
+def large_cookie(size=8192):
+    cookie = "; ".join(["c%d=%s" % (i, "v" * 60) for i in range(size // 64)])
+    return ("GET /large/cookie HTTP/1.1\r\nHost: localhost\r\n"
+        "Cookie: %s\r\n\r\n" % cookie)
+
+def chunked_body(chunk_size=1024, total=64 * 1024):
+    chunk = "%X\r\n%s\r\n" % (chunk_size, "x" * chunk_size)
+    return ("POST /chunked HTTP/1.1\r\nHost: localhost\r\n"
+        "Transfer-Encoding: chunked\r\n\r\n%s0\r\n\r\n" % (
+        chunk * (total // chunk_size)))
+
+def upload(size=1024 * 1024):
+    return ("POST /upload HTTP/1.1\r\nHost: localhost\r\n"
+        "Content-Type: application/octet-stream\r\n"
+        "Content-Length: %d\r\n\r\n%s" % (size, "x" * size))
+
+def synthetic():
+    yield "many-headers", many_headers(), 1
+    yield "large-cookie", large_cookie(), 1
+    yield "chunked-64k", chunked_body(), 1
+    yield "upload-1m", upload(), 1
+
+# Chunking strategies, matching the senders of treq.request. The
+# pieces are computed up front so that splitting isn't timed.
+
+def split_whole(data):
+    return [data]
+
+def split_random(data, seed=0):
+    rnd = random.Random(seed)
+    maxs = max(1, len(data) // 10)
+    ret, pos = [], 0
+    while pos < len(data):
+        size = rnd.randint(1, maxs)
+        ret.append(data[pos:pos+size])
+        pos += size
+    return ret
+
+def split_bytes(data):
+    return list(data)
+
+STRATEGIES = [
+    ("whole", split_whole),
+    ("random", split_random),
+    ("bytes", split_bytes),
+]
+
+def parse(chunks):
+    "Parse every request in chunks, reading each body to its end."
+    count = 0
+    for req in RequestParser(iter(chunks)):
+        data = req.body.read(READ_SIZE)
+        while data:
+            data = req.body.read(READ_SIZE)
+        count += 1
+    return count
+
+def measure(chunks, min_time):
+    runs, elapsed = 0, 0.0
+    while elapsed < min_time:
+        start = time.time()
+        count = parse(chunks)
+        elapsed += time.time() - start
+        runs += 1
+    return count, runs, elapsed
+
+def maxrss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def rss_growth(data, split):
+    """\
+    Parse data once in a forked child and return how much the peak
+    RSS of the child grew, in KB. The peak of a child starts at the
+    RSS it was forked with. This is called before anything is parsed
+    by this process so that the child has no freed memory to reuse.
+    """
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(r)
+            chunks = split(data)
+            # Whatever the first parse sets up isn't counted.
+            parse(["GET / HTTP/1.1\r\n\r\n"])
+            before = maxrss()
+            parse(chunks)
+            os.write(w, str(maxrss() - before))
+            status = 0
+        finally:
+            os._exit(status)
+    os.close(w)
+    try:
+        data = os.read(r, 64)
+    finally:
+        os.close(r)
+        os.waitpid(pid, 0)
+    if not data:
+        return None
+    return int(data)
+
+def run_case(name, data, expected, strategy, split, min_time, growth):
+    chunks = split(data)
+    gc.collect()
+    count, runs, elapsed = measure(chunks, min_time)
+    assert count == expected, "%s parsed %d requests, expected %d" % (
+        name, count, expected)
+    return {
+        "case": name,
+        "strategy": strategy,
+        "requests": count,
+        "bytes": len(data),
+        "runs": runs,
+        "seconds": elapsed,
+        "req_per_sec": count * runs / elapsed,
+        "bytes_per_sec": len(data) * runs / elapsed,
+        "rss_growth_kb": growth,
+    }
+
+def run(opts):
+    cases = list(corpus()) + list(synthetic())
+    selected = []
+    for strategy, split in STRATEGIES:
+        if opts.strategy and strategy not in opts.strategy:
+            continue
+        for name, data, expected in cases:
+            if opts.case and not [c for c in opts.case if c in name]:
+                continue
+            if strategy == "bytes" and len(data) > MAX_BYTES_SIZE:
+                continue
+            selected.append((name, data, expected, strategy, split))
+
+    growths = [rss_growth(data, split)
+        for name, data, expected, strategy, split in selected]
+    results = []
+    for (name, data, expected, strategy, split), growth in zip(selected,
+            growths):
+        results.append(run_case(name, data, expected, strategy, split,
+            opts.time, growth))
+    return {
+        "python": sys.version.split()[0],
+        "time": time.time(),
+        "min_time": opts.time,
+        "maxrss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "results": results,
+    }
+
+def report(results, baseline=None):
+    base = {}
+    if baseline is not None:
+        for r in baseline["results"]:
+            base[(r["case"], r["strategy"])] = r
+
+    print "%-16s %-8s %12s %12s %12s %8s" % ("case", "strategy",
+        "req/s", "MB/s", "rss KB", "change")
+    for r in results["results"]:
+        peak = r["rss_growth_kb"]
+        if peak is None:
+            peak = "-"
+        change = "-"
+        old = base.get((r["case"], r["strategy"]))
+        if old is not None:
+            change = "%+.1f%%" % (
+                (r["req_per_sec"] / old["req_per_sec"] - 1) * 100)
+        print "%-16s %-8s %12.1f %12.2f %12s %8s" % (r["case"],
+            r["strategy"], r["req_per_sec"],
+            r["bytes_per_sec"] / (1024 * 1024), peak, change)
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("-t", "--time", type="float", default=0.5,
+        help="Minimum seconds spent on each case. [%default]")
+    parser.add_option("-s", "--strategy", action="append",
+        help="Only use this chunking strategy (whole, random, bytes).")
+    parser.add_option("-k", "--case", action="append",
+        help="Only run cases whose name contains this string.")
+    parser.add_option("-o", "--output",
+        help="Write the results to this file as JSON.")
+    parser.add_option("-c", "--compare",
+        help="Compare with results previously written with -o.")
+    opts, args = parser.parse_args()
+
+    baseline = None
+    if opts.compare:
+        handle = open(opts.compare)
+        try:
+            baseline = json.load(handle)
+        finally:
+            handle.close()
+
+    results = run(opts)
+    report(results, baseline)
+
+    if opts.output:
+        handle = open(opts.output, "w")
+        try:
+            json.dump(results, handle, indent=2)
+        finally:
+            handle.close()
+
+if __name__ == "__main__":
+    main()